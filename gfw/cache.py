@@ -0,0 +1,207 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports caching large values in memcache.
+
+Values are pickled and zlib-compressed. Compressed values that exceed the
+memcache value size limit are split across several chunk keys, and the
+supplied key stores a manifest with the chunk count and an MD5 checksum that
+is verified when the value is read back."""
+
+import cPickle as pickle
+import json
+import logging
+import random
+import webapp2
+import zlib
+
+from hashlib import md5
+
+from google.appengine.api import memcache
+
+# Memcache values are limited to 1 MB including key and overhead
+CHUNK_SIZE = 950 * 1024
+
+COMPRESSION_LEVEL = 6
+
+# Namespace for per-dataset compression and hit counters
+STATS_NAMESPACE = 'cache-stats'
+
+# How long a raw key counts as seen when estimating pre-canonical hits
+RAW_KEY_TTL = 6 * 60 * 60
+
+# Datasets this instance has already added to the stats index
+_indexed = []
+
+# Compare-and-set attempts to add a dataset to the stats index
+INDEX_RETRIES = 10
+
+# Fraction of cache lookups recorded in the hit counters
+LOOKUP_SAMPLE_RATE = 0.05
+
+
+def _dataset(key):
+    """Return dataset name for supplied cache key.
+
+    Keys are request ids like /forest-change/forma-alerts/admin/bra/{hash}
+    or /countries/bra/{hash}."""
+    tokens = key.strip('/').split('/')
+    if tokens[0] == 'forest-change' and len(tokens) > 2:
+        return tokens[1]
+    return tokens[0]
+
+
+def _chunk_keys(key, manifest):
+    return ['%s/%s/%d' % (key, manifest['checksum'], i)
+            for i in range(manifest['chunks'])]
+
+
+def _index(dataset):
+    """Add dataset to the stats index, returns True once it is in it.
+
+    Instances indexing different datasets at the same time update the index
+    with compare-and-set, so none of the datasets is lost."""
+    client = memcache.Client()
+    for i in range(INDEX_RETRIES):
+        datasets = client.gets('datasets', namespace=STATS_NAMESPACE)
+        if datasets is None:
+            if client.add('datasets', [dataset], namespace=STATS_NAMESPACE):
+                return True
+        elif dataset in datasets:
+            return True
+        elif client.cas('datasets', datasets + [dataset],
+                        namespace=STATS_NAMESPACE):
+            return True
+    return False
+
+
+def _count(dataset, counters):
+    """Increment supplied counters for dataset."""
+    try:
+        memcache.offset_multi(
+            dict(('%s/%s' % (dataset, name), value)
+                 for name, value in counters.iteritems()),
+            namespace=STATS_NAMESPACE, initial_value=0)
+        if dataset not in _indexed and _index(dataset):
+            _indexed.append(dataset)
+    except Exception as e:
+        logging.exception(e)
+
+
+def _ratio(numerator, denominator):
+    return round(float(numerator) / denominator, 2) if denominator else None
+
+
+def sample_lookup():
+    """Return True if a lookup is to be recorded with record_lookup.
+
+    Only a LOOKUP_SAMPLE_RATE sample of lookups is recorded, so most cache
+    hits make no stats RPC. The hit rates of the sample are unbiased."""
+    return random.random() < LOOKUP_SAMPLE_RATE
+
+
+def record_lookup(key, hit, raw_key):
+    """Update hit counters for a lookup of key.
+
+    The raw_key is the key the same request had before canonicalisation. It
+    counts as a hit if it was already seen within RAW_KEY_TTL, which gives
+    an estimate of the hit rate without canonical keys."""
+    try:
+        raw_hit = not memcache.add(
+            raw_key, True, time=RAW_KEY_TTL, namespace=STATS_NAMESPACE)
+    except Exception as e:
+        logging.exception(e)
+        raw_hit = False
+    _count(_dataset(key),
+           dict(lookups=1, hits=int(hit), raw_hits=int(raw_hit)))
+
+
+def get_stats():
+    """Return dictionary of compression and hit stats by dataset.
+
+    Lookups are counted for the sample of lookups, see sample_lookup()."""
+    stats = {}
+    names = ['values', 'raw', 'packed', 'lookups', 'hits', 'raw_hits']
+    datasets = memcache.get('datasets', namespace=STATS_NAMESPACE) or []
+    for dataset in datasets:
+        keys = ['%s/%s' % (dataset, x) for x in names]
+        counts = memcache.get_multi(keys, namespace=STATS_NAMESPACE)
+        values, raw, packed, lookups, hits, raw_hits = \
+            [int(counts.get(x) or 0) for x in keys]
+        stats[dataset] = dict(
+            values=values, raw_bytes=raw, packed_bytes=packed,
+            compression_ratio=_ratio(raw, packed),
+            lookups=lookups, hit_rate=_ratio(hits, lookups),
+            raw_hit_rate=_ratio(raw_hits, lookups))
+    return stats
+
+
+def set(key, value, time=0):
+    """Compress and store value under key, chunking it if needed."""
+    raw = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    packed = zlib.compress(raw, COMPRESSION_LEVEL)
+    manifest = dict(
+        checksum=md5(packed).hexdigest(),
+        chunks=(len(packed) + CHUNK_SIZE - 1) / CHUNK_SIZE or 1)
+    if manifest['chunks'] == 1:
+        manifest['data'] = packed
+    else:
+        chunks = dict(
+            (chunk_key, packed[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE])
+            for i, chunk_key in enumerate(_chunk_keys(key, manifest)))
+        if memcache.set_multi(chunks, time=time):
+            logging.warning('Unable to cache all chunks of %s' % key)
+            return False
+    _count(_dataset(key), dict(values=1, raw=len(raw), packed=len(packed)))
+    return memcache.set(key, manifest, time=time)
+
+
+def get(key):
+    """Return value stored under key or None if missing or corrupt."""
+    manifest = memcache.get(key)
+    if not isinstance(manifest, dict) or 'checksum' not in manifest:
+        return None
+    if 'data' in manifest:
+        packed = manifest['data']
+    else:
+        chunk_keys = _chunk_keys(key, manifest)
+        chunks = memcache.get_multi(chunk_keys)
+        if len(chunks) != len(chunk_keys):
+            return None
+        packed = ''.join(chunks[x] for x in chunk_keys)
+    if md5(packed).hexdigest() != manifest['checksum']:
+        logging.warning('Checksum mismatch for cached value %s' % key)
+        return None
+    return pickle.loads(zlib.decompress(packed))
+
+
+def delete(key):
+    """Delete value stored under key. Orphaned chunks expire from memcache."""
+    return memcache.delete(key)
+
+
+class StatsHandler(webapp2.RequestHandler):
+    """Handler that reports cache stats by dataset."""
+
+    def get(self):
+        self.response.headers["Content-Type"] = "application/json"
+        self.response.out.write(json.dumps(get_stats(), sort_keys=True))
+
+
+handlers = webapp2.WSGIApplication([
+    (r'/cache/stats', StatsHandler)],
+    debug=True)
@@ -22,6 +22,7 @@ import urllib
 import logging
 
 from appengine_config import runtime_config
+from google.appengine.api import apiproxy_stub_map
 from google.appengine.api import urlfetch
 
 # CartoDB endpoint:
@@ -75,14 +76,41 @@ def get_body(query, params, auth=False):
     return body
 
 
-def execute(query, params={}, auth=False):
-    """Exectues supplied query on CartoDB and returns response body as JSON."""
-    #import logging
-    #logging.info(query)
+def _fetch(query, params, auth=False):
+    """Start an asynchronous CartoDB query and return the urlfetch RPC."""
     rpc = urlfetch.create_rpc(deadline=50)
     payload = get_body(query, params, auth=auth)
     if runtime_config.get('IS_DEV'):
         logging.info(query)
         logging.info(payload)
     urlfetch.make_fetch_call(rpc, ENDPOINT, method='POST', payload=payload)
-    return rpc.get_result()
+    return rpc
+
+
+def execute(query, params={}, auth=False):
+    """Exectues supplied query on CartoDB and returns response body as JSON."""
+    return _fetch(query, params, auth=auth).get_result()
+
+
+def execute_many(queries, auth=False):
+    """Executes supplied queries on CartoDB in parallel.
+
+    Each query is either a SQL string or a (sql, params) tuple. All queries
+    are issued as concurrent urlfetch RPCs and collected as they finish, so
+    the total latency is that of the slowest query. Returns the responses in
+    the same order as the supplied queries."""
+    rpcs = []
+    for query in queries:
+        if isinstance(query, basestring):
+            query, params = query, {}
+        else:
+            query, params = query
+        rpcs.append(_fetch(query, copy.copy(params), auth=auth))
+
+    results = [None] * len(rpcs)
+    pending = list(rpcs)
+    while pending:
+        rpc = apiproxy_stub_map.UserRPC.wait_any(pending)
+        pending.remove(rpc)
+        results[rpcs.index(rpc)] = rpc.get_result()
+    return results
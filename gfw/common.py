@@ -20,12 +20,15 @@
 import json
 import re
 import logging
+import time
 import webapp2
 
 from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 
 from hashlib import md5
 from appengine_config import runtime_config
+from gfw import cache
 
 
 class CORSRequestHandler(webapp2.RequestHandler):
@@ -58,21 +61,165 @@ class CORSRequestHandler(webapp2.RequestHandler):
         self.response.set_status(status, message=str(data))
         self.response.out.write(str(data))
 
+    def write_response(self, status, headers, body):
+        """Sends a response rendered by render().
+
+        Responds with 304 Not Modified and no body if the ETag matches the
+        If-None-Match request header."""
+        self.response.headers.add_header("Access-Control-Allow-Origin", "*")
+        self.response.headers.add_header(
+            'Access-Control-Allow-Headers',
+            'Origin, X-Requested-With, Content-Type, Accept')
+        self.response.headers.add_header('charset', 'utf-8')
+        self.response.headers["Content-Type"] = "application/json"
+        for name, value in headers.iteritems():
+            self.response.headers[name] = value
+        etag = headers.get('ETag')
+        if status == 200 and etag and etag_matches(self.request, etag):
+            self.response.set_status(304)
+            return
+        if status == 400:
+            self.response.set_status(status, message=body)
+        else:
+            self.response.set_status(status)
+        self.response.out.write(body)
+
     @classmethod
-    def get_or_execute(cls, args, target, rid):
-        if 'bust' in args:
-            memcache.delete(rid)
-            result = target.execute(args)
+    def render(cls, action, data):
+        """Return (status, headers, body) for supplied action and data."""
+        if action == 'respond':
+            body = json.dumps(data, sort_keys=True)
+            headers = {
+                'ETag': get_etag(body),
+                'Cache-Control': get_cache_control(data)}
+            return 200, headers, body
+        elif action == 'redirect':
+            return 302, {'Location': str(data)}, ''
+        elif action == 'error':
+            return 400, {}, str(data.get('message') or data)
+        else:
+            return 400, {}, 'Unknown action %s' % action
+
+    def get_or_execute(self, args, target, rid, meta=None, ttl=None,
+                       path=None, raw=None):
+        """Return rendered (status, headers, body) for args.
+
+        The fully serialised response is cached, so a hit only writes the
+        stored bytes. Cached entries carry a soft expiry. A stale entry is
+        still served right away while a refresh of the same request is
+        enqueued on the cache-refresh queue. A bust request always executes
+        synchronously. A dev request bypasses the cache so that its debug
+        output never ends up in a shared entry. Neither is cacheable by
+        browsers or proxies, see uncacheable(). The soft expiry defaults to
+        SOFT_TTL seconds. The path and raw args of the request that refreshes
+        the entry default to those of the current request."""
+        if 'bust' in args or 'dev' in args:
+            result = self._execute(args, target, meta)
+            if 'dev' not in args:
+                self._cache(rid, result, ttl)
+            result = self.uncacheable(result, args)
         else:
-            result = memcache.get(rid)
-            if not result:
-                result = target.execute(args)
-                try:
-                    memcache.set(key=rid, value=result)
-                except Exception as e:
-                    logging.exception(e)
-        action, data = result
-        return action, data
+            entry = cache.get(rid)
+            if cache.sample_lookup():
+                cache.record_lookup(
+                    rid, bool(entry), self._hash_id(args, path))
+            if entry:
+                result = entry['result']
+                if time.time() > entry['expires']:
+                    self._refresh(rid, path, raw)
+            else:
+                result = self._execute_once(args, target, rid, meta, ttl)
+        return result
+
+    @classmethod
+    def uncacheable(cls, result, args):
+        """Return rendered result with a Cache-Control header that keeps dev
+        and bust responses out of shared caches.
+
+        Dev responses contain debug output, so they are never stored. Bust
+        requests are explicit recomputes, so caches must revalidate them."""
+        status, headers, body = result
+        if 'dev' in args:
+            headers = dict(headers, **{'Cache-Control': 'private, no-store'})
+        elif 'bust' in args:
+            headers = dict(headers, **{'Cache-Control': 'no-cache'})
+        return status, headers, body
+
+    @classmethod
+    def _execute(cls, args, target, meta=None):
+        """Execute target and render the response with optional meta."""
+        action, data = target.execute(args)
+        if meta and action != 'redirect':
+            data.update(meta)
+        return cls.render(action, data)
+
+    @classmethod
+    def _cache(cls, rid, result, ttl=None):
+        """Store result in the cache under rid with a soft expiry.
+
+        Only results with a CACHED_STATUSES status are stored, so errors
+        like a transient CartoDB failure are executed again."""
+        if result[0] not in CACHED_STATUSES:
+            return
+        entry = dict(result=result, expires=time.time() + (ttl or SOFT_TTL))
+        try:
+            cache.set(rid, entry)
+        except Exception as e:
+            logging.exception(e)
+
+    def _refresh(self, rid, path=None, raw=None):
+        """Enqueue a bust of the request to revalidate its entry.
+
+        The raw args are stored in the cache and the POST task only carries
+        their key, so large geometries and JSON bodies fit in the task."""
+        if not memcache.add('%s/refresh' % rid, True, time=LEASE_TIMEOUT):
+            return
+        params = dict(self.args() if raw is None else raw)
+        params['bust'] = 1
+        try:
+            cache.set('%s/refresh-args' % rid, params, time=REFRESH_ARGS_TTL)
+            taskqueue.add(url=path or self.request.path,
+                          payload=json.dumps({REFRESH_ARG: rid}),
+                          headers={'Content-Type': 'application/json'},
+                          method='POST', queue_name='cache-refresh')
+        except Exception as e:
+            logging.exception(e)
+
+    @classmethod
+    def _execute_once(cls, args, target, rid, meta=None, ttl=None):
+        """Execute target on a cache miss at most once across requests.
+
+        The first caller takes a short memcache lease on rid, runs the query
+        and publishes the result. Concurrent callers poll for that result
+        instead of running the same query, and only execute it themselves if
+        the leaseholder fails or takes longer than LEASE_WAIT seconds."""
+        lease = '%s/lease' % rid
+        leased = memcache.add(lease, True, time=LEASE_TIMEOUT)
+        if not leased:
+            result = cls._wait_for(rid, lease)
+            if result:
+                return result
+            # The leaseholder failed or is too slow, so execute it ourselves
+        try:
+            result = cls._execute(args, target, meta)
+            cls._cache(rid, result, ttl)
+        finally:
+            if leased:
+                memcache.delete(lease)
+        return result
+
+    @classmethod
+    def _wait_for(cls, rid, lease):
+        """Poll memcache for the result of the leaseholder of rid."""
+        deadline = time.time() + LEASE_WAIT
+        while time.time() < deadline:
+            time.sleep(LEASE_POLL_INTERVAL)
+            entry = cache.get(rid)
+            if entry:
+                return entry['result']
+            if not memcache.get(lease):
+                return None
+        return None
 
     def args(self, only=[]):
         raw = {}
@@ -84,6 +231,11 @@ class CORSRequestHandler(webapp2.RequestHandler):
             vals = map(self.request.get, args)
             raw = dict(zip(args, vals))
 
+        # Refresh tasks carry the key of the args stored by _refresh()
+        if isinstance(raw, dict) and REFRESH_ARG in raw and \
+                self.request.headers.get('X-AppEngine-QueueName'):
+            raw = cache.get('%s/refresh-args' % raw[REFRESH_ARG]) or {}
+
         result = {}
         for key, val in raw.iteritems():
             if only and key in only:
@@ -94,19 +246,28 @@ class CORSRequestHandler(webapp2.RequestHandler):
         return result
 
     def complete(self, action, data):
-        if action == 'respond':
-            self.write(json.dumps(data, sort_keys=True))
-        elif action == 'redirect':
-            self.redirect(data)
-        elif action == 'error':
-            self.write_error(400, data.get('message') or data )
-        else:
-            self.write_error(400, 'Unknown action %s' % action)
+        self.write_response(*self.render(action, data))
+
+    def get_id(self, params, path=None):
+        """Return cache key for params ignoring non-semantic flags.
 
-    def get_id(self, params):
+        Integer strings are keyed as integers, so thresh=30 and thresh="30"
+        share a key. The path defaults to the current request path."""
+        params = dict(
+            (k, _canonical_value(v)) for k, v in params.iteritems()
+            if k not in NON_SEMANTIC_ARGS)
+        return self._hash_id(params, path)
+
+    def _hash_id(self, params, path=None):
+        """Return request path joined with a hash of the raw params.
+
+        Values that are not JSON serialisable, like geometries, are hashed
+        by their string form."""
         whitespace = re.compile(r'\s+')
-        params = re.sub(whitespace, '', json.dumps(params, sort_keys=True))
-        return '/'.join([self.request.path.lower(), md5(params).hexdigest()])
+        params = re.sub(whitespace, '', json.dumps(
+            params, sort_keys=True, default=str))
+        path = path or self.request.path
+        return '/'.join([path.lower(), md5(params).hexdigest()])
 
 #
 # SHARED CONSTANTS/TEMPLATES
@@ -124,10 +285,79 @@ CONTENT_TYPES = {
 }
 GCS_URL_TMPL = 'http://storage.googleapis.com/gfw-apis-analysis%s.%s'
 
+# Single-flight leases on cache misses (seconds)
+LEASE_TIMEOUT = 60
+LEASE_WAIT = 25
+LEASE_POLL_INTERVAL = 0.25
+
+# Cached results older than this are served stale and refreshed (seconds)
+SOFT_TTL = 6 * 60 * 60
+
+# Refresh task arg holding the cache key of the request to refresh, and how
+# long its stored args wait for the task (seconds)
+REFRESH_ARG = 'refresh'
+REFRESH_ARGS_TTL = 60 * 60
+
+# Statuses of rendered results that are cached
+CACHED_STATUSES = [200, 302]
+
+# Maps META update cadence pattern to (max-age, stale-while-revalidate) of
+# public Cache-Control headers (seconds)
+HOUR = 60 * 60
+DAY = 24 * HOUR
+CACHE_POLICIES = [
+    (r'daily', (HOUR, 6 * HOUR)),
+    (r'16 day', (DAY, 4 * DAY)),
+    (r'month', (2 * DAY, 7 * DAY)),
+    (r'quarter', (7 * DAY, 21 * DAY)),
+    (r'annual', (30 * DAY, 90 * DAY))
+]
+DEFAULT_CACHE_POLICY = (HOUR, DAY)
+
+# Request args that are ignored in cache keys
+NON_SEMANTIC_ARGS = ['bust', 'dev', 'filename']
+
 
 #
 # Helper Methods
 #
+def _canonical_value(value):
+    """Return integer for integer strings, otherwise value."""
+    if isinstance(value, basestring) and re.match(r'^-?\d+$', value):
+        return int(value)
+    return value
+
+
+def get_cache_control(data):
+    """Return Cache-Control header value for a response document.
+
+    The policy follows the update cadence in the meta of the document (see
+    CACHE_POLICIES) and falls back to DEFAULT_CACHE_POLICY."""
+    updates = ''
+    if isinstance(data, dict) and isinstance(data.get('meta'), dict):
+        updates = data['meta'].get('updates') or ''
+    max_age, stale = DEFAULT_CACHE_POLICY
+    for pattern, policy in CACHE_POLICIES:
+        if re.search(pattern, updates, re.IGNORECASE):
+            max_age, stale = policy
+            break
+    return 'public, max-age=%d, stale-while-revalidate=%d' % (max_age, stale)
+
+
+def get_etag(body):
+    """Return strong ETag for supplied response body."""
+    return '"%s"' % md5(body).hexdigest()
+
+
+def etag_matches(request, etag):
+    """Return True if the If-None-Match header of request matches etag."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [re.sub(r'^W/', '', x.strip()) for x in header.split(',')]
+    return '*' in tags or etag in tags
+
+
 def get_params_hash(params):
     return md5(json.dumps(params, sort_keys=True)).hexdigest()
 
@@ -0,0 +1,103 @@
+# -- launch shell
+# remote_api_shell.py -s dev.gfw-apis.appspot.com
+#
+# ex:
+#
+# import gfw.console.snapshot as s
+# for dataset in ['forma-alerts', 'terrai-alerts', 'quicc-alerts',
+#                 'nasa-active-fires']:
+#     s.export(dataset, root='snapshots')
+# rpt = s.benchmark('forma-alerts', root='snapshots')
+# print s.benchmark_summary(rpt)
+#
+
+import json
+import time
+
+from gfw.forestchange import snapshot
+from gfw.forestchange import versions
+from gfw.forestchange import warm
+from gfw.forestchange.common import CartoDbExecutor
+from gfw.forestchange.snapshot import LocalExecutor
+
+
+#
+# EXPORT
+#
+
+def export(dataset, root=None):
+    """Export a snapshot of dataset at its current data version.
+
+    Datasets with a new data version found by the version refreshes are
+    warmed, like the hourly refresh cron does."""
+    warm.enqueue(versions.refresh())
+    version = versions.get(dataset)
+    snap = snapshot.export(dataset, versions.SQLS[dataset], version, root)
+    changed = versions.refresh()
+    warm.enqueue(changed)
+    if dataset in changed:
+        raise ValueError('%s changed during export, export again' % dataset)
+    return snap
+
+
+#
+# BENCHMARK
+#
+
+REQUESTS = [
+    dict(iso='BRA'),
+    dict(iso='IDN', begin='2012-01-01', end='2015-01-01'),
+    dict(iso='BRA', id1='12'),
+    dict(iso='IDN', bucket='month'),
+    dict(iso='MYS', compare=[
+        dict(begin='2013-01-01', end='2013-12-31'),
+        dict(begin='2014-01-01', end='2014-12-31')]),
+    dict(geojson=json.dumps({'type': 'Polygon', 'coordinates': [
+        [[-62, -10], [-55, -10], [-55, -4], [-62, -4], [-62, -10]]]}))
+]
+
+
+def _time(fn, repeat):
+    """Return (best seconds, result) of repeat calls of fn."""
+    best, result = None, None
+    for i in range(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _value(action, data):
+    if action != 'respond':
+        return action
+    return data.get('comparison') or data.get('histogram') or data.get('rows')
+
+
+def benchmark(dataset, requests=REQUESTS, repeat=3, root=None):
+    """Return timings of requests on the snapshot of dataset and on CartoDB.
+
+    Each request gets the best of repeat runs of both paths and whether
+    both returned the same counts."""
+    sql = versions.SQLS[dataset]
+    snap = snapshot.Snapshot.load(dataset, versions.get(dataset), root)
+    rpt = []
+    for args in requests:
+        local, local_result = _time(
+            lambda: LocalExecutor.execute(dict(args), sql, snap), repeat)
+        cdb, cdb_result = _time(
+            lambda: CartoDbExecutor.execute(dict(args), sql), repeat)
+        rpt.append(dict(
+            args=args, local=local, cartodb=cdb,
+            speedup=cdb / local if local else None,
+            match=_value(*local_result) == _value(*cdb_result)))
+    return rpt
+
+
+def benchmark_summary(rpt):
+    lines = ['local(ms)  cartodb(ms)  speedup  match  args']
+    for x in rpt:
+        lines.append('%9.1f  %11.1f  %7.1f  %5s  %s' % (
+            x['local'] * 1000, x['cartodb'] * 1000, x['speedup'] or 0,
+            x['match'], x['args']))
+    return '\n'.join(lines)
@@ -62,12 +62,12 @@ class Handler(CORSRequestHandler):
 
             # Return API meta
             if path == 'countries':
-                action, data = self._action_data()
+                response = self._response()
             else:   
                 path_args = args.process_path(path, rtype)
-                action, data = self._action_data(path_args)
+                response = self._response(path_args)
 
-            self.complete(action, data)
+            self.write_response(*response)
 
         except Exception, e:
             logging.exception(e)
@@ -75,7 +75,7 @@ class Handler(CORSRequestHandler):
             self.write(json.dumps(META, sort_keys=True))
 
 
-    def _action_data(self,path_args={'index': True}):
+    def _response(self,path_args={'index': True}):
         query_args = args.process(self.args(only=['dev', 'bust', 'thresh']))
         params = dict(query_args, **path_args)
         rid = self.get_id(params)
@@ -128,59 +128,58 @@ def _index(args):
     rows = _handler(cdb.execute(query))
     return dict(countries=rows)
 
-def _show(args):
-    query = CountrySql.SHOW.format(**args)
-    rows = _handler(cdb.execute(query))
+def _show(rows):
     return rows[0]
 
-def _getTopoJson(args):
-    query = CountrySql.TOPO_JSON.format(**args)
 
-    rows = _handler(
-        cdb.execute(query, params=dict(format='topojson')))
+def _getTopoJson(rows):
     return dict(topojson=rows)
 
+
 def _processSubnatRow(x):
     x['bounds'] = json.loads(x['bounds'])
     return x
 
 
-def _getSubnatBounds(args):
-    query = CountrySql.SUBNAT_BOUNDS.format(**args)
-
-    rows = _handler(cdb.execute(query))
+def _getSubnatBounds(rows):
     results = map(_processSubnatRow, rows)
     return dict(subnat_bounds=results)
 
 
-def _getForma(args):
-    query = CountrySql.FORMA.format(**args)
-
-    return dict(forma=_handler(cdb.execute(query)))
-
-
-def _getForests(args):
-    query = CountrySql.FORESTS.format(**args)
+def _getForma(rows):
+    return dict(forma=rows)
 
-    return dict(forests=_handler(cdb.execute(query)))
 
+def _getForests(rows):
+    return dict(forests=rows)
 
-def _getTenure(args):
-    query = CountrySql.TENURE.format(**args)
 
-    return dict(tenure=_handler(cdb.execute(query)))
+def _getTenure(rows):
+    return dict(tenure=rows)
 
 
-def _getBounds(args):
-    query = CountrySql.BOUNDS.format(**args)
+def _getBounds(rows):
+    return dict(bounds=json.loads(rows[0]['bounds']))
 
-    return dict(bounds=json.loads(_handler(cdb.execute(query))[0]['bounds']))
 
+def _getUmd(rows):
+    return dict(umd=rows)
 
-def _getUmd(args):
-    action, data = umd.execute(args)
 
-    return dict(umd=data['years'])
+def _details(args):
+    """Return list of ((query, params), handler) for a country detail."""
+    if not 'thresh' in args:
+        args['thresh'] = umd.DEFAULT_THRESH
+    return [
+        ((CountrySql.SHOW.format(**args), {}), _show),
+        ((CountrySql.TOPO_JSON.format(**args), dict(format='topojson')),
+            _getTopoJson),
+        ((CountrySql.SUBNAT_BOUNDS.format(**args), {}), _getSubnatBounds),
+        ((CountrySql.FORMA.format(**args), {}), _getForma),
+        ((CountrySql.FORESTS.format(**args), {}), _getForests),
+        ((CountrySql.TENURE.format(**args), {}), _getTenure),
+        ((CountrySql.BOUNDS.format(**args), {}), _getBounds),
+        ((umd.UmdSql.process(args)[0], {}), _getUmd)]
 
 
 def execute(args):
@@ -190,13 +189,9 @@ def execute(args):
         result.update(_index(args))
 
     else:
-        result.update(_show(args))
-        result.update(_getTopoJson(args))
-        result.update(_getSubnatBounds(args))
-        result.update(_getForma(args))
-        result.update(_getForests(args))
-        result.update(_getTenure(args))
-        result.update(_getBounds(args))
-        result.update(_getUmd(args))
+        queries, handlers = zip(*_details(args))
+        responses = cdb.execute_many(queries)
+        for handler, response in zip(handlers, responses):
+            result.update(handler(_handler(response)))
 
     return 'respond', result
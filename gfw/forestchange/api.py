@@ -17,10 +17,14 @@
 
 """This module is the entry point for the forest change API."""
 
+import json
 import logging
 import re
+import threading
 import webapp2
 
+from google.appengine.api import memcache
+
 from gfw.forestchange import forma
 from gfw.forestchange import fires
 from gfw.forestchange import umd
@@ -28,8 +32,17 @@ from gfw.forestchange import quicc
 from gfw.forestchange import imazon
 from gfw.forestchange import terrai
 from gfw.forestchange import args
+from gfw.forestchange import geometry
+from gfw.forestchange import geostore
+from gfw.forestchange import snapshot
+from gfw.forestchange import versions
+from gfw.forestchange.common import DEFAULT_BEGIN
+from gfw.forestchange.common import DEFAULT_END
+from gfw.forestchange.common import get_aoi_response
 from gfw.common import CORSRequestHandler
 from gfw.common import APP_BASE_URL
+from gfw.common import SOFT_TTL
+from gfw.common import get_etag
 
 FORMA_API = '%s/forma-alerts' % APP_BASE_URL
 UMD_API = '%s/umd-loss-gain' % APP_BASE_URL
@@ -38,6 +51,15 @@ QUICC_API = '%s/quicc-alerts' % APP_BASE_URL
 IMAZON_API = '%s/imazon-alerts' % APP_BASE_URL
 TERRAI_API = '%s/terrai-alerts' % APP_BASE_URL
 
+# JSON body params of aois requests
+AOIS_BODY = ['aois', 'period', 'bust', 'dev']
+
+
+def _post_api(url, body):
+    """Return META api entry of an endpoint that takes a POST JSON body."""
+    return dict(method='POST', url=url, body=body)
+
+
 META = {
     'forma-alerts': {
         'meta': {
@@ -52,14 +74,18 @@ META = {
             "id": "forma-alerts"
         },
         'apis': {
-            'world': '%s{?period,geojson,download,bust,dev}' % FORMA_API,
-            'national': '%s/admin{/iso}{?period,download,bust,dev}' %
-            FORMA_API,
-            'subnational': '%s/admin{/iso}{/id1}{?period,download,bust,dev}' %
+            'world': '%s{?period,compare,bucket,geojson,geostore,download,'
+                'bust,dev}' % FORMA_API,
+            'countries': '%s/admin{?group_by,period,limit,bust,dev}' %
             FORMA_API,
-            'use': '%s/use/{/name}{/id}{?period,download,bust,dev}' %
-            FORMA_API,
-            'wdpa': '%s/wdpa/{/id}{?period,download,bust,dev}' %
+            'aois': _post_api('%s/aois' % FORMA_API, AOIS_BODY),
+            'national': '%s/admin{/iso}{?period,compare,bucket,breakdown,'
+                'download,bust,dev}' % FORMA_API,
+            'subnational': '%s/admin{/iso}{/id1}{?period,compare,bucket,'
+                'download,bust,dev}' % FORMA_API,
+            'use': '%s/use/{/name}{/id}{?period,compare,bucket,download,bust,'
+                'dev}' % FORMA_API,
+            'wdpa': '%s/wdpa/{/id}{?period,compare,bucket,download,bust,dev}' %
             FORMA_API
         }
     },
@@ -76,14 +102,18 @@ META = {
             "id": "nasa-active-fires"
         },
         'apis': {
-            'world': '%s{?period,geojson,download,bust,dev}' % FIRES_API,
-            'national': '%s/admin{/iso}{?period,download,bust,dev}' %
+            'world': '%s{?period,bucket,geojson,geostore,download,bust,'
+                'dev}' % FIRES_API,
+            'countries': '%s/admin{?group_by,period,limit,bust,dev}' %
             FIRES_API,
-            'subnational': '%s/admin{/iso}{/id1}{?period,download,bust,dev}' %
+            'aois': _post_api('%s/aois' % FIRES_API, AOIS_BODY),
+            'national': '%s/admin{/iso}{?period,bucket,breakdown,download,'
+                'bust,dev}' % FIRES_API,
+            'subnational': '%s/admin{/iso}{/id1}{?period,bucket,download,bust,'
+                'dev}' % FIRES_API,
+            'use': '%s/use/{/name}{/id}{?period,bucket,download,bust,dev}' %
             FIRES_API,
-            'use': '%s/use/{/name}{/id}{?period,download,bust,dev}' %
-            FIRES_API,
-            'wdpa': '%s/wdpa/{/id}{?period,download,bust,dev}' %
+            'wdpa': '%s/wdpa/{/id}{?period,bucket,download,bust,dev}' %
             FIRES_API
         }
     },
@@ -102,14 +132,18 @@ META = {
             "id": "quicc-alerts"
         },
         'apis': {
-            'global': '%s{?period,geojson,download,bust,dev}' % QUICC_API,
-            'national': '%s/admin{/iso}{?period,download,bust,dev}' %
+            'global': '%s{?period,compare,bucket,geojson,geostore,download,'
+                'bust,dev}' % QUICC_API,
+            'countries': '%s/admin{?group_by,period,limit,bust,dev}' %
             QUICC_API,
-            'subnational': '%s/admin{/iso}{/id1}{?period,download,bust,dev}' %
-            QUICC_API,
-            'use': '%s/use/{/name}{/id}{?period,download,bust,dev}' %
-            QUICC_API,
-            'wdpa': '%s/wdpa/{/id}{?period,download,bust,dev}' %
+            'aois': _post_api('%s/aois' % QUICC_API, AOIS_BODY),
+            'national': '%s/admin{/iso}{?period,compare,bucket,breakdown,'
+                'download,bust,dev}' % QUICC_API,
+            'subnational': '%s/admin{/iso}{/id1}{?period,compare,bucket,'
+                'download,bust,dev}' % QUICC_API,
+            'use': '%s/use/{/name}{/id}{?period,compare,bucket,download,bust,'
+                'dev}' % QUICC_API,
+            'wdpa': '%s/wdpa/{/id}{?period,compare,bucket,download,bust,dev}' %
             QUICC_API
         }
     },
@@ -127,8 +161,9 @@ META = {
             "id": "imazon-alerts"
         },
         'apis': {
-            'global': '%s{?period,geojson,download,bust,dev}' % IMAZON_API,
-            'national': '%s/admin{/iso}{?period,download,bust,dev}' %
+            'global': '%s{?period,geojson,geostore,download,bust,'
+                'dev}' % IMAZON_API,
+            'national': '%s/admin{/iso}{?period,breakdown,download,bust,dev}' %
             IMAZON_API,
             'subnational': '%s/admin{/iso}{/id1}{?period,download,bust,dev}' %
             IMAZON_API,
@@ -176,14 +211,18 @@ META = {
             "id": "terrai-alerts"
         },
         'apis': {
-            'world': '%s{?period,geojson,download,bust,dev}' % TERRAI_API,
-            'national': '%s/admin{/iso}{?period,download,bust,dev}' %
-            TERRAI_API,
-            'subnational': '%s/admin{/iso}{/id1}{?period,download,bust,dev}' %
+            'world': '%s{?period,compare,bucket,geojson,geostore,download,'
+                'bust,dev}' % TERRAI_API,
+            'countries': '%s/admin{?group_by,period,limit,bust,dev}' %
             TERRAI_API,
-            'use': '%s/use/{/name}{/id}{?period,download,bust,dev}' %
-            TERRAI_API,
-            'wdpa': '%s/wdpa/{/id}{?period,download,bust,dev}' %
+            'aois': _post_api('%s/aois' % TERRAI_API, AOIS_BODY),
+            'national': '%s/admin{/iso}{?period,compare,bucket,breakdown,'
+                'download,bust,dev}' % TERRAI_API,
+            'subnational': '%s/admin{/iso}{/id1}{?period,compare,bucket,'
+                'download,bust,dev}' % TERRAI_API,
+            'use': '%s/use/{/name}{/id}{?period,compare,bucket,download,bust,'
+                'dev}' % TERRAI_API,
+            'wdpa': '%s/wdpa/{/id}{?period,compare,bucket,download,bust,dev}' %
             TERRAI_API
         }
     },
@@ -192,39 +231,50 @@ META = {
 # Maps dataset to accepted query params
 PARAMS = {
     'forma-alerts': {
-        'all': ['period', 'download', 'geojson', 'dev', 'bust'],
-        'iso': ['period', 'download', 'dev', 'bust'],
-        'id1': ['period', 'download', 'dev', 'bust'],
-        'wdpa': ['period', 'download', 'dev', 'bust'],
-        'use': ['period', 'download', 'dev', 'bust'],
+        'all': ['period', 'compare', 'bucket', 'download', 'geojson',
+                'geostore', 'dev', 'bust'],
+        'iso': ['period', 'compare', 'bucket', 'breakdown', 'download', 'dev',
+                'bust'],
+        'id1': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'wdpa': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'use': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'countries': ['group_by', 'period', 'limit', 'dev', 'bust'],
+        'aois': ['aois', 'period', 'dev', 'bust'],
         'latest': ['bust','limit']
     },
     'nasa-active-fires': {
-        'all': ['period', 'download', 'geojson', 'dev', 'bust'],
-        'iso': ['period', 'download', 'dev', 'bust'],
-        'id1': ['period', 'download', 'dev', 'bust'],
-        'wdpa': ['period', 'download', 'dev', 'bust'],
-        'use': ['period', 'download', 'dev', 'bust'],
+        'all': ['period', 'bucket', 'download', 'geojson', 'geostore', 'dev',
+                'bust'],
+        'iso': ['period', 'bucket', 'breakdown', 'download', 'dev', 'bust'],
+        'id1': ['period', 'bucket', 'download', 'dev', 'bust'],
+        'wdpa': ['period', 'bucket', 'download', 'dev', 'bust'],
+        'use': ['period', 'bucket', 'download', 'dev', 'bust'],
+        'countries': ['group_by', 'period', 'limit', 'dev', 'bust'],
+        'aois': ['aois', 'period', 'dev', 'bust'],
         'latest': ['bust','limit']
     },
     'quicc-alerts': {
-        'all': ['period', 'download', 'geojson', 'dev', 'bust'],
-        'iso': ['period', 'download', 'dev', 'bust'],
-        'id1': ['period', 'download', 'dev', 'bust'],
-        'wdpa': ['period', 'download', 'dev', 'bust'],
-        'use': ['period', 'download', 'dev', 'bust'],
+        'all': ['period', 'compare', 'bucket', 'download', 'geojson',
+                'geostore', 'dev', 'bust'],
+        'iso': ['period', 'compare', 'bucket', 'breakdown', 'download', 'dev',
+                'bust'],
+        'id1': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'wdpa': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'use': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'countries': ['group_by', 'period', 'limit', 'dev', 'bust'],
+        'aois': ['aois', 'period', 'dev', 'bust'],
         'latest': ['bust','limit']
     },
     'imazon-alerts': {
-        'all': ['period', 'download', 'geojson', 'dev', 'bust'],
-        'iso': ['period', 'download', 'dev', 'bust'],
+        'all': ['period', 'download', 'geojson', 'geostore', 'dev', 'bust'],
+        'iso': ['period', 'breakdown', 'download', 'dev', 'bust'],
         'id1': ['period', 'download', 'dev', 'bust'],
         'wdpa': ['period', 'download', 'dev', 'bust'],
         'use': ['period', 'download', 'dev', 'bust'],
         'latest': ['bust','limit']
     },
     'umd-loss-gain': {
-        'all': ['thresh', 'geojson', 'period', 'dev', 'bust'],
+        'all': ['thresh', 'geojson', 'geostore', 'period', 'dev', 'bust'],
         'iso': ['download', 'dev', 'bust', 'thresh'],
         'ifl': ['download', 'dev', 'bust', 'thresh'],
         'ifl_id1': ['download', 'dev', 'bust', 'thresh'],
@@ -233,25 +283,69 @@ PARAMS = {
         'use': ['download', 'dev', 'bust', 'thresh']
     },
     'terrai-alerts': {
-        'all': ['period', 'download', 'geojson', 'dev', 'bust'],
-        'iso': ['period', 'download', 'dev', 'bust'],
-        'id1': ['period', 'download', 'dev', 'bust'],
-        'wdpa': ['period', 'download', 'dev', 'bust'],
-        'use': ['period', 'download', 'dev', 'bust'],
+        'all': ['period', 'compare', 'bucket', 'download', 'geojson',
+                'geostore', 'dev', 'bust'],
+        'iso': ['period', 'compare', 'bucket', 'breakdown', 'download', 'dev',
+                'bust'],
+        'id1': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'wdpa': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'use': ['period', 'compare', 'bucket', 'download', 'dev', 'bust'],
+        'countries': ['group_by', 'period', 'limit', 'dev', 'bust'],
+        'aois': ['aois', 'period', 'dev', 'bust'],
         'latest': ['bust','limit']
     }
 }
 
+class _SnapshotTarget(object):
+    """Executes requests of a dataset module on the local snapshot of the
+    dataset while it is at the current data version, otherwise on CartoDB.
+
+    Requests that fail on the snapshot are executed again on CartoDB."""
+
+    def __init__(self, dataset, module):
+        self.dataset = dataset
+        self.module = module
+
+    def execute(self, params):
+        snap = snapshot.get(self.dataset, versions.get(self.dataset))
+        if snap:
+            try:
+                action, data = self.module.execute(dict(params), snap)
+                if action != 'execute() error':
+                    return action, data
+                error = data
+            except Exception, e:
+                error = e
+            logging.warning('%s snapshot %s failed: %s' % (
+                self.dataset, snap.version, error))
+        return self.module.execute(params)
+
+
 # Maps dataset name to target module for execution
 TARGETS = {
-    'forma-alerts': forma,
+    'forma-alerts': _SnapshotTarget('forma-alerts', forma),
     'umd-loss-gain': umd,
-    'nasa-active-fires': fires,
-    'quicc-alerts': quicc,
+    'nasa-active-fires': _SnapshotTarget('nasa-active-fires', fires),
+    'quicc-alerts': _SnapshotTarget('quicc-alerts', quicc),
     'imazon-alerts': imazon,
-    'terrai-alerts': terrai
+    'terrai-alerts': _SnapshotTarget('terrai-alerts', terrai)
 }
 
+# Maps dataset name to resolution in meters
+RESOLUTIONS = dict(
+    (name, geometry.resolution_meters(meta['meta']['resolution']))
+    for name, meta in META.iteritems())
+
+# Maps dataset name to coordinate decimals used in cache keys
+DECIMALS = dict(
+    (name, geometry.decimals(meters))
+    for name, meters in RESOLUTIONS.iteritems())
+
+# Maps dataset name to geometry simplification tolerance in degrees
+TOLERANCES = dict(
+    (name, geometry.tolerance(meters))
+    for name, meters in RESOLUTIONS.iteritems())
+
 
 def _dataset_from_path(path):
     """Return dataset name from supplied request path.
@@ -276,6 +370,10 @@ def _classify_request(path):
         rtype = 'all'
     elif re.match(r'forest-change/%s/latest$' % dataset, path):
         rtype = 'latest'
+    elif re.match(r'forest-change/%s/admin$' % dataset, path):
+        rtype = 'countries'
+    elif re.match(r'forest-change/%s/aois$' % dataset, path):
+        rtype = 'aois'
     elif re.match(r'forest-change/%s/admin/ifl/[A-z]{3,3}$' % dataset, path):
         rtype = 'ifl'
     elif re.match(r'forest-change/%s/admin/ifl/[A-z]{3,3}/\d$' % dataset, path):
@@ -292,6 +390,43 @@ def _classify_request(path):
     return dataset, rtype
 
 
+def _key_params(dataset, rtype, params):
+    """Return params for the cache key of a request.
+
+    Defaults applied by the dataset executors are filled in and the geojson
+    is canonicalised at the dataset resolution, so that requests that mean
+    the same thing share a cache key. Stored geometries are keyed by their
+    geostore id."""
+    key = dict(params)
+    if dataset == 'umd-loss-gain':
+        key.setdefault('thresh', umd.DEFAULT_THRESH)
+    elif rtype == 'latest':
+        key.setdefault('limit', 3)
+    else:
+        key.setdefault('begin', DEFAULT_BEGIN)
+        key.setdefault('end', DEFAULT_END)
+    if 'geostore' in key:
+        key.pop('geojson', None)
+    elif 'geojson' in key:
+        key['geojson'] = geometry.parse(key['geojson']).canonical(
+            DECIMALS[dataset])
+    return key
+
+
+def _simplify(dataset, params):
+    """Replace geojson in params with a canonical copy simplified to the
+    dataset resolution, adding the vertex reduction for dev requests.
+
+    The requested geometry is kept as requested_geojson for the response."""
+    params['requested_geojson'] = params['geojson']
+    geom = params['geojson'].rounded(DECIMALS[dataset])
+    params['geojson'] = geom.simplify(TOLERANCES[dataset])
+    if 'dev' in params:
+        params['simplified'] = dict(
+            vertices=geom.vertices,
+            simplified_vertices=params['geojson'].vertices)
+
+
 class Handler(CORSRequestHandler):
     """API handler for all datasets."""
 
@@ -315,28 +450,304 @@ class Handler(CORSRequestHandler):
                 return
 
             # Handle request
-            query_args = args.process(self.args(only=PARAMS[dataset][rtype]))
-            path_args = args.process_path(path, rtype)
-            params = dict(query_args, **path_args)
+            raw = self.args(only=PARAMS[dataset][rtype])
+            self.write_response(*self.analyse(path, dataset, rtype, raw))
+        except (Exception, args.ArgError), e:
+            logging.exception(e)
+            self.write_error(400, e.message)
+
+    def analyse(self, path, dataset, rtype, raw):
+        """Return rendered (status, headers, body) for a dataset request path
+        and its raw query args."""
+        query_args = args.process(raw)
+        path_args = args.process_path(path, rtype)
+        params = dict(query_args, **path_args)
 
-            # Queries for all require a geojson constraint for performance
-            if rtype == 'all' and 'geojson' not in params:
-                raise args.GeoJsonArgError()
+        # Country rankings are grouped by iso, and only country rankings are
+        if (rtype == 'countries') != ('group_by' in params):
+            raise args.GroupByArgError()
 
-            rid = self.get_id(params)
-            target = TARGETS[dataset]
-            action, data = self.get_or_execute(params, target, rid)
+        # Breakdowns are only by id1 of a country, on datasets that have them
+        if 'breakdown' in params and (
+                rtype != 'iso' or 'breakdown' not in PARAMS[dataset][rtype]):
+            raise args.BreakdownArgError()
 
-            # Redirect if needed
-            if action != 'redirect':
-                data.update(META[dataset])
+        # Histograms need a histogram query and have no breakdown
+        if 'bucket' in params and (
+                'bucket' not in PARAMS[dataset][rtype] or
+                'breakdown' in params):
+            raise args.BucketArgError()
 
-            self.complete(action, data)
+        # Comparisons need a comparison query and have no histogram or
+        # breakdown
+        if 'compare' in params and (
+                'compare' not in PARAMS[dataset][rtype] or
+                'bucket' in params or 'breakdown' in params):
+            raise args.CompareArgError()
+
+        # Queries for all require a geojson constraint for performance
+        if rtype == 'all' and 'geojson' not in params \
+                and 'geostore' not in params:
+            raise args.GeoJsonArgError()
+
+        # Namespace cache keys by data version when it is known
+        key = _key_params(dataset, rtype, params)
+        version = versions.get(dataset)
+        if version:
+            key['data_version'] = version
+        rid = self.get_id(key, path)
+
+        target = _GeometryTarget(dataset, TARGETS[dataset])
+        ttl = versions.TTL if version else None
+        if 'breakdown' in params:
+            target = _BreakdownTarget(self, dataset, path, version, ttl)
+        return self.get_or_execute(
+            params, target, rid, meta=META[dataset], ttl=ttl, path=path,
+            raw=raw)
+
+
+class _GeometryTarget(object):
+    """Executes a request of a dataset target, first fetching its stored
+    geometry simplified to the dataset resolution when it references one, or
+    else simplifying its geometry to the dataset resolution.
+
+    This only happens when the request is executed, so cache hits neither
+    read the datastore nor simplify geometries."""
+
+    def __init__(self, dataset, target):
+        self.dataset = dataset
+        self.target = target
+
+    def execute(self, params):
+        if 'geostore' in params:
+            geojson = geostore.get_geojson(
+                params['geostore'], RESOLUTIONS[self.dataset])
+            if not geojson:
+                raise args.GeostoreArgError()
+            params['geojson'] = geometry.parse(geojson)
+        elif 'geojson' in params:
+            _simplify(self.dataset, params)
+        return self.target.execute(params)
+
+
+class _BreakdownTarget(object):
+    """Executes a breakdown request and caches its id1 responses.
+
+    Each id1 response is cached under the key of its own
+    /admin/{iso}/{id1} request, so follow-up subnational requests are hits.
+    Dev requests are not cached."""
+
+    def __init__(self, handler, dataset, path, version, ttl):
+        self.handler = handler
+        self.dataset = dataset
+        self.path = path.rstrip('/')
+        self.version = version
+        self.ttl = ttl
+
+    def execute(self, params):
+        base = dict(params)
+        action, data = TARGETS[self.dataset].execute(params)
+        if action == 'respond' and 'dev' not in base:
+            for id1, id1_data in data['breakdown'].iteritems():
+                self._cache(base, id1, id1_data)
+        return action, data
+
+    def _cache(self, params, id1, data):
+        params = dict(params, id1=id1)
+        for name in ['breakdown', 'bucket']:
+            params.pop(name, None)
+        key = _key_params(self.dataset, 'id1', params)
+        if self.version:
+            key['data_version'] = self.version
+        rid = self.handler.get_id(key, '%s/%s' % (self.path, id1))
+        result = self.handler.render(
+            'respond', dict(data, **META[self.dataset]))
+        self.handler._cache(rid, result, self.ttl)
+
+
+def _batch_path(raw):
+    """Return path suffix for the area of interest in batch request args.
+
+    Example: {'iso': 'bra', 'id1': '1'} => /admin/bra/1"""
+    if 'iso' in raw and 'id1' in raw:
+        return '/admin/%s/%s' % (raw['iso'], raw['id1'])
+    elif 'iso' in raw:
+        return '/admin/%s' % raw['iso']
+    elif 'wdpaid' in raw:
+        return '/wdpa/%s' % raw['wdpaid']
+    elif 'use' in raw and 'useid' in raw:
+        return '/use/%s/%s' % (raw['use'], raw['useid'])
+    return ''
+
+
+def _max_age(headers):
+    """Return max-age of the Cache-Control header in headers."""
+    match = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+    return int(match.group(1)) if match else 0
+
+
+class BatchHandler(Handler):
+    """API handler for several datasets and one area of interest.
+
+    Example: /forest-change/batch?datasets=forma-alerts,quicc-alerts&iso=bra
+
+    Each dataset is handled like its own request, concurrently, so it is
+    cached under the same key as /forest-change/{dataset}/admin/bra. The
+    response maps dataset names to their documents, or to an error."""
+
+    def get(self):
+        try:
+            raw = self.args()
+            names = raw.pop('datasets', None)
+            datasets = names.split(',') if names else sorted(TARGETS)
+            suffix = _batch_path(raw)
+            for name in ['iso', 'id1', 'wdpaid', 'use', 'useid', 'download']:
+                raw.pop(name, None)
+            if 'geojson' in raw:
+                raw['geojson'] = geometry.parse(raw['geojson'])
+
+            # Executors block on CartoDB and Earth Engine, so run each
+            # dataset in its own thread
+            results = {}
+            threads = [
+                threading.Thread(
+                    target=self._analyse_into,
+                    args=(results, dataset, suffix, raw))
+                for dataset in datasets]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.write_response(*self._combine(datasets, results))
         except (Exception, args.ArgError), e:
             logging.exception(e)
             self.write_error(400, e.message)
 
+    def _analyse_into(self, results, dataset, suffix, raw):
+        """Store rendered response for dataset in results."""
+        path = '/forest-change/%s%s' % (dataset, suffix)
+        try:
+            name, rtype = _classify_request(path)
+            if dataset not in TARGETS or rtype not in PARAMS[dataset]:
+                raise args.ArgError('Unsupported request %s' % path)
+            only = PARAMS[dataset][rtype]
+            raw = dict((k, v) for k, v in raw.iteritems() if k in only)
+            results[dataset] = self.analyse(path, dataset, rtype, raw)
+        except (Exception, args.ArgError), e:
+            logging.exception(e)
+            results[dataset] = (400, {}, str(e.message))
+
+    @classmethod
+    def _combine(cls, datasets, results):
+        """Return rendered response combining the dataset responses.
+
+        Cached bodies are embedded as they are, without parsing them again,
+        and the shortest max-age applies to the combined response."""
+        parts = []
+        for dataset in datasets:
+            status, headers, body = results[dataset]
+            if status != 200:
+                body = json.dumps(dict(error=body or 'HTTP %s' % status))
+            parts.append('%s: %s' % (json.dumps(dataset), body))
+        body = '{%s}' % ', '.join(parts)
+        headers = dict(ETag=get_etag(body))
+        cache_controls = [
+            results[x][1] for x in datasets if results[x][0] == 200]
+        if cache_controls:
+            headers['Cache-Control'] = min(
+                cache_controls, key=_max_age)['Cache-Control']
+        return 200, headers, body
+
+
+class AoisHandler(CORSRequestHandler):
+    """API handler counting alerts for a list of areas of interest (AOIs).
+
+    Example: POST /forest-change/forma-alerts/aois with JSON body
+    {"period": "2014-01-01,2015-01-01", "aois": [{"wdpaid": 1},
+    {"use": "logging", "useid": 2}, {"geojson": {"type": "Polygon", ...}}]}
+
+    The response lists the value of each AOI in the order of the request."""
+
+    def post(self):
+        try:
+            path = self.request.path.rstrip('/')
+            dataset, rtype = _classify_request(path)
+            if dataset not in PARAMS or rtype not in PARAMS[dataset]:
+                self.error(404)
+                return
+            only = PARAMS[dataset][rtype]
+            params = args.process(dict(
+                (k, v) for k, v in self.args().iteritems() if k in only))
+            if 'aois' not in params:
+                raise args.AoisArgError()
+            version = versions.get(dataset)
+            target = _AoisTarget(self, dataset, path, version)
+            self.write_response(*self.uncacheable(
+                self._execute(params, target, META[dataset]), params))
+        except (Exception, args.ArgError), e:
+            logging.exception(e)
+            self.write_error(400, e.message)
+
+
+class _AoisTarget(object):
+    """Executes an aois request for the AOIs missing from the cache.
+
+    The value of each AOI is cached on its own, keyed by dataset, period,
+    data version and AOI, so a list that overlaps an earlier one only
+    queries the new AOIs. Bust requests query all AOIs and dev requests are
+    not cached."""
+
+    def __init__(self, handler, dataset, path, version):
+        self.handler = handler
+        self.dataset = dataset
+        self.path = path
+        self.version = version
+        self.ttl = versions.TTL if version else SOFT_TTL
+
+    def execute(self, params):
+        aois = params.pop('aois')
+        rids = [self._get_id(params, aoi) for aoi in aois]
+        cached = {}
+        if 'bust' not in params and 'dev' not in params:
+            cached = memcache.get_multi(rids)
+        misses = [i for i, rid in enumerate(rids) if rid not in cached]
+        data = dict(params=dict(params))
+        if misses:
+            for i in misses:
+                if 'geojson' in aois[i]:
+                    aois[i] = dict(aois[i], geojson=self._simplify(
+                        aois[i]['geojson']))
+            action, data = TARGETS[self.dataset].execute(
+                dict(params, aois=[aois[i] for i in misses]))
+            if action != 'respond':
+                return action, data
+            values = dict(
+                (rids[i], dict(value=x['value']))
+                for i, x in zip(misses, data['aois']))
+            if 'dev' not in params:
+                memcache.set_multi(values, time=self.ttl)
+            cached.update(values)
+        data['aois'] = [
+            get_aoi_response(aoi, cached[rid]['value'])
+            for aoi, rid in zip(aois, rids)]
+        return 'respond', data
+
+    def _get_id(self, params, aoi):
+        key = _key_params(self.dataset, 'aois', dict(params, **aoi))
+        if self.version:
+            key['data_version'] = self.version
+        kind = 'geojson' if 'geojson' in aoi else \
+            'wdpa' if 'wdpaid' in aoi else 'use'
+        return self.handler.get_id(key, '%s/%s' % (self.path, kind))
+
+    def _simplify(self, geom):
+        return geom.rounded(DECIMALS[self.dataset]).simplify(
+            TOLERANCES[self.dataset])
+
 
 handlers = webapp2.WSGIApplication([
+    (r'/forest-change/batch', BatchHandler),
+    (r'/forest-change/[^/]+/aois/?', AoisHandler),
     (r'/forest-change.*', Handler)],
     debug=True)
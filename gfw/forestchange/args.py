@@ -18,7 +18,15 @@
 """This module provides URL argument processing and errors."""
 
 import datetime
-import json
+import re
+
+from gfw.forestchange import geometry
+
+# Maximum number of AOIs in one aois request
+MAX_AOIS = 1000
+
+# Maximum number of periods in one compare request
+MAX_COMPARE = 10
 
 
 def process_path(path, *params):
@@ -74,6 +82,65 @@ class GeoJsonArgError(ArgError):
         super(GeoJsonArgError, self).__init__(msg)
 
 
+class GeostoreArgError(ArgError):
+    USAGE = """Id returned by /forest-change/geostore."""
+
+    def __init__(self):
+        msg = 'Invalid geostore parameter! Usage: %s' % self.USAGE
+        super(GeostoreArgError, self).__init__(msg)
+
+
+class CompareArgError(ArgError):
+    USAGE = """2 to %d begin,end periods separated by |, without bucket or
+breakdown""" % MAX_COMPARE
+
+    def __init__(self):
+        msg = 'Invalid compare parameter! Usage: %s' % self.USAGE
+        super(CompareArgError, self).__init__(msg)
+
+
+class BucketArgError(ArgError):
+    USAGE = """bucket must be either day, week, month or year, without
+breakdown"""
+
+    def __init__(self):
+        msg = 'Invalid bucket parameter! Usage: %s' % self.USAGE
+        super(BucketArgError, self).__init__(msg)
+
+
+class BreakdownArgError(ArgError):
+    USAGE = """breakdown must be id1"""
+
+    def __init__(self):
+        msg = 'Invalid breakdown parameter! Usage: %s' % self.USAGE
+        super(BreakdownArgError, self).__init__(msg)
+
+
+class GroupByArgError(ArgError):
+    USAGE = """group_by must be iso"""
+
+    def __init__(self):
+        msg = 'Invalid group_by parameter! Usage: %s' % self.USAGE
+        super(GroupByArgError, self).__init__(msg)
+
+
+class LimitArgError(ArgError):
+    USAGE = """limit must be a positive integer"""
+
+    def __init__(self):
+        msg = 'Invalid limit parameter! Usage: %s' % self.USAGE
+        super(LimitArgError, self).__init__(msg)
+
+
+class AoisArgError(ArgError):
+    USAGE = """List of 1 to %d AOIs, each with a wdpaid, a use and useid, or
+a geojson""" % MAX_AOIS
+
+    def __init__(self):
+        msg = 'Invalid aois parameter! Usage: %s' % self.USAGE
+        super(AoisArgError, self).__init__(msg)
+
+
 class DownloadArgError(ArgError):
     USAGE = """filename.{csv | kml | shp | geojson | svg}"""
 
@@ -206,6 +273,36 @@ class ArgProcessor():
         except:
             raise PeriodArgError()
 
+    @classmethod
+    def compare(cls, value):
+        try:
+            periods = sorted(
+                [cls.period(x) for x in value.split('|')],
+                key=lambda x: (x['begin'], x['end']))
+            if not 2 <= len(periods) <= MAX_COMPARE:
+                raise
+            return dict(compare=periods)
+        except:
+            raise CompareArgError()
+
+    @classmethod
+    def bucket(cls, value):
+        if value not in ['day', 'week', 'month', 'year']:
+            raise BucketArgError()
+        return dict(bucket=value)
+
+    @classmethod
+    def breakdown(cls, value):
+        if value != 'id1':
+            raise BreakdownArgError()
+        return dict(breakdown=value)
+
+    @classmethod
+    def group_by(cls, value):
+        if value != 'iso':
+            raise GroupByArgError()
+        return dict(group_by=value)
+
     @classmethod
     def iso(cls, value):
         try:
@@ -226,13 +323,19 @@ class ArgProcessor():
     @classmethod
     def geojson(cls, value):
         try:
-            geom = json.loads(value)
-            if geom['type'] != 'Polygon' and geom['type'] != 'MultiPolygon':
+            geom = geometry.parse(value)
+            if geom.type != 'Polygon' and geom.type != 'MultiPolygon':
                 raise
-            return {'geojson': value}
+            return {'geojson': geom}
         except:
             raise GeoJsonArgError()
 
+    @classmethod
+    def geostore(cls, value):
+        if not re.match(r'^[0-9a-f]{32}$', value or ''):
+            raise GeostoreArgError()
+        return dict(geostore=value)
+
     @classmethod
     def download(cls, value):
         try:
@@ -274,7 +377,30 @@ class ArgProcessor():
 
     @classmethod
     def limit(cls, value):
-        return dict(limit=value)
+        try:
+            if int(value) < 1:
+                raise
+            return dict(limit=value)
+        except:
+            raise LimitArgError()
+
+    @classmethod
+    def aois(cls, value):
+        try:
+            if not value or len(value) > MAX_AOIS:
+                raise
+            aois = []
+            for aoi in value:
+                aoi = cls.process(dict(
+                    (k, v) for k, v in aoi.iteritems()
+                    if k in ['wdpaid', 'use', 'useid', 'geojson']))
+                kinds = [x for x in ['wdpaid', 'use', 'geojson'] if x in aoi]
+                if len(kinds) != 1 or ('use' in aoi) != ('useid' in aoi):
+                    raise
+                aois.append(aoi)
+            return dict(aois=aois)
+        except:
+            raise AoisArgError()
 
     @classmethod
     def dev(cls, value):
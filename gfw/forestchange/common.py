@@ -1,11 +1,33 @@
 
-import copy
+import datetime
 import json
+import re
 
 from gfw import cdb
+from gfw.forestchange import download
+from gfw.forestchange import geometry
+
+# Default period for queries without a period parameter
+DEFAULT_BEGIN = '2014-01-01'
+DEFAULT_END = '2015-01-01'
+
+# Maps use name to its concession table
+USE_TABLES = {
+    'mining': 'gfw_mining',
+    'oilpalm': 'gfw_oil_palm',
+    'fiber': 'gfw_wood_fiber',
+    'logging': 'gfw_logging'
+}
+
+# Maximum AOIs, and characters of inlined GeoJSON, per AOI count query. This
+# keeps the queries within the CartoDB SQL API payload and timeout limits.
+AOI_BATCH_SIZE = 200
+AOI_BATCH_CHARS = 500000
 
 def classify_query(args):
-    if 'ifl' in args:
+    if args.get('group_by') == 'iso':
+        return 'group_by_iso'
+    elif 'ifl' in args:
         return 'ifl'
     elif 'ifl_id1' in args:
         return 'ifl_id1'
@@ -48,6 +70,62 @@ class Sql(object):
 
     MIN_MAX_DATE_SQL = ', MIN(date) as min_date, MAX(date) as max_date'
 
+    # Date column of alert counts, required for histogram queries
+    DATE_COLUMN = None
+
+    HISTOGRAM_SELECT = \
+        " AS value, date_trunc('{bucket}', {date})::date AS bucket"
+
+    HISTOGRAM_GROUP_BY = " GROUP BY bucket ORDER BY bucket"
+
+    COMPARISON_SELECT = "COUNT(*) FILTER (WHERE {date} BETWEEN " \
+        "'{begin}'::date AND '{end}'::date) AS period_{index}"
+
+    COMPARISON_PERIOD = "{date} BETWEEN '{begin}'::date AND '{end}'::date"
+
+    # Query of ID1 rows for all id1 of an iso, with an additional id1 column
+    ID1_BREAKDOWN = None
+
+    # Query of iso and value rows for all countries, sorted by value
+    GROUP_BY_ISO = None
+
+    # Alert table, its alias in DATE_COLUMN and an optional filter on its
+    # rows, required for AOI count queries. Like the WORLD queries, GeoJSON
+    # AOIs are counted without the filter.
+    ALERTS_TABLE = None
+    ALERTS_ALIAS = None
+    ALERTS_FILTER = ''
+
+    # Query of a page of alert points after a cartodb_id, with the columns
+    # of gfw.forestchange.snapshot, required for snapshot exports
+    EXPORT = None
+
+    AOI_WDPA = """
+        SELECT v.id, p.the_geom
+        FROM (VALUES {values}) AS v(id, wdpaid)
+        INNER JOIN wdpa_protected_areas p
+            ON p.wdpaid = v.wdpaid"""
+
+    AOI_USE = """
+        SELECT v.id, u.the_geom
+        FROM (VALUES {values}) AS v(id, pid)
+        INNER JOIN {use_table} u
+            ON u.cartodb_id = v.pid"""
+
+    AOI_GEOJSON = """
+        SELECT v.id, ST_SetSRID(ST_GeomFromGeoJSON(v.geojson), 4326) AS the_geom
+        FROM (VALUES {values}) AS v(id, geojson)"""
+
+    AOI_COUNTS = """
+        SELECT aoi.id, COUNT({alias}.*) AS value
+        FROM ({aois}) AS aoi
+        LEFT JOIN {table} {alias}
+            ON ST_Intersects({alias}.the_geom, aoi.the_geom)
+               AND {date} >= '{begin}'::date
+               AND {date} <= '{end}'::date
+               {filter}
+        GROUP BY aoi.id"""
+
     @classmethod
     def get_query_type(cls, params, args, the_geom_table=''):
         """Return query type (download or analysis) with updated params."""
@@ -79,12 +157,95 @@ class Sql(object):
 
     @classmethod
     def process(cls, args):
-        begin = args['begin'] if 'begin' in args else '2014-01-01'
-        end = args['end'] if 'end' in args else '2015-01-01'
+        begin = args['begin'] if 'begin' in args else DEFAULT_BEGIN
+        end = args['end'] if 'end' in args else DEFAULT_END
+        if cls.is_comparison(args):
+            begin = min(x['begin'] for x in args['compare'])
+            end = max(x['end'] for x in args['compare'])
         params = dict(begin=begin, end=end)
         classification = classify_query(args)
         if hasattr(cls, classification):
-            return map(cls.clean, getattr(cls, classification)(params, args))
+            query, download_query = getattr(cls, classification)(params, args)
+            if cls.is_comparison(args):
+                query = cls.comparison(query, args['compare'])
+            elif cls.is_histogram(args):
+                query = cls.histogram(query, args['bucket'])
+            return map(cls.clean, [query, download_query])
+
+    @classmethod
+    def breakdown(cls, args):
+        """Return query of id1 rows for all id1 of the iso in args."""
+        if not cls.ID1_BREAKDOWN:
+            raise SqlError('Breakdown by id1 is not supported')
+        begin = args['begin'] if 'begin' in args else DEFAULT_BEGIN
+        end = args['end'] if 'end' in args else DEFAULT_END
+        params = args_params(dict(begin=begin, end=end), args,
+                             cls.MIN_MAX_DATE_SQL)
+        return cls.clean(cls.ID1_BREAKDOWN.format(**params))
+
+    @classmethod
+    def aoi_counts(cls, kind, use, batch, args):
+        """Return query of id and value rows for a batch of (id, aoi) pairs
+        of one kind, counting the alerts in each AOI."""
+        if not cls.ALERTS_TABLE:
+            raise SqlError('AOI counts are not supported')
+        if kind == 'wdpa':
+            aois = cls.AOI_WDPA.format(values=', '.join(
+                '(%d, %d)' % (i, int(aoi['wdpaid'])) for i, aoi in batch))
+        elif kind == 'use':
+            aois = cls.AOI_USE.format(
+                use_table=USE_TABLES.get(use) or use,
+                values=', '.join(
+                    '(%d, %d)' % (i, int(aoi['useid'])) for i, aoi in batch))
+        else:
+            aois = cls.AOI_GEOJSON.format(values=', '.join(
+                "(%d, '%s')" % (i, str(aoi['geojson']).replace("'", "''"))
+                for i, aoi in batch))
+        query = cls.AOI_COUNTS.format(
+            aois=aois, table=cls.ALERTS_TABLE, alias=cls.ALERTS_ALIAS,
+            date=cls.DATE_COLUMN,
+            filter=cls.ALERTS_FILTER if kind != 'geojson' else '',
+            begin=args.get('begin', DEFAULT_BEGIN),
+            end=args.get('end', DEFAULT_END))
+        return cls.clean(query)
+
+    @classmethod
+    def is_histogram(cls, args):
+        """Return True if args request counts per bucket."""
+        return 'bucket' in args and bool(cls.DATE_COLUMN) and \
+            classify_query(args) not in ['latest', 'group_by_iso']
+
+    @classmethod
+    def is_comparison(cls, args):
+        """Return True if args request counts for several periods."""
+        return 'compare' in args and bool(cls.DATE_COLUMN) and \
+            classify_query(args) not in ['latest', 'group_by_iso']
+
+    @classmethod
+    def comparison(cls, sql, periods):
+        """Return count query with a count filtered by DATE_COLUMN for each
+        period, in one pass over the union of the periods.
+
+        The rows are restricted to the periods after the end of the range
+        from the earliest begin to the latest end, so disjoint periods do not
+        scan the dates between them."""
+        end = "<= '%s'::date" % max(x['end'] for x in periods)
+        where = ' OR '.join(
+            cls.COMPARISON_PERIOD.format(date=cls.DATE_COLUMN, **period)
+            for period in periods)
+        sql = sql.replace(end, '%s AND (%s)' % (end, where), 1)
+        select = ', '.join(
+            cls.COMPARISON_SELECT.format(
+                date=cls.DATE_COLUMN, index=index, **period)
+            for index, period in enumerate(periods))
+        return re.sub(r'COUNT\([^)]*\) AS value', select, sql, count=1)
+
+    @classmethod
+    def histogram(cls, sql, bucket):
+        """Return count query grouped by date_trunc bucket of DATE_COLUMN."""
+        select = cls.HISTOGRAM_SELECT.format(
+            bucket=bucket, date=cls.DATE_COLUMN)
+        return sql.replace(' AS value', select, 1) + cls.HISTOGRAM_GROUP_BY
 
     @classmethod
     def world(cls, params, args):
@@ -142,13 +303,7 @@ class Sql(object):
 
     @classmethod
     def use(cls, params, args):
-        concessions = {
-            'mining': 'gfw_mining',
-            'oilpalm': 'gfw_oil_palm',
-            'fiber': 'gfw_wood_fiber',
-            'logging': 'gfw_logging'
-        }
-        params['use_table'] = concessions.get(args['use']) or args['use']
+        params['use_table'] = USE_TABLES.get(args['use']) or args['use']
         params['pid'] = args['useid']
         params = args_params(params,args,cls.MIN_MAX_DATE_SQL)
         query_type, params = cls.get_query_type(params, args)
@@ -156,19 +311,121 @@ class Sql(object):
         download_query = cls.download(cls.USE.format(**params))
         return query, download_query
 
+    @classmethod
+    def group_by_iso(cls, params, args):
+        if not cls.GROUP_BY_ISO:
+            raise SqlError('Group by iso is not supported')
+        params['limit'] = 'LIMIT %d' % int(args['limit']) \
+            if args.get('limit') else ''
+        query = cls.GROUP_BY_ISO.format(**params)
+        return query, None
+
     @classmethod
     def latest(cls, params, args):
         params['limit'] = args.get('limit') or 3
         query = cls.LATEST.format(**params)
         return query, None
 
+def _parse_date(value):
+    return datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _bucket_start(date, bucket):
+    """Return first day of the date_trunc bucket containing date."""
+    if bucket == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    elif bucket == 'month':
+        return date.replace(day=1)
+    elif bucket == 'year':
+        return date.replace(month=1, day=1)
+    return date
+
+
+def _next_bucket(start, bucket):
+    """Return first day of the bucket following the one starting at start."""
+    if bucket == 'week':
+        return start + datetime.timedelta(days=7)
+    elif bucket == 'month':
+        return (start.replace(day=28) + datetime.timedelta(days=4)).replace(
+            day=1)
+    elif bucket == 'year':
+        return start.replace(year=start.year + 1)
+    return start + datetime.timedelta(days=1)
+
+
+def get_histogram(rows, args):
+    """Return list of counts per bucket of the requested period.
+
+    Buckets without rows count zero. Buckets cut by the begin or end of the
+    period get begin and end dates clipped to it and are flagged partial, so
+    that they are not compared with whole buckets."""
+    bucket = args['bucket']
+    begin = _parse_date(args.get('begin', DEFAULT_BEGIN))
+    end = _parse_date(args.get('end', DEFAULT_END))
+    counts = dict(
+        (_parse_date(x['bucket']), x['value']) for x in rows if x['bucket'])
+    histogram = []
+    start = _bucket_start(begin, bucket)
+    while start <= end:
+        following = _next_bucket(start, bucket)
+        last = following - datetime.timedelta(days=1)
+        histogram.append(dict(
+            bucket=str(start), begin=str(max(start, begin)),
+            end=str(min(last, end)), value=counts.get(start, 0),
+            partial=start < begin or last > end))
+        start = following
+    return histogram
+
+
+def _aoi_kind(aoi):
+    """Return (kind, use) of aoi, AOIs of the same kind and use can be
+    counted by the same query."""
+    if 'wdpaid' in aoi:
+        return 'wdpa', None
+    elif 'use' in aoi:
+        return 'use', aoi['use']
+    return 'geojson', None
+
+
+def get_aoi_batches(aois):
+    """Return list of (kind, use, [(index, aoi)]) batches of aois.
+
+    AOIs are grouped by kind and use, in order of first appearance, and
+    split so that a batch has at most AOI_BATCH_SIZE AOIs and
+    AOI_BATCH_CHARS characters of GeoJSON."""
+    groups = {}
+    kinds = []
+    for index, aoi in enumerate(aois):
+        kind = _aoi_kind(aoi)
+        if kind not in groups:
+            groups[kind] = []
+            kinds.append(kind)
+        groups[kind].append((index, aoi))
+    batches = []
+    for kind, use in kinds:
+        batch, chars = [], 0
+        for index, aoi in groups[(kind, use)]:
+            size = len(str(aoi['geojson'])) if 'geojson' in aoi else 0
+            if batch and (len(batch) >= AOI_BATCH_SIZE or
+                          chars + size > AOI_BATCH_CHARS):
+                batches.append((kind, use, batch))
+                batch, chars = [], 0
+            batch.append((index, aoi))
+            chars += size
+        batches.append((kind, use, batch))
+    return batches
+
+
+def get_aoi_response(aoi, value):
+    """Return aoi as requested, without its geometry, with its value."""
+    response = dict((k, v) for k, v in aoi.iteritems() if k != 'geojson')
+    response['value'] = value
+    return response
+
+
 def get_download_urls(query, params):
-    urls = {}
-    args = copy.copy(params)
-    for fmt in ['csv', 'geojson', 'svg', 'kml', 'shp']:
-        args['format'] = fmt
-        urls[fmt] = cdb.get_url(query, args)
-    return urls
+    """Return short download links by format for supplied download query."""
+    return download.register(query, params)
 
 
 class CartoDbExecutor():
@@ -185,24 +442,152 @@ class CartoDbExecutor():
         else:
             result['error'] = 'CartoDB Error: %s' % response.content
 
+        cls._params_response(result, params, query)
+        return result
+
+    @classmethod
+    def _params_response(cls, result, params, query):
+        """Add params, with the geometry as requested, and the query and
+        simplification of dev requests, to result."""
         result['params'] = params
-        if 'geojson' in params:
-            result['params']['geojson'] = json.loads(params['geojson'])
+        requested = params.pop('requested_geojson', None)
+        if 'geostore' in params:
+            result['params'].pop('geojson', None)
+        elif 'geojson' in params:
+            result['params']['geojson'] = geometry.as_dict(
+                requested or params['geojson'])
         if 'dev' in params:
             result['dev'] = {'sql': query}
+            if 'simplified' in params:
+                result['dev'].update(params.pop('simplified'))
 
-        return result
+    @classmethod
+    def _histogram_response(cls, response, args):
+        """Add histogram of bucket rows and replace rows by their total."""
+        rows = response.pop('rows', [])
+        response['histogram'] = get_histogram(rows, args)
+        total = dict(value=sum(x['value'] for x in response['histogram']))
+        for name, fn in [('min_date', min), ('max_date', max)]:
+            dates = [x[name] for x in rows if x.get(name)]
+            if dates:
+                total[name] = fn(dates)
+        response['rows'] = [total]
+
+    @classmethod
+    def _comparison_response(cls, response, args):
+        """Add comparison of period counts and replace rows by the count of
+        the last period.
+
+        Each period has its delta and percent change from the period before
+        it, which are None for the first period."""
+        row = (response.pop('rows', None) or [{}])[0]
+        comparison = []
+        for index, period in enumerate(args['compare']):
+            value = row.get('period_%d' % index) or 0
+            item = dict(period, value=value, delta=None, delta_percent=None)
+            if comparison:
+                previous = comparison[-1]['value']
+                item['delta'] = value - previous
+                if previous:
+                    item['delta_percent'] = round(
+                        100.0 * (value - previous) / previous, 2)
+            comparison.append(item)
+        response['comparison'] = comparison
+        last = dict((k, v) for k, v in row.iteritems()
+                    if k in ['min_date', 'max_date'])
+        last['value'] = comparison[-1]['value']
+        response['rows'] = [last]
+
+    @classmethod
+    def execute_breakdown(cls, args, sql, process):
+        """Return iso response with a breakdown of id1 responses.
+
+        All id1 rows come from one grouped query. Each id1 response is built
+        and processed like the response of its own id1 request. The download
+        queries of all id1 are registered together."""
+        try:
+            query = sql.breakdown(args)
+            response = cdb.execute(query)
+            if response.status_code != 200:
+                return 'error', dict(
+                    error='CartoDB Error: %s' % response.content,
+                    params=args)
+            groups = {}
+            for row in json.loads(response.content)['rows']:
+                groups.setdefault(str(row.pop('id1')), []).append(row)
+            id1s, download_queries = [], []
+            for id1, rows in groups.iteritems():
+                id1_args = dict(args, id1=id1)
+                for name in ['breakdown', 'bucket', 'bust', 'dev']:
+                    id1_args.pop(name, None)
+                id1_query, download_query = sql.process(id1_args)
+                id1s.append((id1, rows, id1_args))
+                download_queries.append(download_query)
+            breakdown = {}
+            download_urls = download.register_multi(download_queries, args)
+            for (id1, rows, id1_args), urls in zip(id1s, download_urls):
+                data = dict(rows=rows, params=id1_args, download_urls=urls)
+                breakdown[id1] = process('respond', data)[1]
+            data = dict(params=args, breakdown=breakdown)
+            if 'dev' in args:
+                data['dev'] = {'sql': query}
+            return 'respond', data
+        except Exception, e:
+            return 'execute() error', e
+
+    @classmethod
+    def execute_aois(cls, args, sql):
+        """Return response with the value of each AOI in args, in order.
+
+        The AOIs are counted by set-based queries over batches of AOIs of
+        one kind, which run in parallel. AOIs that are not found are None."""
+        try:
+            aois = args.pop('aois')
+            queries = [
+                sql.aoi_counts(kind, use, batch, args)
+                for kind, use, batch in get_aoi_batches(aois)]
+            values = {}
+            for response in cdb.execute_many(queries):
+                if response.status_code != 200:
+                    return 'error', dict(
+                        error='CartoDB Error: %s' % response.content,
+                        params=args)
+                for row in json.loads(response.content)['rows']:
+                    values[int(row['id'])] = row['value']
+            data = dict(params=args, aois=[
+                get_aoi_response(aoi, values.get(i))
+                for i, aoi in enumerate(aois)])
+            if 'dev' in args:
+                data['dev'] = {'sql': queries}
+            return 'respond', data
+        except Exception, e:
+            return 'execute() error', e
+
+    @classmethod
+    def execute_ranking(cls, args, sql):
+        """Return response ranking countries by the rows of a group by iso
+        query."""
+        action, data = cls.execute(args, sql)
+        if action == 'respond':
+            data.pop('download_urls')
+            data['ranking'] = [
+                dict(rank=rank, iso=row['iso'], value=row['value'])
+                for rank, row in enumerate(data.pop('rows', []), 1)]
+        return action, data
 
     @classmethod
     def execute(cls, args, sql):
         try:
             query, download_query = sql.process(args)
-            download_url = cdb.get_url(download_query, args)
             if 'format' in args:
-                return 'redirect', download_url
+                return 'redirect', cdb.get_url(download_query, args)
             else:
                 action, response = 'respond', cdb.execute(query)
                 response = cls._query_response(response, args, query)
+                if 'error' not in response and sql.is_comparison(args):
+                    cls._comparison_response(response, args)
+                elif 'error' not in response and sql.is_histogram(args):
+                    cls._histogram_response(response, args)
                 response['download_urls'] = get_download_urls(
                     download_query, args)
                 if 'error' in response:
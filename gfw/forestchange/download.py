@@ -0,0 +1,100 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports short download links for analysis results.
+
+Analysis responses used to embed the full download SQL, including the user
+geometry, URL encoded once for each format. Instead the download query is
+stored once under a short hash id, the response links to
+/forest-change/download/{id}.{format}, and the link redirects to CartoDB
+when it is followed."""
+
+import webapp2
+
+from hashlib import md5
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from gfw import cdb
+from gfw.common import APP_BASE_URL
+
+FORMATS = ['csv', 'geojson', 'svg', 'kml', 'shp']
+
+DOWNLOAD_URL = '%s/forest-change/download/%s.%s'
+
+
+class Download(ndb.Model):
+    query = ndb.TextProperty()
+    version = ndb.StringProperty(indexed=False)
+
+
+def _get_id(query, version):
+    """Return short hash id for supplied query and CartoDB API version."""
+    key = u'%s:%s' % (version or '', query)
+    return md5(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _memcache_key(did):
+    return 'download/%s' % did
+
+
+def register(query, params):
+    """Store download query and return dictionary of download URLs by format."""
+    return register_multi([query], params)[0]
+
+
+def register_multi(queries, params):
+    """Store download queries and return list of dictionaries of download
+    URLs by format, one for each query.
+
+    Stored ids are remembered in memcache, so queries that were registered
+    before do not touch the datastore. New queries are stored in one batch
+    write."""
+    version = params.get('version')
+    ids = [_get_id(query, version) if query else None for query in queries]
+    new = dict((_memcache_key(did), Download(id=did, query=query,
+                                             version=version))
+               for did, query in zip(ids, queries) if did)
+    if new:
+        for key in memcache.get_multi(new.keys()):
+            new.pop(key)
+    if new:
+        ndb.put_multi(new.values())
+        memcache.set_multi(dict.fromkeys(new, True))
+    return [dict((fmt, DOWNLOAD_URL % (APP_BASE_URL, did, fmt))
+                 for fmt in FORMATS) if did else {} for did in ids]
+
+
+class Handler(webapp2.RequestHandler):
+    """Redirects a download link to the CartoDB download URL."""
+
+    def get(self, did, fmt):
+        download = Download.get_by_id(did)
+        if not download or fmt not in FORMATS:
+            self.error(404)
+            return
+        params = dict(format=fmt)
+        if download.version:
+            params['version'] = download.version
+        self.redirect(cdb.get_url(download.query, params))
+
+
+handlers = webapp2.WSGIApplication([
+    webapp2.Route(r'/forest-change/download/<did:[0-9a-f]+>.<fmt:[a-z]+>',
+                  handler=Handler, handler_method='get')],
+    debug=True)
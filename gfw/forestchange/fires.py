@@ -21,10 +21,17 @@ import datetime
 
 from gfw.forestchange.common import CartoDbExecutor
 from gfw.forestchange.common import Sql
+from gfw.forestchange.snapshot import LocalExecutor
 
 
 class FiresSql(Sql):
 
+    DATE_COLUMN = 'pt.acq_date::date'
+
+    ALERTS_TABLE = 'global_7d'
+    ALERTS_ALIAS = 'pt'
+    ALERTS_FILTER = 'AND CAST(pt.confidence AS INT) > 30'
+
     WORLD = """
         SELECT COUNT(pt.*) AS value
         FROM global_7d pt
@@ -76,6 +83,52 @@ class FiresSql(Sql):
             AND acq_date::date <= '{end}'::date
             AND CAST(confidence AS INT)> 30"""
 
+    ID1_BREAKDOWN = """
+        SELECT p.id_1 AS id1, COUNT(pt.*) AS value
+        FROM (SELECT id_1, the_geom FROM gadm2_provinces_simple
+              WHERE iso = UPPER('{iso}')) as p
+        LEFT JOIN global_7d pt
+            ON ST_Intersects(pt.the_geom, p.the_geom)
+               AND acq_date::date >= '{begin}'::date
+               AND acq_date::date <= '{end}'::date
+               AND CAST(confidence AS INT)> 30
+        GROUP BY p.id_1
+        ORDER BY p.id_1"""
+
+    GROUP_BY_ISO = """
+        SELECT p.iso, COUNT(pt.*) AS value
+        FROM global_7d pt, gadm2_countries_simple p
+        WHERE ST_Intersects(pt.the_geom, p.the_geom)
+            AND acq_date::date >= '{begin}'::date
+            AND acq_date::date <= '{end}'::date
+            AND CAST(confidence AS INT)> 30
+        GROUP BY p.iso
+        ORDER BY value DESC, iso
+        {limit}"""
+
+    EXPORT = """
+        SELECT pt.cartodb_id,
+               pt.acq_date::date - '1970-01-01'::date AS day,
+               ST_Y(pt.the_geom) AS lat,
+               ST_X(pt.the_geom) AS lon,
+               COALESCE((
+                   SELECT UPPER(c.iso)
+                   FROM gadm2_countries_simple c
+                   WHERE ST_Intersects(pt.the_geom, c.the_geom)
+                   LIMIT 1), '') AS iso,
+               -1 AS gadm2,
+               COALESCE((
+                   SELECT p.id_1
+                   FROM gadm2_provinces_simple p
+                   WHERE ST_Intersects(pt.the_geom, p.the_geom)
+                   LIMIT 1), -1) AS id1,
+               CAST(pt.confidence AS INT) > 30 AS alert
+        FROM global_7d pt
+        WHERE pt.cartodb_id > {after}
+              AND pt.acq_date IS NOT NULL
+        ORDER BY pt.cartodb_id
+        LIMIT {limit}"""
+
     LATEST = """
         SELECT DISTINCT acq_date as date
         FROM global_7d
@@ -126,8 +179,20 @@ def _processResults(action, data):
     return action, data
 
 
-def execute(args):
-    action, data = CartoDbExecutor.execute(args, FiresSql)
+def execute(args, snapshot=None):
+    """Execute request args on CartoDB, or on the supplied snapshot if it
+    supports them."""
+    if 'breakdown' in args:
+        return CartoDbExecutor.execute_breakdown(
+            args, FiresSql, _processResults)
+    if 'group_by' in args:
+        return CartoDbExecutor.execute_ranking(args, FiresSql)
+    if 'aois' in args:
+        return CartoDbExecutor.execute_aois(args, FiresSql)
+    if snapshot and LocalExecutor.supports(args):
+        action, data = LocalExecutor.execute(args, FiresSql, snapshot)
+    else:
+        action, data = CartoDbExecutor.execute(args, FiresSql)
     if action == 'redirect' or action == 'error':
         return action, data
     return _processResults(action, data)
@@ -19,10 +19,16 @@
 
 from gfw.forestchange.common import CartoDbExecutor
 from gfw.forestchange.common import Sql
+from gfw.forestchange.snapshot import LocalExecutor
 
 
 class FormaSql(Sql):
 
+    DATE_COLUMN = 'f.date'
+
+    ALERTS_TABLE = 'forma_api'
+    ALERTS_ALIAS = 'f'
+
     WORLD = """
         SELECT COUNT(f.*) AS value
             {additional_select}
@@ -74,6 +80,47 @@ class FormaSql(Sql):
               AND f.date >= '{begin}'::date
               AND f.date <= '{end}'::date"""
 
+    ID1_BREAKDOWN = """
+        SELECT g.id_1 AS id1, COUNT(f.*) AS value
+            {additional_select}
+        FROM (
+            SELECT objectid, id_1
+            FROM gadm2
+            WHERE iso = UPPER('{iso}')) g
+        LEFT JOIN forma_api f
+            ON f.gadm2::int = g.objectid
+               AND f.date >= '{begin}'::date
+               AND f.date <= '{end}'::date
+        GROUP BY g.id_1
+        ORDER BY g.id_1"""
+
+    GROUP_BY_ISO = """
+        SELECT UPPER(f.iso) AS iso, COUNT(f.*) AS value
+        FROM forma_api f
+        WHERE f.date >= '{begin}'::date
+              AND f.date <= '{end}'::date
+              AND f.iso IS NOT NULL
+        GROUP BY UPPER(f.iso)
+        ORDER BY value DESC, iso
+        {limit}"""
+
+    EXPORT = """
+        SELECT f.cartodb_id,
+               f.date::date - '1970-01-01'::date AS day,
+               ST_Y(f.the_geom) AS lat,
+               ST_X(f.the_geom) AS lon,
+               COALESCE(UPPER(f.iso), '') AS iso,
+               COALESCE(f.gadm2::int, -1) AS gadm2,
+               COALESCE(g.id_1, -1) AS id1,
+               TRUE AS alert
+        FROM forma_api f
+        LEFT JOIN gadm2 g
+            ON f.gadm2::int = g.objectid
+        WHERE f.cartodb_id > {after}
+              AND f.date IS NOT NULL
+        ORDER BY f.cartodb_id
+        LIMIT {limit}"""
+
     LATEST = """
         SELECT DISTINCT date 
         FROM forma_api
@@ -105,9 +152,21 @@ def _processResults(action, data):
     return action, data
 
 
-def execute(args):
+def execute(args, snapshot=None):
+    """Execute request args on CartoDB, or on the supplied snapshot if it
+    supports them."""
     args['version'] = 'v1'
-    action, data = CartoDbExecutor.execute(args, FormaSql)
+    if 'breakdown' in args:
+        return CartoDbExecutor.execute_breakdown(
+            args, FormaSql, _processResults)
+    if 'group_by' in args:
+        return CartoDbExecutor.execute_ranking(args, FormaSql)
+    if 'aois' in args:
+        return CartoDbExecutor.execute_aois(args, FormaSql)
+    if snapshot and LocalExecutor.supports(args):
+        action, data = LocalExecutor.execute(args, FormaSql, snapshot)
+    else:
+        action, data = CartoDbExecutor.execute(args, FormaSql)
     if action == 'redirect' or action == 'error':
         return action, data
     return _processResults(action, data)
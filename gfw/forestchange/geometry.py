@@ -0,0 +1,409 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports GeoJSON geometries used in analysis requests."""
+
+import json
+import math
+import numpy
+import re
+
+# Approximate length of one degree of latitude in meters
+METERS_PER_DEGREE = 111320.0
+
+
+def resolution_meters(label):
+    """Return resolution in meters for a META resolution label.
+
+    Example: '500 x 500 meters' => 500, '5 x 5 kilometer' => 5000"""
+    match = re.match(r'\s*([\d.]+)\s*x\s*[\d.]+\s*(kilometer|meter)', label)
+    if not match:
+        return None
+    value, unit = match.groups()
+    return float(value) * (1000 if unit == 'kilometer' else 1)
+
+
+def decimals(meters):
+    """Return number of coordinate decimals finer than supplied meters."""
+    if not meters:
+        return 6
+    return max(0, int(math.ceil(-math.log10(meters / METERS_PER_DEGREE))))
+
+
+def tolerance(meters):
+    """Return simplification tolerance in degrees for a resolution in meters.
+
+    Vertices closer than half a pixel to the simplified outline cannot change
+    which pixels the polygon covers by more than one pixel."""
+    if not meters:
+        return 0.0
+    return meters / 2.0 / METERS_PER_DEGREE
+
+
+def _signed_area(ring):
+    """Return shoelace signed area of ring, positive if counterclockwise."""
+    return sum(x0 * y1 - x1 * y0
+               for (x0, y0), (x1, y1) in zip(ring, ring[1:])) / 2.0
+
+
+def _open_ring(ring, places=None):
+    """Return vertices of ring rounded to places, without consecutive
+    duplicates or the closing vertex."""
+    points = []
+    for coord in ring:
+        point = [coord[0], coord[1]] if places is None else \
+            [round(coord[0], places), round(coord[1], places)]
+        if not points or point != points[-1]:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _canonical_ring(ring, places, ccw):
+    """Return ring rounded to places, oriented and starting at its min vertex.
+
+    Consecutive duplicate vertices created by rounding are dropped. Rings
+    smaller than the precision, that rounding would collapse to fewer than
+    three vertices or to no area, keep their coordinates unrounded."""
+    points = _open_ring(ring, places)
+    if len(points) < 3 or not _signed_area(points + points[:1]):
+        points = _open_ring(ring)
+    if len(points) < 3:
+        return points + points[:1]
+    if (_signed_area(points + points[:1]) > 0) != ccw:
+        points.reverse()
+    start = points.index(min(points))
+    points = points[start:] + points[:start]
+    return points + points[:1]
+
+
+def _canonical_polygon(rings, places):
+    """Return polygon with a counterclockwise shell and sorted clockwise
+    holes."""
+    shell = _canonical_ring(rings[0], places, True)
+    holes = sorted(_canonical_ring(x, places, False) for x in rings[1:])
+    return [shell] + holes
+
+
+def _polygons(geom):
+    """Return list of polygon coordinates for a Polygon or MultiPolygon."""
+    if geom['type'] == 'Polygon':
+        return [geom['coordinates']]
+    return geom['coordinates']
+
+
+def bbox(geom):
+    """Return [west, south, east, north] of supplied geometry dictionary."""
+    points = [point for polygon in _polygons(geom) for ring in polygon
+              for point in ring]
+    xs, ys = [x[0] for x in points], [x[1] for x in points]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def area_ha(geom):
+    """Return approximate area in hectares of supplied geometry dictionary.
+
+    Ring areas in square degrees are scaled by the cosine of the ring's mean
+    latitude, which is accurate enough for areas of interest."""
+    total = 0.0
+    for polygon in _polygons(geom):
+        for index, ring in enumerate(polygon):
+            lat = sum(x[1] for x in ring) / len(ring)
+            area = abs(_signed_area(ring)) * math.cos(math.radians(lat)) * \
+                METERS_PER_DEGREE ** 2
+            total += area if index == 0 else -area
+    return total / 10000.0
+
+
+def vertices(geom):
+    """Return number of vertices in supplied geometry dictionary."""
+    return sum(len(ring) for polygon in _polygons(geom) for ring in polygon)
+
+
+def _simplify_ring(ring, tolerance):
+    """Return closed ring simplified with Douglas-Peucker to tolerance.
+
+    The ring is split at the vertex farthest from its start, then each
+    segment is split at the vertex farthest from its chord while that
+    distance exceeds the tolerance. Distances for a segment are computed for
+    all of its vertices at once. Rings that would collapse below a triangle
+    are returned unchanged."""
+    points = numpy.array(ring, dtype=float)
+    if len(points) <= 4:
+        return ring
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    far = int(numpy.argmax(((points - points[0]) ** 2).sum(axis=1)))
+    keep[far] = True
+    stack = [(0, far), (far, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        dx, dy = b - a
+        length = math.hypot(dx, dy)
+        if length:
+            distance = numpy.abs(
+                dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / length
+        else:
+            distance = numpy.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        index = int(numpy.argmax(distance))
+        if distance[index] > tolerance:
+            index += start + 1
+            keep[index] = True
+            stack.extend([(start, index), (index, end)])
+    if keep.sum() < 4:
+        return ring
+    return points[keep].tolist()
+
+
+def simplify(geom, tolerance):
+    """Return copy of geometry dictionary with rings simplified to tolerance
+    degrees."""
+    polygons = [[_simplify_ring(ring, tolerance) for ring in polygon]
+                for polygon in _polygons(geom)]
+    if geom['type'] == 'Polygon':
+        return dict(type='Polygon', coordinates=polygons[0])
+    return dict(type='MultiPolygon', coordinates=polygons)
+
+
+def _crossings(ring, xs, ys):
+    """Return boolean array, True for the points xs, ys whose ray cast east
+    crosses ring an odd number of times.
+
+    Edges are tested one at a time against all points at once, and the
+    crossing longitude is only computed for points within the latitude span
+    of the edge."""
+    inside = numpy.zeros(len(xs), dtype=bool)
+    ring = [tuple(x[:2]) for x in ring]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+        index = numpy.flatnonzero((ys < y0) != (ys < y1))
+        if not len(index):
+            continue
+        crossing = x0 + (ys[index] - y0) * (x1 - x0) / float(y1 - y0)
+        inside[index[xs[index] < crossing]] ^= True
+    return inside
+
+
+def contains(geom, xs, ys):
+    """Return boolean array, True for the points xs, ys inside geometry
+    dictionary.
+
+    Each polygon only tests the points within the bounding box of its shell,
+    with the even-odd rule over all of its rings so points in holes are
+    outside. Points of a MultiPolygon are inside if any polygon contains
+    them. Points exactly on an edge may fall on either side."""
+    xs = numpy.asarray(xs, dtype=float)
+    ys = numpy.asarray(ys, dtype=float)
+    result = numpy.zeros(len(xs), dtype=bool)
+    for polygon in _polygons(geom):
+        shell = numpy.array(polygon[0], dtype=float)
+        west, south = shell[:, :2].min(axis=0)
+        east, north = shell[:, :2].max(axis=0)
+        index = numpy.flatnonzero(
+            (xs >= west) & (xs <= east) & (ys >= south) & (ys <= north) &
+            ~result)
+        if not len(index):
+            continue
+        inside = numpy.zeros(len(index), dtype=bool)
+        for ring in polygon:
+            inside ^= _crossings(ring, xs[index], ys[index])
+        result[index[inside]] = True
+    return result
+
+
+def _grid_shape(size):
+    """Return (rows, columns) of a global grid of size degree cells."""
+    return int(math.ceil(180.0 / size)), int(math.ceil(360.0 / size))
+
+
+def cell(xs, ys, size):
+    """Return numbers of the cells of a global grid of size degree cells
+    holding the points xs, ys, numbered row by row from the south west."""
+    rows, columns = _grid_shape(size)
+    column = numpy.clip(numpy.floor(
+        (numpy.asarray(xs, dtype=float) + 180.0) / size), 0, columns - 1)
+    row = numpy.clip(numpy.floor(
+        (numpy.asarray(ys, dtype=float) + 90.0) / size), 0, rows - 1)
+    return row.astype('int64') * columns + column.astype('int64')
+
+
+def cover(geom, size):
+    """Return (inside, boundary) sorted numbers of the grid cells, see
+    cell(), of geometry dictionary.
+
+    Edges are split into pieces no longer than a cell, and the cells at the
+    corners of the bounding box of each piece are boundary cells. The other
+    cells within the bounding box of the geometry meet no edge, so each one
+    is entirely inside or outside and is tested by its center."""
+    starts, deltas = [], []
+    for polygon in _polygons(geom):
+        for ring in polygon:
+            ring = numpy.array(ring, dtype=float)[:, :2]
+            ring = numpy.vstack([ring, ring[:1]])
+            starts.append(ring[:-1])
+            deltas.append(ring[1:] - ring[:-1])
+    start, delta = numpy.vstack(starts), numpy.vstack(deltas)
+    pieces = numpy.maximum(
+        numpy.ceil(numpy.abs(delta).max(axis=1) / size), 1).astype('int64')
+    edge = numpy.repeat(numpy.arange(len(pieces)), pieces)
+    step = numpy.arange(pieces.sum()) - numpy.repeat(
+        numpy.cumsum(pieces) - pieces, pieces)
+    a = start[edge] + delta[edge] * (
+        step / pieces[edge].astype(float))[:, None]
+    b = start[edge] + delta[edge] * (
+        (step + 1) / pieces[edge].astype(float))[:, None]
+    low, high = numpy.minimum(a, b), numpy.maximum(a, b)
+    boundary = numpy.unique(numpy.concatenate([
+        cell(low[:, 0], low[:, 1], size), cell(low[:, 0], high[:, 1], size),
+        cell(high[:, 0], low[:, 1], size),
+        cell(high[:, 0], high[:, 1], size)]))
+
+    rows, columns = _grid_shape(size)
+    west, south, east, north = bbox(geom)
+    first, last = cell([west, east], [south, north], size)
+    cells = (numpy.arange(first // columns, last // columns + 1)[:, None] *
+             columns + numpy.arange(first % columns, last % columns + 1))
+    cells = numpy.setdiff1d(cells.ravel(), boundary, assume_unique=True)
+    inside = contains(geom, (cells % columns + 0.5) * size - 180.0,
+                      (cells // columns + 0.5) * size - 90.0)
+    return cells[inside], boundary
+
+
+def _dumps(geom):
+    """Return compact GeoJSON string with sorted keys."""
+    return json.dumps(geom, sort_keys=True, separators=(',', ':'))
+
+
+def _canonical_dict(geom, places):
+    """Return canonical geometry dictionary, see canonical()."""
+    polygons = sorted(
+        _canonical_polygon(x, places) for x in _polygons(geom))
+    if len(polygons) == 1:
+        return dict(type='Polygon', coordinates=polygons[0])
+    return dict(type='MultiPolygon', coordinates=polygons)
+
+
+def canonical(geojson, places=6):
+    """Return canonical GeoJSON string for supplied Polygon or MultiPolygon.
+
+    Coordinates are rounded to places decimals, rings are oriented following
+    the GeoJSON right-hand rule and start at their smallest vertex, and
+    polygons of a MultiPolygon are sorted. A MultiPolygon with one polygon is
+    returned as a Polygon. Equivalent geometries with different whitespace,
+    precision, orientation or starting vertex give the same string."""
+    if isinstance(geojson, Geometry):
+        return geojson.canonical(places)
+    try:
+        geom = json.loads(geojson) if isinstance(geojson, basestring) \
+            else geojson
+        return _dumps(_canonical_dict(geom, places))
+    except (ValueError, TypeError, KeyError, IndexError):
+        return geojson
+
+
+def parse(geojson):
+    """Return Geometry for a GeoJSON string, dictionary or Geometry."""
+    if isinstance(geojson, Geometry):
+        return geojson
+    if isinstance(geojson, basestring):
+        geojson = json.loads(geojson)
+    return Geometry(geojson)
+
+
+def as_dict(geojson):
+    """Return geometry dictionary for a Geometry or GeoJSON string."""
+    if isinstance(geojson, Geometry):
+        return geojson.geom
+    return json.loads(geojson)
+
+
+class Geometry(object):
+    """Parsed Polygon or MultiPolygon with cached derived values.
+
+    Created once when request args are processed and passed through the
+    pipeline in place of the GeoJSON string. Formatting it into an SQL
+    template gives its compact GeoJSON."""
+
+    def __init__(self, geom):
+        self.geom = geom
+        self._cache = {}
+
+    def _cached(self, name, fn, *args):
+        key = (name,) + args
+        if key not in self._cache:
+            self._cache[key] = fn(*args)
+        return self._cache[key]
+
+    @property
+    def type(self):
+        return self.geom.get('type')
+
+    @property
+    def bbox(self):
+        return self._cached('bbox', lambda: bbox(self.geom))
+
+    @property
+    def vertices(self):
+        return self._cached('vertices', lambda: vertices(self.geom))
+
+    @property
+    def area_ha(self):
+        return self._cached('area_ha', lambda: area_ha(self.geom))
+
+    def rounded(self, places=6):
+        """Return canonical Geometry rounded to places decimals."""
+        return self._cached('rounded', lambda x: Geometry(
+            _canonical_dict(self.geom, x)), places)
+
+    def canonical(self, places=6):
+        """Return canonical GeoJSON string, or the geometry dictionary when
+        it is not a valid Polygon or MultiPolygon."""
+        try:
+            return str(self.rounded(places))
+        except (ValueError, TypeError, KeyError, IndexError):
+            return self.geom
+
+    def simplify(self, tolerance):
+        """Return Geometry simplified to tolerance degrees."""
+        return self._cached('simplify', lambda x: Geometry(
+            simplify(self.geom, x)), tolerance)
+
+    def contains(self, xs, ys):
+        """Return boolean array, True for the points xs, ys inside."""
+        return contains(self.geom, xs, ys)
+
+    def cover(self, size):
+        """Return (inside, boundary) grid cells of size degrees."""
+        return self._cached('cover', lambda x: cover(self.geom, x), size)
+
+    def __str__(self):
+        return self._cached('str', lambda: _dumps(self.geom))
+
+    def __eq__(self, other):
+        return isinstance(other, Geometry) and str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(str(self))
@@ -0,0 +1,138 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports storing analysis geometries by id.
+
+A Polygon or MultiPolygon is posted once to /forest-change/geostore and
+analysis requests then reference it with geostore={id} instead of sending the
+GeoJSON with every call."""
+
+import json
+import logging
+import webapp2
+
+from hashlib import md5
+
+from google.appengine.ext import ndb
+
+from gfw.common import CORSRequestHandler
+from gfw.forestchange import args
+from gfw.forestchange import geometry
+
+# Resolutions in meters of the stored simplified variants, those of the
+# datasets in gfw.forestchange.api.META
+RESOLUTIONS = [30, 250, 500, 1000, 5000]
+
+
+class Geostore(ndb.Model):
+    geojson = ndb.TextProperty()
+    simplified = ndb.JsonProperty(compressed=True)
+    bbox = ndb.FloatProperty(repeated=True, indexed=False)
+    area_ha = ndb.FloatProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+def create(geojson):
+    """Store supplied Polygon or MultiPolygon and return Geostore.
+
+    The id is a hash of the canonical GeoJSON, so posting an equivalent
+    geometry again returns the existing entity."""
+    geom = args.process(dict(geojson=geojson))['geojson']
+    try:
+        geom = geom.rounded()
+        bbox, area_ha = geom.bbox, geom.area_ha
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise args.GeoJsonArgError()
+    geojson = str(geom)
+    gid = md5(geojson).hexdigest()
+    geostore = Geostore.get_by_id(gid)
+    if not geostore:
+        simplified = dict((str(x), str(_simplify(geom, x)))
+                          for x in RESOLUTIONS)
+        geostore = Geostore(id=gid, geojson=geojson, simplified=simplified,
+                            bbox=bbox, area_ha=area_ha)
+        geostore.put()
+    return geostore
+
+
+def _simplify(geom, meters):
+    """Return Geometry rounded and simplified to a resolution in meters."""
+    return geom.rounded(geometry.decimals(meters)).simplify(
+        geometry.tolerance(meters))
+
+
+def get_geojson(gid, meters=None):
+    """Return GeoJSON stored under id, simplified to a resolution in meters
+    when that variant exists, or None for an unknown id."""
+    geostore = Geostore.get_by_id(gid)
+    if not geostore:
+        return None
+    return geostore.simplified.get(
+        str(int(meters or 0)), geostore.geojson)
+
+
+def _serialize(geostore):
+    return dict(
+        id=geostore.key.id(), geojson=json.loads(geostore.geojson),
+        bbox=geostore.bbox, area_ha=geostore.area_ha)
+
+
+class Handler(CORSRequestHandler):
+    """Creates and shows stored geometries."""
+
+    def _body(self):
+        """Return JSON request body, or the form args of a form body."""
+        try:
+            return json.loads(self.request.body)
+        except ValueError:
+            return self.args()
+
+    def create(self):
+        try:
+            params = self._body()
+            geojson = params.get('geojson', params) \
+                if isinstance(params, dict) else params
+            self.complete('respond', _serialize(create(geojson)))
+        except args.ArgError, e:
+            logging.exception(e)
+            self.write_error(400, e.message)
+
+    def show(self, gid):
+        geostore = Geostore.get_by_id(gid)
+        if not geostore:
+            self.error(404)
+            return
+        self.complete('respond', _serialize(geostore))
+
+
+handlers = webapp2.WSGIApplication([
+    webapp2.Route(
+        r'/forest-change/geostore',
+        handler=Handler,
+        handler_method='create',
+        methods=['POST']),
+    webapp2.Route(
+        r'/forest-change/geostore',
+        handler=Handler,
+        handler_method='options',
+        methods=['OPTIONS']),
+    webapp2.Route(
+        r'/forest-change/geostore/<gid:[0-9a-f]{32}>',
+        handler=Handler,
+        handler_method='show',
+        methods=['GET'])],
+    debug=True)
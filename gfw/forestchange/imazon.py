@@ -83,6 +83,22 @@ class ImazonSql(Sql):
         GROUP BY data_type"""
 
 
+    ID1_BREAKDOWN = """
+        SELECT p.id_1 AS id1, data_type,
+            SUM(ST_Area(ST_Intersection(
+                i.the_geom_webmercator,
+                p.the_geom_webmercator))/(100*100)) AS value
+            {additional_select}
+        FROM imazon_sad i,
+            (SELECT *
+                FROM gadm2_provinces_simple
+                WHERE iso = UPPER('{iso}')) as p
+        WHERE ST_Intersects(i.the_geom_webmercator, p.the_geom_webmercator)
+            AND i.date >= '{begin}'::date
+            AND i.date <= '{end}'::date
+        GROUP BY p.id_1, data_type
+        ORDER BY p.id_1"""
+
     LATEST = """
         SELECT DISTINCT date 
         FROM imazon_sad
@@ -119,6 +135,10 @@ def _processResults(action, data, args):
 
 
 def execute(args):
+    if 'breakdown' in args:
+        return CartoDbExecutor.execute_breakdown(
+            args, ImazonSql,
+            lambda action, data: _processResults(action, data, data['params']))
     action, data = CartoDbExecutor.execute(args, ImazonSql)
     if action == 'redirect' or action == 'error':
         return action, data
@@ -19,10 +19,16 @@
 
 from gfw.forestchange.common import CartoDbExecutor
 from gfw.forestchange.common import Sql
+from gfw.forestchange.snapshot import LocalExecutor
 
 
 class QuiccSql(Sql):
 
+    DATE_COLUMN = 'pt.date'
+
+    ALERTS_TABLE = 'quicc_alerts'
+    ALERTS_ALIAS = 'pt'
+
     WORLD = """
         SELECT COUNT(pt.*) AS value
             {additional_select}
@@ -72,6 +78,52 @@ class QuiccSql(Sql):
             AND pt.date >= '{begin}'::date
             AND pt.date <= '{end}'::date"""
 
+    ID1_BREAKDOWN = """
+        SELECT p.id_1 AS id1, COUNT(pt.*) AS value
+            {additional_select}
+        FROM (SELECT id_1, the_geom FROM gadm2_provinces_simple
+              WHERE iso = UPPER('{iso}')) as p
+        LEFT JOIN quicc_alerts pt
+            ON ST_Intersects(pt.the_geom, p.the_geom)
+               AND pt.date >= '{begin}'::date
+               AND pt.date <= '{end}'::date
+        GROUP BY p.id_1
+        ORDER BY p.id_1
+        """
+
+    GROUP_BY_ISO = """
+        SELECT p.iso, COUNT(pt.*) AS value
+        FROM quicc_alerts pt, gadm2_countries_simple p
+        WHERE ST_Intersects(pt.the_geom, p.the_geom)
+            AND pt.date >= '{begin}'::date
+            AND pt.date <= '{end}'::date
+        GROUP BY p.iso
+        ORDER BY value DESC, iso
+        {limit}"""
+
+    EXPORT = """
+        SELECT pt.cartodb_id,
+               pt.date::date - '1970-01-01'::date AS day,
+               ST_Y(pt.the_geom) AS lat,
+               ST_X(pt.the_geom) AS lon,
+               COALESCE((
+                   SELECT UPPER(c.iso)
+                   FROM gadm2_countries_simple c
+                   WHERE ST_Intersects(pt.the_geom, c.the_geom)
+                   LIMIT 1), '') AS iso,
+               -1 AS gadm2,
+               COALESCE((
+                   SELECT p.id_1
+                   FROM gadm2_provinces_simple p
+                   WHERE ST_Intersects(pt.the_geom, p.the_geom)
+                   LIMIT 1), -1) AS id1,
+               TRUE AS alert
+        FROM quicc_alerts pt
+        WHERE pt.cartodb_id > {after}
+              AND pt.date IS NOT NULL
+        ORDER BY pt.cartodb_id
+        LIMIT {limit}"""
+
     LATEST = """
         SELECT DISTINCT date 
         FROM quicc_alerts
@@ -103,8 +155,20 @@ def _processResults(action, data):
     return action, data
 
 
-def execute(args):
-    action, data = CartoDbExecutor.execute(args, QuiccSql)
+def execute(args, snapshot=None):
+    """Execute request args on CartoDB, or on the supplied snapshot if it
+    supports them."""
+    if 'breakdown' in args:
+        return CartoDbExecutor.execute_breakdown(
+            args, QuiccSql, _processResults)
+    if 'group_by' in args:
+        return CartoDbExecutor.execute_ranking(args, QuiccSql)
+    if 'aois' in args:
+        return CartoDbExecutor.execute_aois(args, QuiccSql)
+    if snapshot and LocalExecutor.supports(args):
+        action, data = LocalExecutor.execute(args, QuiccSql, snapshot)
+    else:
+        action, data = CartoDbExecutor.execute(args, QuiccSql)
     if action == 'redirect' or action == 'error':
         return action, data
     return _processResults(action, data)
@@ -0,0 +1,462 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports counting alerts on local columnar snapshots.
+
+A snapshot is a copy of the alert points of a dataset at one data version,
+stored as one NumPy array file per column next to a meta.json file:
+
+    day    int32    days since 1970-01-01
+    lat    float32  latitude
+    lon    float32  longitude
+    iso    int16    index into the iso codes in meta.json
+    gadm2  int32    gadm2 objectid, -1 if unknown
+    id1    int16    gadm2 id_1, -1 if unknown
+    alert  bool     True if the point passes the ALERTS_FILTER of the dataset
+
+Points are sorted by day, so the points of a period are a contiguous slice
+found with two binary searches, and filters only run on that slice. The
+prefix.npy file holds per iso and per day prefix sums of the alert point
+counts, so national counts of any period take two lookups.
+
+GeoJSON counts use a uniform grid index. grid.npy holds the cell and day of
+every point as cell * DAY_SPAN + day, sorted, and grid_order.npy the points
+in that order. Points of a cell within a period are then a contiguous range
+found with two binary searches. Cells entirely inside the polygons are
+counted from their ranges without testing their points, only the points of
+cells crossed by an edge are tested against the polygons. Like the WORLD
+queries, GeoJSON counts include points that are not alerts.
+
+Snapshots are memory-mapped read-only, once per process, and shared by all
+threads of the instance. National, subnational and GeoJSON counts are
+computed on the snapshot while its version is the current data version of
+the dataset. Other requests, and all requests while the snapshot is stale
+or missing, run on CartoDB. See gfw.console.snapshot to export snapshots
+and benchmark them."""
+
+import collections
+import datetime
+import json
+import logging
+import numpy
+import os
+import shutil
+import threading
+import time
+
+from hashlib import md5
+
+from appengine_config import runtime_config
+from gfw import cdb
+from gfw.forestchange import geometry
+from gfw.forestchange.common import CartoDbExecutor
+from gfw.forestchange.common import DEFAULT_BEGIN
+from gfw.forestchange.common import DEFAULT_END
+from gfw.forestchange.common import _bucket_start
+from gfw.forestchange.common import classify_query
+from gfw.forestchange.common import get_download_urls
+
+# Directory with a directory per dataset, holding a directory per version
+SNAPSHOT_DIR = runtime_config.get('snapshot_dir') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'snapshots')
+
+# Column names and types of snapshots
+COLUMNS = [
+    ('day', 'int32'),
+    ('lat', 'float32'),
+    ('lon', 'float32'),
+    ('iso', 'int16'),
+    ('gadm2', 'int32'),
+    ('id1', 'int16'),
+    ('alert', 'bool')
+]
+
+# Size of the grid cells of the spatial index (degrees)
+GRID_DEGREES = 0.25
+
+# Days per grid cell in grid index keys
+DAY_SPAN = 2 ** 16
+
+# Rows per export query
+EXPORT_PAGE_SIZE = 50000
+
+# Maximum bytes of snapshots mapped by a process
+MEMORY_BUDGET = int(runtime_config.get('snapshot_budget_mb') or 512) * 2 ** 20
+
+EPOCH = datetime.date(1970, 1, 1)
+
+# Maps dataset name to its mapped snapshot, least recently used first
+_snapshots = collections.OrderedDict()
+
+# How long a process waits before looking for a missing snapshot again
+# (seconds)
+MISSING_TTL = 5 * 60
+
+# Maps dataset name to (version, expires) of a missing snapshot
+_missing = {}
+
+_lock = threading.Lock()
+
+
+def _day(value):
+    """Return day number of a YYYY-MM-DD date."""
+    date = datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return (date - EPOCH).days
+
+
+def _date(day):
+    """Return day number as a date formatted like CartoDB dates."""
+    return '%sT00:00:00Z' % (EPOCH + datetime.timedelta(days=int(day)))
+
+
+def _count(days, begin, end):
+    """Return number of sorted days between begin and end dates, inclusive."""
+    return int(numpy.searchsorted(days, _day(end), 'right') -
+               numpy.searchsorted(days, _day(begin), 'left'))
+
+
+def _prefix(days, codes, count):
+    """Return (first day, prefix) of sorted days and their iso codes.
+
+    prefix[code, k] is the number of points of code before first day + k."""
+    if not len(days):
+        return 0, numpy.zeros((count, 1), dtype='int32')
+    first = int(days[0])
+    width = int(days[-1]) - first + 1
+    counts = numpy.bincount(
+        codes.astype('int64') * width + (days - first),
+        minlength=count * width).reshape(count, width)
+    prefix = numpy.zeros((count, width + 1), dtype='int32')
+    numpy.cumsum(counts, axis=1, out=prefix[:, 1:])
+    return first, prefix
+
+
+def _ranges(lower, upper):
+    """Return concatenated ranges of positions from lower to upper."""
+    lengths = upper - lower
+    offsets = numpy.cumsum(lengths) - lengths
+    return numpy.repeat(lower - offsets, lengths) + \
+        numpy.arange(lengths.sum())
+
+
+def _histogram_rows(days, bucket):
+    """Return bucket and value rows like those of a histogram query."""
+    if not days.size:
+        return []
+    first = int(days.min())
+    counts = numpy.bincount(days - first)
+    buckets = {}
+    for offset in numpy.flatnonzero(counts):
+        date = EPOCH + datetime.timedelta(days=first + int(offset))
+        start = _bucket_start(date, bucket)
+        buckets[start] = buckets.get(start, 0) + int(counts[offset])
+    return [dict(bucket=_date((start - EPOCH).days), value=value)
+            for start, value in sorted(buckets.iteritems())]
+
+
+class Snapshot(object):
+    """Alert point columns of a dataset at one data version."""
+
+    def __init__(self, dataset, version, isos, columns, first=None,
+                 prefix=None, grid=None, order=None, degrees=GRID_DEGREES):
+        self.dataset = dataset
+        self.version = version
+        self.isos = isos
+        self.columns = columns
+        self.first = first
+        self.prefix = prefix
+        self.grid = grid
+        self.order = order
+        self.degrees = degrees
+        self._codes = dict((iso, code) for code, iso in enumerate(isos))
+
+    @property
+    def nbytes(self):
+        return self.prefix.nbytes + self.grid.nbytes + self.order.nbytes + \
+            sum(x.nbytes for x in self.columns.itervalues())
+
+    @classmethod
+    def path(cls, dataset, version, root=None):
+        """Return directory of the snapshot of dataset at version."""
+        key = md5(version.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(root or SNAPSHOT_DIR, dataset, key)
+
+    @classmethod
+    def load(cls, dataset, version, root=None):
+        """Return read-only memory-mapped snapshot of dataset at version
+        stored under root, or None if it is missing or cannot be loaded."""
+        path = cls.path(dataset, version, root)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            columns = dict(
+                (name, numpy.load(
+                    os.path.join(path, '%s.npy' % name), mmap_mode='r'))
+                for name, dtype in COLUMNS)
+            index = dict(
+                (name, numpy.load(
+                    os.path.join(path, '%s.npy' % name), mmap_mode='r'))
+                for name in ['prefix', 'grid', 'grid_order'])
+            return cls(dataset, meta['version'], meta['isos'], columns,
+                       meta['first'], index['prefix'], index['grid'],
+                       index['grid_order'], meta['grid_degrees'])
+        except IOError, e:
+            logging.info('No %s snapshot: %s' % (dataset, e))
+        except Exception, e:
+            # Partial or old-format snapshots are not used
+            logging.warning('Invalid %s snapshot: %s' % (dataset, e))
+        return None
+
+    def save(self, root=None):
+        """Sort points by day, index them by iso and by grid cell and store
+        snapshot under root.
+
+        Files are written to a temporary directory that is renamed into
+        place, so a process never maps a partially written snapshot."""
+        order = numpy.argsort(self.columns['day'], kind='mergesort')
+        self.columns = dict(
+            (name, numpy.asarray(self.columns[name], dtype=dtype)[order])
+            for name, dtype in COLUMNS)
+        alert = self.columns['alert']
+        self.first, self.prefix = _prefix(
+            self.columns['day'][alert], self.columns['iso'][alert],
+            len(self.isos))
+        cells = geometry.cell(
+            self.columns['lon'], self.columns['lat'], self.degrees)
+        self.order = numpy.argsort(cells, kind='mergesort').astype('int32')
+        self.grid = cells[self.order] * DAY_SPAN + \
+            self.columns['day'][self.order]
+        path = self.path(self.dataset, self.version, root)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        os.makedirs(tmp)
+        for name, dtype in COLUMNS:
+            numpy.save(os.path.join(tmp, '%s.npy' % name), self.columns[name])
+        numpy.save(os.path.join(tmp, 'prefix.npy'), self.prefix)
+        numpy.save(os.path.join(tmp, 'grid.npy'), self.grid)
+        numpy.save(os.path.join(tmp, 'grid_order.npy'), self.order)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(dict(version=self.version, isos=self.isos,
+                           first=self.first, grid_degrees=self.degrees,
+                           count=len(self.columns['day'])), f)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+
+    def period(self, begin, end):
+        """Return slice of the points between begin and end dates."""
+        days = self.columns['day']
+        return slice(numpy.searchsorted(days, _day(begin), 'left'),
+                     numpy.searchsorted(days, _day(end), 'right'))
+
+    def _within(self, geojson, begin, end):
+        """Return (lower, upper, points) of the points in geojson between
+        begin and end dates.
+
+        The points of the cells inside geojson are the grid ranges from lower
+        to upper, points holds the other points inside geojson."""
+        geom = geometry.parse(geojson)
+        inside, boundary = geom.cover(self.degrees)
+        begin = min(max(_day(begin), 0), DAY_SPAN - 1)
+        end = min(max(_day(end), 0), DAY_SPAN - 1)
+        bounds = lambda cells: (
+            numpy.searchsorted(self.grid, cells * DAY_SPAN + begin, 'left'),
+            numpy.searchsorted(self.grid, cells * DAY_SPAN + end, 'right'))
+        points = self.order[_ranges(*bounds(boundary))]
+        mask = geom.contains(
+            self.columns['lon'][points], self.columns['lat'][points])
+        lower, upper = bounds(inside)
+        return lower, upper, points[mask]
+
+    def within(self, geojson, begin, end):
+        """Return sorted days of the points in geojson between begin and end
+        dates."""
+        lower, upper, points = self._within(geojson, begin, end)
+        return numpy.sort(numpy.concatenate([
+            (self.grid[_ranges(lower, upper)] % DAY_SPAN).astype('int32'),
+            self.columns['day'][points]]))
+
+    def count_within(self, geojson, begin, end):
+        """Return number of points in geojson between begin and end dates."""
+        lower, upper, points = self._within(geojson, begin, end)
+        return int((upper - lower).sum()) + len(points)
+
+    def select(self, args, begin, end):
+        """Return sorted days of the points in the geojson, or of the alert
+        points in the iso or id1, of args between begin and end dates."""
+        if classify_query(args) == 'world':
+            return self.within(args['geojson'], begin, end)
+        period = self.period(begin, end)
+        code = self._codes.get(args['iso'].upper())
+        if code is None:
+            return numpy.zeros(0, dtype='int32')
+        mask = self.columns['alert'][period] & \
+            (self.columns['iso'][period] == code)
+        if 'id1' in args:
+            mask &= self.columns['id1'][period] == int(args['id1'])
+        return self.columns['day'][period][mask]
+
+    def count(self, iso, begin, end):
+        """Return number of alert points of iso between begin and end dates
+        from the prefix sums."""
+        code = self._codes.get(iso.upper())
+        if code is None:
+            return 0
+        width = self.prefix.shape[1] - 1
+        lower = min(max(_day(begin) - self.first, 0), width)
+        upper = min(max(_day(end) - self.first + 1, 0), width)
+        if upper <= lower:
+            return 0
+        return int(self.prefix[code, upper] - self.prefix[code, lower])
+
+    def rows(self, args, sql):
+        """Return the rows CartoDB returns for the count query of sql."""
+        if sql.is_comparison(args):
+            periods = args['compare']
+        else:
+            periods = [dict(begin=args.get('begin', DEFAULT_BEGIN),
+                            end=args.get('end', DEFAULT_END))]
+        histogram = sql.is_histogram(args)
+        query_type = classify_query(args)
+        if query_type == 'id1' or histogram or args.get('alert_query'):
+            days = self.select(args, min(x['begin'] for x in periods),
+                               max(x['end'] for x in periods))
+            counts = [_count(days, x['begin'], x['end']) for x in periods]
+        elif query_type == 'world':
+            geojson = geometry.parse(args['geojson'])
+            counts = [self.count_within(geojson, x['begin'], x['end'])
+                      for x in periods]
+        else:
+            counts = [self.count(args['iso'], x['begin'], x['end'])
+                      for x in periods]
+        if sql.is_comparison(args):
+            return [dict(('period_%d' % index, value)
+                         for index, value in enumerate(counts))]
+        if histogram:
+            return _histogram_rows(days, args['bucket'])
+        row = dict(value=counts[0])
+        if args.get('alert_query'):
+            row['min_date'] = _date(days[0]) if len(days) else None
+            row['max_date'] = _date(days[-1]) if len(days) else None
+        return [row]
+
+
+def _evict(budget):
+    """Unmap least recently used snapshots until they fit in budget."""
+    while len(_snapshots) > 1 and \
+            sum(x.nbytes for x in _snapshots.itervalues()) > budget:
+        dataset, snapshot = _snapshots.popitem(last=False)
+        logging.info('Evicted %s snapshot %s' % (dataset, snapshot.version))
+
+
+def get(dataset, version):
+    """Return snapshot of dataset at version, or None.
+
+    The first request for a new version maps its snapshot and replaces the
+    previous one in a single assignment, requests that hold the previous
+    snapshot finish with it. Snapshots are loaded outside the lock, so a
+    cold load does not block requests for mapped snapshots. Snapshots
+    larger than MEMORY_BUDGET are not used."""
+    if not version:
+        return None
+    with _lock:
+        snapshot = _snapshots.get(dataset)
+        if snapshot and snapshot.version == version:
+            _snapshots[dataset] = _snapshots.pop(dataset)
+            return snapshot
+        missing, expires = _missing.get(dataset, (None, 0))
+        if missing == version and time.time() <= expires:
+            return None
+    snapshot = Snapshot.load(dataset, version)
+    if snapshot and snapshot.nbytes > MEMORY_BUDGET:
+        logging.warning('%s snapshot exceeds memory budget' % dataset)
+        snapshot = None
+    with _lock:
+        current = _snapshots.pop(dataset, None)
+        if current and current.version == version:
+            snapshot = current
+        if not snapshot:
+            _missing[dataset] = (version, time.time() + MISSING_TTL)
+            return None
+        _snapshots[dataset] = snapshot
+        _evict(MEMORY_BUDGET)
+        return snapshot
+
+
+def export(dataset, sql, version, root=None, page_size=EXPORT_PAGE_SIZE):
+    """Export the alert points of dataset from CartoDB into a snapshot at
+    version, stored under root. Returns the snapshot.
+
+    Pages through the EXPORT query of sql by cartodb_id."""
+    if not sql.EXPORT:
+        raise ValueError('No snapshot export for %s' % dataset)
+    values = dict((name, []) for name, dtype in COLUMNS)
+    codes = {}
+    after = 0
+    while True:
+        response = cdb.execute(sql.EXPORT.format(after=after, limit=page_size))
+        if response.status_code != 200:
+            raise ValueError('CartoDB Error: %s' % response.content)
+        rows = json.loads(response.content)['rows']
+        for row in rows:
+            row['iso'] = codes.setdefault(row['iso'], len(codes))
+            for name, dtype in COLUMNS:
+                values[name].append(row[name])
+        if len(rows) < page_size:
+            break
+        after = rows[-1]['cartodb_id']
+    columns = dict(
+        (name, numpy.array(values[name], dtype=dtype))
+        for name, dtype in COLUMNS)
+    snapshot = Snapshot(
+        dataset, version, sorted(codes, key=codes.get), columns)
+    snapshot.save(root)
+    return snapshot
+
+
+class LocalExecutor(CartoDbExecutor):
+    """Executes count requests on a snapshot with the responses of
+    CartoDbExecutor."""
+
+    @classmethod
+    def supports(cls, args):
+        """Return True if args can be counted on a snapshot."""
+        query_type = classify_query(args)
+        if query_type == 'world' and not args.get('geojson'):
+            return False
+        return query_type in ['iso', 'id1', 'world'] and 'format' not in args
+
+    @classmethod
+    def execute(cls, args, sql, snapshot):
+        try:
+            query, download_query = sql.process(args)
+            response = {}
+            rows = snapshot.rows(args, sql)
+            if rows:
+                response['rows'] = rows
+            cls._params_response(response, args, query)
+            if 'dev' in args:
+                response['dev']['snapshot'] = snapshot.version
+            if sql.is_comparison(args):
+                cls._comparison_response(response, args)
+            elif sql.is_histogram(args):
+                cls._histogram_response(response, args)
+            response['download_urls'] = get_download_urls(
+                download_query, args)
+            return 'respond', response
+        except Exception, e:
+            return 'execute() error', e
@@ -21,11 +21,17 @@ import arrow
 
 from gfw.forestchange.common import CartoDbExecutor
 from gfw.forestchange.common import Sql
+from gfw.forestchange.snapshot import LocalExecutor
 
 class TerraiSql(Sql):
 
     MIN_MAX_DATE_SQL = ", MIN(date) as min_date, MAX(date) as max_date"
 
+    DATE_COLUMN = 'f.date'
+
+    ALERTS_TABLE = 'latin_decrease_current_points'
+    ALERTS_ALIAS = 'f'
+
     WORLD = """
         SELECT 
             COUNT(f.*) AS value
@@ -83,6 +89,53 @@ class TerraiSql(Sql):
               AND date <= '{end}'::date
         """
 
+    ID1_BREAKDOWN = """
+        SELECT
+            p.id_1 AS id1,
+            COUNT(f.*) AS value
+            {additional_select}
+        FROM (SELECT id_1, st_simplify (the_geom, 0.0001) as the_geom
+              FROM gadm2_provinces_simple
+              WHERE iso = UPPER('{iso}')) p
+        LEFT JOIN latin_decrease_current_points f
+            ON ST_Intersects(f.the_geom, p.the_geom)
+               AND date >= '{begin}'::date
+               AND date <= '{end}'::date
+        GROUP BY p.id_1
+        ORDER BY p.id_1
+        """
+
+    GROUP_BY_ISO = """
+        SELECT
+            UPPER(iso) AS iso,
+            COUNT(f.*) AS value
+        FROM latin_decrease_current_points f
+        WHERE date >= '{begin}'::date
+            AND date <= '{end}'::date
+            AND f.iso IS NOT NULL
+        GROUP BY UPPER(iso)
+        ORDER BY value DESC, iso
+        {limit}"""
+
+    EXPORT = """
+        SELECT f.cartodb_id,
+               f.date::date - '1970-01-01'::date AS day,
+               ST_Y(f.the_geom) AS lat,
+               ST_X(f.the_geom) AS lon,
+               COALESCE(UPPER(f.iso), '') AS iso,
+               -1 AS gadm2,
+               COALESCE((
+                   SELECT p.id_1
+                   FROM gadm2_provinces_simple p
+                   WHERE ST_Intersects(f.the_geom, p.the_geom)
+                   LIMIT 1), -1) AS id1,
+               TRUE AS alert
+        FROM latin_decrease_current_points f
+        WHERE f.cartodb_id > {after}
+              AND f.date IS NOT NULL
+        ORDER BY f.cartodb_id
+        LIMIT {limit}"""
+
     LATEST = """
         SELECT DISTINCT
             grid_code,
@@ -124,9 +177,21 @@ def _gridCodeToDate(grid_code):
     else:
         return None
 
-def execute(args):
+def execute(args, snapshot=None):
+    """Execute request args on CartoDB, or on the supplied snapshot if it
+    supports them."""
     args['version'] = 'v2'
-    action, data = CartoDbExecutor.execute(args, TerraiSql)
+    if 'breakdown' in args:
+        return CartoDbExecutor.execute_breakdown(
+            args, TerraiSql, _processResults)
+    if 'group_by' in args:
+        return CartoDbExecutor.execute_ranking(args, TerraiSql)
+    if 'aois' in args:
+        return CartoDbExecutor.execute_aois(args, TerraiSql)
+    if snapshot and LocalExecutor.supports(args):
+        action, data = LocalExecutor.execute(args, TerraiSql, snapshot)
+    else:
+        action, data = CartoDbExecutor.execute(args, TerraiSql)
     if action == 'redirect' or action == 'error':
         return action, data
     return _processResults(action, data)
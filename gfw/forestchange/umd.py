@@ -17,15 +17,21 @@
 
 """This module supports accessing UMD data."""
 
-import json
 import ee
 import logging
 import config
 
+from gfw.forestchange import geometry
 from gfw.forestchange.common import CartoDbExecutor
 from gfw.forestchange.common import Sql
 from gfw.forestchange.common import classify_query
 
+# Default forest cover threshold
+DEFAULT_THRESH = 10
+
+# Scale of the Earth Engine reductions in meters
+SCALE = 90
+
 
 def _get_coords(geojson):
     return geojson.get('coordinates')
@@ -74,6 +80,12 @@ def _get_region(geom):
     return region
 
 
+def _simplify(geom):
+    """Return Geometry rounded and simplified to the reduction scale."""
+    return geom.rounded(geometry.decimals(SCALE)).simplify(
+        geometry.tolerance(SCALE))
+
+
 def _ee(geom, thresh, asset_id):
     image = _get_thresh_image(thresh, asset_id)
     region = _get_region(geom)
@@ -83,7 +95,7 @@ def _ee(geom, thresh, asset_id):
         'reducer': ee.Reducer.sum(),
         'geometry': region,
         'bestEffort': True,
-        'scale': 90
+        'scale': SCALE
     }
 
     # Calculate stats
@@ -240,7 +252,7 @@ def _execute_geojson(args):
 
     # The forest cover threshold and polygon
     thresh = str(args.get('thresh'))
-    geojson = json.loads(args.get('geojson'))
+    geojson = geometry.as_dict(args.get('geojson'))
 
     # hansen_all_thresh
     hansen_all = _ee(geojson, thresh, config.assets['hansen_all_thresh'])
@@ -262,8 +274,14 @@ def _execute_geojson(args):
 
     # Prepare result object
     result = {}
+    if 'simplified' in args:
+        result['dev'] = args.pop('simplified')
+    requested = args.pop('requested_geojson', None)
     result['params'] = args
-    result['params']['geojson'] = json.loads(result['params']['geojson'])
+    if 'geostore' in args:
+        result['params'].pop('geojson')
+    else:
+        result['params']['geojson'] = geometry.as_dict(requested or geojson)
     result['gain'] = gain
     result['loss'] = loss
     result['tree-extent'] = tree_extent
@@ -280,7 +298,7 @@ def _executeWdpa(args):
     data.pop('rows')
     data.pop('download_urls')
     if rows:
-        args['geojson'] = rows[0]['geojson']
+        args['geojson'] = _simplify(geometry.parse(rows[0]['geojson']))
         args['begin'] = args['begin'] if 'begin' in args else '2001-01-01'
         args['end'] = args['end'] if 'end' in args else '2013-01-01'
         action, data = _execute_geojson(args)
@@ -297,7 +315,7 @@ def _executeUse(args):
     data.pop('rows')
     data.pop('download_urls')
     if rows:
-        args['geojson'] = rows[0]['geojson']
+        args['geojson'] = _simplify(geometry.parse(rows[0]['geojson']))
         args['begin'] = args['begin'] if 'begin' in args else '2001-01-01'
         args['end'] = args['end'] if 'end' in args else '2013-01-01'
         action, data = _execute_geojson(args)
@@ -315,7 +333,7 @@ def execute(args):
 
     # Set default threshold
     if not 'thresh' in args:
-        args['thresh'] = 10
+        args['thresh'] = DEFAULT_THRESH
 
     if query_type == 'iso':
         return _executeIso(args)
@@ -0,0 +1,128 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports the dataset freshness registry.
+
+A cron job periodically runs the LATEST query of each alert dataset and
+stores the result as the data version of the dataset. Forest change cache
+keys include that version, so cached results can live long and are
+invalidated automatically when new alerts land."""
+
+import json
+import logging
+import time
+import webapp2
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from gfw import cdb
+from gfw.forestchange import warm
+from gfw.forestchange.fires import FiresSql
+from gfw.forestchange.forma import FormaSql
+from gfw.forestchange.imazon import ImazonSql
+from gfw.forestchange.quicc import QuiccSql
+from gfw.forestchange.terrai import TerraiSql
+
+# Maps dataset name to Sql class with a LATEST query
+SQLS = {
+    'forma-alerts': FormaSql,
+    'nasa-active-fires': FiresSql,
+    'quicc-alerts': QuiccSql,
+    'imazon-alerts': ImazonSql,
+    'terrai-alerts': TerraiSql
+}
+
+# Soft TTL for cached results of versioned datasets (seconds)
+TTL = 7 * 24 * 60 * 60
+
+# How long an instance keeps versions before rereading memcache (seconds)
+LOCAL_TTL = 60
+
+# Instance cache of dataset => (version, expires)
+_local = {}
+
+
+class DatasetVersion(ndb.Model):
+    version = ndb.StringProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+def _memcache_key(dataset):
+    return 'dataset-version/%s' % dataset
+
+
+def _version(response):
+    """Return data version from LATEST query response or None."""
+    if response.status_code != 200:
+        return None
+    rows = json.loads(response.content).get('rows')
+    if not rows:
+        return None
+    return '|'.join('%s' % rows[0][x] for x in sorted(rows[0]))
+
+
+def get(dataset):
+    """Return current data version of supplied dataset or None."""
+    version, expires = _local.get(dataset, (None, 0))
+    if time.time() < expires:
+        return version
+    version = memcache.get(_memcache_key(dataset))
+    if version is None and dataset in SQLS:
+        entity = DatasetVersion.get_by_id(dataset)
+        version = entity.version if entity else ''
+        memcache.set(_memcache_key(dataset), version)
+    _local[dataset] = (version or None, time.time() + LOCAL_TTL)
+    return version or None
+
+
+def refresh():
+    """Run LATEST queries and store versions. Returns changed datasets."""
+    datasets = sorted(SQLS)
+    queries = [SQLS[x].process(dict(latest=True, limit=1))[0]
+               for x in datasets]
+    changed = []
+    for dataset, response in zip(datasets, cdb.execute_many(queries)):
+        version = _version(response)
+        if not version:
+            logging.warning('Unable to get %s version: %s' %
+                            (dataset, response.content))
+            continue
+        entity = DatasetVersion.get_by_id(dataset)
+        if entity and entity.version == version:
+            continue
+        DatasetVersion(id=dataset, version=version).put()
+        memcache.set(_memcache_key(dataset), version)
+        changed.append(dataset)
+        logging.info('New %s version %s' % (dataset, version))
+    return changed
+
+
+class Handler(webapp2.RequestHandler):
+    """Cron handler that refreshes dataset versions and warms the cache for
+    datasets with new data."""
+
+    def get(self):
+        changed = refresh()
+        warm.enqueue(changed)
+        self.response.headers["Content-Type"] = "application/json"
+        self.response.out.write(json.dumps(dict(changed=changed)))
+
+
+handlers = webapp2.WSGIApplication([
+    (r'/forest-change/versions', Handler)],
+    debug=True)
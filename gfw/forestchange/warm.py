@@ -0,0 +1,104 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""This module supports warming the cache after a dataset refresh.
+
+Warming a dataset enqueues one task per national and subnational admin
+area URL on the cache-warm queue. Each task simply requests the URL, so the
+regular handler computes and caches the result before the first visitor
+asks for it. The rate and concurrency of the cache-warm queue in queue.yaml
+bound how much CartoDB capacity warming takes from interactive traffic."""
+
+import json
+import logging
+import re
+import webapp2
+
+from google.appengine.api import taskqueue
+
+from gfw import cdb
+
+QUEUE = 'cache-warm'
+
+# Maximum number of tasks per taskqueue add call
+BATCH_SIZE = 100
+
+ADMIN_AREAS = """
+    SELECT iso, id_1
+    FROM gadm_1_all
+    ORDER BY iso, id_1"""
+
+# Maps dataset name to the only countries it covers
+COVERAGE = {
+    'imazon-alerts': ['BRA']
+}
+
+
+def enqueue(datasets):
+    """Enqueue warming jobs for supplied dataset names."""
+    for dataset in datasets:
+        taskqueue.add(url='/forest-change/warm', params=dict(dataset=dataset),
+                      queue_name=QUEUE)
+
+
+def _paths(dataset, rows):
+    """Return national and subnational URL paths for supplied gadm rows."""
+    coverage = COVERAGE.get(dataset)
+    rows = [x for x in rows if not coverage or x['iso'] in coverage]
+    isos = sorted(dict((x['iso'], True) for x in rows))
+    paths = ['/forest-change/%s/admin/%s' % (dataset, iso.lower())
+             for iso in isos]
+    paths += ['/forest-change/%s/admin/%s/%s' %
+              (dataset, x['iso'].lower(), x['id_1']) for x in rows]
+    return paths
+
+
+def warm(dataset):
+    """Enqueue a warming task for every admin area URL of dataset."""
+    response = cdb.execute(ADMIN_AREAS)
+    if response.status_code != 200:
+        raise Exception('CartoDB Error: %s' % response.content)
+    rows = json.loads(response.content)['rows']
+    tasks = [taskqueue.Task(url=path, method='GET')
+             for path in _paths(dataset, rows)]
+    queue = taskqueue.Queue(QUEUE)
+    for i in range(0, len(tasks), BATCH_SIZE):
+        queue.add(tasks[i:i + BATCH_SIZE])
+    logging.info('Enqueued %s %s warming tasks' % (len(tasks), dataset))
+    return len(tasks)
+
+
+class Handler(webapp2.RequestHandler):
+    """Handler that starts (GET) or runs (POST task) cache warming."""
+
+    def get(self):
+        datasets = self.request.get_all('dataset')
+        enqueue(datasets)
+        self.response.headers["Content-Type"] = "application/json"
+        self.response.out.write(json.dumps(dict(enqueued=datasets)))
+
+    def post(self):
+        dataset = self.request.get('dataset')
+        if not re.match(r'^[a-z-]+$', dataset):
+            self.error(400)
+            return
+        self.response.out.write(json.dumps(dict(tasks=warm(dataset))))
+
+
+handlers = webapp2.WSGIApplication([
+    (r'/forest-change/warm', Handler)],
+    debug=True)
@@ -20,6 +20,8 @@
 import json
 from appengine_config import runtime_config
 from gfw import cdb
+from gfw.common import etag_matches
+from gfw.common import get_etag
 import datetime
 
 # API
@@ -169,6 +171,12 @@ class BaseApi(webapp2.RequestHandler):
         self.response.headers["Content-Type"] = "application/json"
         if error:
             self.response.set_status(400)
+        if data and self.response.status_int == 200:
+            etag = get_etag(data)
+            self.response.headers['ETag'] = etag
+            if etag_matches(self.request, etag):
+                self.response.set_status(304)
+                return
         if not data:
             self.response.out.write('')
         else:
@@ -25,6 +25,7 @@ from google.appengine.ext import testbed
 
 from google.appengine.api import apiproxy_stub
 from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
 
 
 CDB_URL = 'http://wri-01.cartodb.com/api/v2/sql?%s'
@@ -83,6 +84,10 @@ class FetchBaseTest(unittest.TestCase):
         self.testbed.init_blobstore_stub()
         self.mail_stub = self.testbed.get_stub(testbed.MAIL_SERVICE_NAME)
 
+        # The testbed is not deactivated, so drop entities cached in the
+        # ndb context by earlier tests
+        ndb.get_context().clear_cache()
+
     def setResponse(self, **kwargs):
         """Set the return value."""
         self._mock.set_return_values(kwargs)
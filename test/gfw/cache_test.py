@@ -0,0 +1,105 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.cache"""
+
+from test import common
+
+import os
+import unittest
+
+import mock
+
+from google.appengine.api import memcache
+
+from gfw import cache
+
+
+class CacheTest(common.BaseTest):
+
+    def setUp(self):
+        super(CacheTest, self).setUp()
+        del cache._indexed[:]
+        self.key = '/forest-change/forma-alerts/admin/bra/1234'
+
+    def test_dataset(self):
+        self.assertEqual('forma-alerts', cache._dataset(self.key))
+        self.assertEqual('countries', cache._dataset('/countries/bra/1234'))
+
+    def test_small_value(self):
+        value = ('respond', dict(value=9870, params=dict(iso='bra')))
+        self.assertTrue(cache.set(self.key, value))
+        self.assertEqual(value, cache.get(self.key))
+        self.assertIn('data', memcache.get(self.key))
+
+    def test_chunked_value(self):
+        value = os.urandom(3 * cache.CHUNK_SIZE)  # Incompressible
+        self.assertTrue(cache.set(self.key, value))
+        manifest = memcache.get(self.key)
+        self.assertEqual(4, manifest['chunks'])
+        self.assertEqual(value, cache.get(self.key))
+
+    def test_corrupt_chunk(self):
+        cache.set(self.key, os.urandom(2 * cache.CHUNK_SIZE))
+        chunk_key = cache._chunk_keys(self.key, memcache.get(self.key))[0]
+        memcache.set(chunk_key, 'oops')
+        self.assertIsNone(cache.get(self.key))
+        memcache.delete(chunk_key)
+        self.assertIsNone(cache.get(self.key))
+
+    def test_missing_and_legacy(self):
+        self.assertIsNone(cache.get(self.key))
+        memcache.set(self.key, ('respond', {}))
+        self.assertIsNone(cache.get(self.key))
+
+    def test_stats(self):
+        cache.set(self.key, 'x' * 10000)
+        stats = cache.get_stats()['forma-alerts']
+        self.assertEqual(1, stats['values'])
+        self.assertTrue(stats['raw_bytes'] > stats['packed_bytes'])
+        self.assertTrue(stats['compression_ratio'] > 1)
+
+    def test_index(self):
+        self.assertTrue(cache._index('forma-alerts'))
+
+        # Another instance indexes a dataset between gets and cas
+        client = memcache.Client()
+        gets = client.gets
+        def f(key, **kwargs):
+            value = gets(key, **kwargs)
+            if value == ['forma-alerts']:
+                memcache.set(key, value + ['quicc-alerts'], **kwargs)
+            return value
+        with mock.patch.object(memcache, 'Client', return_value=client):
+            with mock.patch.object(client, 'gets', side_effect=f):
+                self.assertTrue(cache._index('terrai-alerts'))
+        self.assertEqual(
+            ['forma-alerts', 'quicc-alerts', 'terrai-alerts'],
+            memcache.get('datasets', namespace=cache.STATS_NAMESPACE))
+
+    def test_hit_rates(self):
+        cache.record_lookup(self.key, False, 'raw1')
+        cache.record_lookup(self.key, True, 'raw2')
+        cache.record_lookup(self.key, True, 'raw2')
+        cache.record_lookup(self.key, True, 'raw3')
+        stats = cache.get_stats()['forma-alerts']
+        self.assertEqual(4, stats['lookups'])
+        self.assertEqual(0.75, stats['hit_rate'])
+        self.assertEqual(0.25, stats['raw_hit_rate'])
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
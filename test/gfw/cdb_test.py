@@ -0,0 +1,47 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.cdb"""
+
+from test import common
+
+import json
+import unittest
+
+from gfw import cdb
+
+
+class ExecuteManyTest(common.FetchBaseTest):
+
+    def test_execute_many(self):
+        self.setResponse(content='{"rows":[{"value":1}]}', status_code=200)
+        queries = [
+            'SELECT 1',
+            ('SELECT 2', dict(format='topojson')),
+            'SELECT 3']
+        responses = cdb.execute_many(queries)
+        self.assertEqual(3, len(responses))
+        for response in responses:
+            self.assertEqual(200, response.status_code)
+            self.assertEqual([{'value': 1}],
+                             json.loads(response.content)['rows'])
+
+    def test_execute_many_empty(self):
+        self.assertEqual([], cdb.execute_many([]))
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,254 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.common"""
+
+from test import common
+
+import os
+import time
+import unittest
+import webapp2
+
+import mock
+
+from hashlib import md5
+
+from google.appengine.api import memcache
+
+from gfw import cache
+from gfw import common as gfw_common
+from gfw.common import CORSRequestHandler
+from gfw.forestchange import geometry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+class Target(object):
+    """Fake dataset module that counts executions."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def execute(self, args):
+        self.calls += 1
+        return 'respond', dict(value=self.calls)
+
+
+class GetOrExecuteTest(common.BaseTest):
+
+    def setUp(self):
+        super(GetOrExecuteTest, self).setUp()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.taskqueue_stub = self.testbed.get_stub('taskqueue')
+        self.target = Target()
+        self.path = '/forest-change/forma-alerts/admin/bra'
+        self.rid = '%s/1234' % self.path
+        request = webapp2.Request.blank(self.path)
+        self.handler = CORSRequestHandler(request, webapp2.Response())
+
+    def test_miss_then_hit(self):
+        f = self.handler.get_or_execute
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+        self.assertEqual(1, self.target.calls)
+        self.assertIsNone(memcache.get('%s/lease' % self.rid))
+
+    def test_sampled_lookups(self):
+        f = self.handler.get_or_execute
+        lookups = lambda: memcache.get(
+            'forma-alerts/lookups', namespace=cache.STATS_NAMESPACE)
+        with mock.patch.object(cache, 'LOOKUP_SAMPLE_RATE', 0):
+            f({}, self.target, self.rid)
+            f({}, self.target, self.rid)
+        self.assertIsNone(lookups())
+        with mock.patch.object(cache, 'LOOKUP_SAMPLE_RATE', 1):
+            f({}, self.target, self.rid)
+        self.assertEqual(1, lookups())
+
+    @mock.patch('gfw.common.time.sleep')
+    def test_waits_for_leaseholder(self, sleep):
+        memcache.add('%s/lease' % self.rid, True)
+        sleep.side_effect = lambda x: cache.set(
+            self.rid, dict(result=(200, {}, '{"value": 42}'),
+                           expires=time.time() + 60))
+        status, headers, body = self.handler.get_or_execute(
+            {}, self.target, self.rid)
+        self.assertEqual('{"value": 42}', body)
+        self.assertEqual(0, self.target.calls)
+
+    @mock.patch('gfw.common.time.sleep')
+    def test_executes_when_leaseholder_fails(self, sleep):
+        memcache.add('%s/lease' % self.rid, True)
+        sleep.side_effect = lambda x: memcache.delete('%s/lease' % self.rid)
+        status, headers, body = self.handler.get_or_execute(
+            {}, self.target, self.rid)
+        self.assertEqual('{"value": 1}', body)
+        self.assertEqual(1, self.target.calls)
+
+    def test_stale_while_revalidate(self):
+        f = self.handler.get_or_execute
+        f({}, self.target, self.rid)
+        entry = cache.get(self.rid)
+        entry['expires'] = time.time() - 1
+        cache.set(self.rid, entry)
+
+        # Stale entry is served and a single refresh is enqueued
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+        self.assertEqual(1, self.target.calls)
+        tasks = self.taskqueue_stub.get_filtered_tasks(
+            queue_names='cache-refresh')
+        self.assertEqual(1, len(tasks))
+        self.assertEqual(self.path, tasks[0].url)
+        self.assertEqual('POST', tasks[0].method)
+
+    def test_refresh_large_args(self):
+        geojson = {'type': 'Polygon', 'coordinates': [
+            [[x * 0.001, x % 2] for x in range(20000)]]}
+        raw = dict(geojson=geojson, aois=[{'wdpaid': 1}])
+        self.handler._refresh(self.rid, self.path, raw)
+        task = self.taskqueue_stub.get_filtered_tasks(
+            queue_names='cache-refresh')[0]
+        self.assertTrue(len(task.payload) < 100)
+
+        # The task request gets back the args, with bust
+        request = webapp2.Request.blank(
+            self.path, POST=task.payload, headers=[
+                ('Content-Type', 'application/json'),
+                ('X-AppEngine-QueueName', 'cache-refresh')])
+        handler = CORSRequestHandler(request, webapp2.Response())
+        self.assertEqual(dict(raw, bust=1), handler.args())
+
+        # Other requests cannot read stored args
+        request = webapp2.Request.blank(
+            self.path, POST=task.payload,
+            headers=[('Content-Type', 'application/json')])
+        handler = CORSRequestHandler(request, webapp2.Response())
+        self.assertEqual({'refresh': self.rid}, handler.args())
+
+    def test_bust(self):
+        f = self.handler.get_or_execute
+        f({}, self.target, self.rid)
+        self.assertEqual('{"value": 2}',
+                         f({'bust': True}, self.target, self.rid)[2])
+        self.assertEqual('{"value": 2}', f({}, self.target, self.rid)[2])
+
+    def test_errors_not_cached(self):
+        f = self.handler.get_or_execute
+        target = Target()
+        target.execute = lambda args: ('error', dict(message='CartoDB Error'))
+        self.assertEqual(400, f({}, target, self.rid)[0])
+        self.assertIsNone(cache.get(self.rid))
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+
+        # A failed refresh keeps the stale entry
+        f({'bust': True}, target, self.rid)
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+        self.assertEqual(1, self.target.calls)
+
+    def test_get_id_ignores_bust(self):
+        self.assertEqual(self.handler.get_id({'iso': 'bra'}),
+                         self.handler.get_id({'iso': 'bra', 'bust': True}))
+
+    def test_get_id(self):
+        f = self.handler.get_id
+        self.assertEqual(f({'thresh': 30}), f({'thresh': '30'}))
+        self.assertEqual(f({'iso': 'bra'}), f({'iso': 'bra', 'dev': True}))
+        self.assertNotEqual(f({'thresh': 30}), f({'thresh': 75}))
+
+    def test_hash_id_geometry(self):
+        geom = geometry.parse('{"type": "Polygon", "coordinates": []}')
+        self.assertEqual(self.handler._hash_id({'geojson': geom}),
+                         self.handler._hash_id({'geojson': str(geom)}))
+
+    def test_dev_bypasses_cache(self):
+        f = self.handler.get_or_execute
+        f({}, self.target, self.rid)
+        self.assertEqual('{"value": 2}',
+                         f({'dev': True}, self.target, self.rid)[2])
+        self.assertEqual('{"value": 1}', f({}, self.target, self.rid)[2])
+
+    def test_dev_and_bust_not_cacheable(self):
+        f = self.handler.get_or_execute
+        self.assertIn('public', f({}, self.target, self.rid)[1][
+            'Cache-Control'])
+        self.assertEqual('private, no-store', f(
+            {'dev': True}, self.target, self.rid)[1]['Cache-Control'])
+        self.assertEqual('no-cache', f(
+            {'bust': True}, self.target, self.rid)[1]['Cache-Control'])
+
+        # The entry cached by the bust request stays cacheable
+        self.assertIn('public', f({}, self.target, self.rid)[1][
+            'Cache-Control'])
+
+    def test_meta(self):
+        status, headers, body = self.handler.get_or_execute(
+            {}, self.target, self.rid, meta=dict(meta='forma'))
+        self.assertEqual('{"meta": "forma", "value": 1}', body)
+
+    def test_render(self):
+        f = CORSRequestHandler.render
+        body = '{"a": 1, "b": 2}'
+        headers = {
+            'ETag': '"%s"' % md5(body).hexdigest(),
+            'Cache-Control': 'public, max-age=3600, '
+                             'stale-while-revalidate=86400'}
+        self.assertEqual((200, headers, body), f('respond', dict(b=2, a=1)))
+        self.assertEqual((302, {'Location': 'http://foo'}, ''),
+                         f('redirect', 'http://foo'))
+        self.assertEqual((400, {}, 'oops'), f('error', dict(message='oops')))
+
+    def test_conditional_get(self):
+        status, headers, body = self.handler.get_or_execute(
+            {}, self.target, self.rid)
+        for header in [headers['ETag'], 'W/%s' % headers['ETag'],
+                       '"foo", %s' % headers['ETag'], '*']:
+            request = webapp2.Request.blank(
+                self.path, headers=[('If-None-Match', header)])
+            handler = CORSRequestHandler(request, webapp2.Response())
+            handler.write_response(status, headers, body)
+            self.assertEqual(304, handler.response.status_int)
+            self.assertEqual('', handler.response.body)
+            self.assertEqual(headers['ETag'], handler.response.headers['ETag'])
+
+        request = webapp2.Request.blank(
+            self.path, headers=[('If-None-Match', '"foo"')])
+        handler = CORSRequestHandler(request, webapp2.Response())
+        handler.write_response(status, headers, body)
+        self.assertEqual(200, handler.response.status_int)
+        self.assertEqual(body, handler.response.body)
+
+    def test_cache_control(self):
+        f = gfw_common.get_cache_control
+        self.assertEqual('public, max-age=3600, stale-while-revalidate=21600',
+                         f(dict(meta=dict(updates='Daily'))))
+        self.assertEqual(
+            'public, max-age=86400, stale-while-revalidate=345600',
+            f(dict(meta=dict(updates='16 day'))))
+        self.assertEqual(
+            'public, max-age=604800, stale-while-revalidate=1814400',
+            f(dict(meta=dict(
+                updates='Quarterly (April, July, October, January)'))))
+        self.assertEqual(
+            'public, max-age=2592000, stale-while-revalidate=7776000',
+            f(dict(meta=dict(updates='Loss: Annual, Gain: 12-year'))))
+        self.assertEqual('public, max-age=3600, stale-while-revalidate=86400',
+                         f(dict(value=1)))
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
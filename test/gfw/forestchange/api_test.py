@@ -24,11 +24,14 @@ test/gfw.forestchange.sql for that.
 
 from test import common
 
+import json
+import mock
 import unittest
 import webapp2
 import webtest
 
 from gfw.forestchange import api
+from gfw.forestchange import geostore
 
 
 class BaseApiTest(common.FetchBaseTest):
@@ -223,6 +226,163 @@ class TerraiApiTest(BaseApiTest):
         self._testGetNational('terrai-alerts')
 
 
+class BatchApiTest(common.FetchBaseTest):
+
+    def setUp(self):
+        super(BatchApiTest, self).setUp()
+        self.api = webtest.TestApp(api.handlers)
+
+    def testGetBatch(self):
+        self.setResponse(content='{"rows":[{"value":9870}]}', status_code=200)
+        r = self.api.get('/forest-change/batch', dict(
+            datasets='forma-alerts,quicc-alerts,foo', iso='bra'))
+        self.assertEqual(200, r.status_code)
+        self.assertItemsEqual(['forma-alerts', 'quicc-alerts', 'foo'], r.json)
+        self.assertEqual(9870, r.json['forma-alerts']['value'])
+        self.assertEqual('bra', r.json['quicc-alerts']['params']['iso'])
+        self.assertIn('error', r.json['foo'])
+
+        # Datasets are cached like their own requests
+        self.setResponse(content='{"rows":[{"value":1}]}', status_code=200)
+        r = self.api.get('/forest-change/forma-alerts/admin/bra')
+        self.assertEqual(9870, r.json['value'])
+
+
+class BreakdownApiTest(BaseApiTest):
+
+    def testGetBreakdown(self):
+        self.setResponse(
+            content='{"rows":[{"id1":1,"value":3},{"id1":2,"value":4}]}',
+            status_code=200)
+        r = self.api.get('/forest-change/forma-alerts/admin/bra',
+                         dict(breakdown='id1'))
+        self.assertEqual(4, r.json['breakdown']['2']['value'])
+
+        # The id1 responses were cached by the breakdown request
+        self.setResponse(content='{"rows":[{"value":1}]}', status_code=200)
+        r = self.api.get('/forest-change/forma-alerts/admin/bra/2')
+        self.assertEqual(4, r.json['value'])
+        self.assertEqual('forma-alerts', r.json['meta']['id'])
+        r = self.api.get('/forest-change/forma-alerts/admin/bra/3')
+        self.assertEqual(1, r.json['value'])
+
+    def testUnsupportedBucket(self):
+        for path, params in [
+                ('/forest-change/forma-alerts/admin/bra',
+                 dict(breakdown='id1', bucket='month')),
+                ('/forest-change/imazon-alerts/admin/bra',
+                 dict(bucket='month'))]:
+            r = self.api.get(path, params, expect_errors=True)
+            self.assertEqual(400, r.status_int)
+            self.assertIn('bucket', r.body)
+
+    def testUnsupportedCompare(self):
+        compare = '2014-01-01,2014-06-30|2014-07-01,2014-12-31'
+        for path in ['/forest-change/imazon-alerts/admin/bra',
+                     '/forest-change/nasa-active-fires/admin/bra']:
+            r = self.api.get(path, dict(compare=compare), expect_errors=True)
+            self.assertEqual(400, r.status_int)
+            self.assertIn('compare', r.body)
+
+    def testBreakdownOnlyNational(self):
+        for path in ['/forest-change/forma-alerts/admin/bra/3',
+                     '/forest-change/forma-alerts/wdpa/1',
+                     '/forest-change/umd-loss-gain/admin/bra']:
+            r = self.api.get(path, dict(breakdown='id1'), expect_errors=True)
+            self.assertEqual(400, r.status_int)
+            self.assertIn('breakdown', r.body)
+
+
+class RankingApiTest(BaseApiTest):
+
+    def testGetRanking(self):
+        self.setResponse(
+            content='{"rows":[{"iso":"IDN","value":9},'
+                    '{"iso":"BRA","value":5}]}',
+            status_code=200)
+        r = self.api.get('/forest-change/forma-alerts/admin',
+                         dict(group_by='iso', limit=2))
+        self.assertEqual(['IDN', 'BRA'], [x['iso'] for x in r.json['ranking']])
+        r = self.api.get('/forest-change/forma-alerts/admin',
+                         expect_errors=True)
+        self.assertEqual(400, r.status_int)
+        r = self.api.get('/forest-change/forma-alerts/admin',
+                         dict(group_by='id1'), expect_errors=True)
+        self.assertEqual(400, r.status_int)
+
+        # Only country rankings are grouped
+        r = self.api.get('/forest-change/forma-alerts/admin/bra',
+                         dict(group_by='iso'), expect_errors=True)
+        self.assertEqual(400, r.status_int)
+        self.assertIn('group_by', r.body)
+
+
+class AoisApiTest(common.FetchBaseTest):
+
+    def setUp(self):
+        super(AoisApiTest, self).setUp()
+        self.api = webtest.TestApp(api.handlers)
+
+    def testPostAois(self):
+        path = '/forest-change/quicc-alerts/aois'
+        self.setResponse(
+            content='{"rows":[{"id":0,"value":3},{"id":1,"value":4}]}',
+            status_code=200)
+        r = self.api.post_json(path, dict(aois=[{'wdpaid': 1}, {'wdpaid': 2}]))
+        self.assertEqual([3, 4], [x['value'] for x in r.json['aois']])
+        self.assertEqual('quicc-alerts', r.json['meta']['id'])
+
+        # Cached AOIs are not queried again
+        self.setResponse(content='{"rows":[{"id":0,"value":7}]}',
+                         status_code=200)
+        r = self.api.post_json(path, dict(aois=[{'wdpaid': 2}, {'wdpaid': 3}]))
+        self.assertEqual([4, 7], [x['value'] for x in r.json['aois']])
+
+        r = self.api.post_json(path, dict(aois=[]), expect_errors=True)
+        self.assertEqual(400, r.status_int)
+        r = self.api.post_json('/forest-change/imazon-alerts/aois',
+                               dict(aois=[{'wdpaid': 1}]), expect_errors=True)
+        self.assertEqual(404, r.status_int)
+
+
+class GeometryApiTest(BaseApiTest):
+
+    def testGetGeostore(self):
+        gid = geostore.create(json.dumps({'type': 'Polygon', 'coordinates': [
+            [[10.0, 1.0], [10.0, 0.0], [11.0, 0.0], [10.0, 1.0]]]})).key.id()
+        path = '/forest-change/forma-alerts'
+        self.setResponse(content='{"rows":[{"value":3}]}', status_code=200)
+        r = self.api.get(path, dict(geostore=gid))
+        self.assertEqual(3, r.json['value'])
+        self.assertEqual(gid, r.json['params']['geostore'])
+        self.assertNotIn('geojson', r.json['params'])
+
+        # Cache hits do not read the stored geometry
+        geostore.Geostore.get_by_id(gid).key.delete()
+        r = self.api.get(path, dict(geostore=gid))
+        self.assertEqual(3, r.json['value'])
+        r = self.api.get(path, dict(geostore=gid, bust=1), expect_errors=True)
+        self.assertEqual(400, r.status_int)
+        self.assertIn('geostore', r.body)
+
+    def testGetGeojson(self):
+        geojson = {'type': 'Polygon', 'coordinates': [
+            [[10.123456, 0.0], [11.0, 0.0], [10.123456, 1.0],
+             [10.123456, 0.0]]]}
+        path = '/forest-change/forma-alerts'
+        self.setResponse(content='{"rows":[{"value":3}]}', status_code=200)
+        r = self.api.get(path, dict(geojson=json.dumps(geojson)))
+        self.assertEqual(3, r.json['value'])
+        self.assertEqual(geojson, r.json['params']['geojson'])
+        self.assertNotIn('requested_geojson', r.json['params'])
+
+        # Cache hits do not simplify the geometry
+        with mock.patch.object(api, '_simplify') as simplify:
+            r = self.api.get(path, dict(geojson=json.dumps(geojson)))
+        self.assertEqual(geojson, r.json['params']['geojson'])
+        self.assertFalse(simplify.called)
+
+
 class FunctionTest(unittest.TestCase):
 
     """Test for the FormaIsoHandler."""
@@ -254,5 +414,46 @@ class FunctionTest(unittest.TestCase):
         path = '/forest-change/forma-alerts/wdpa/123'
         self.assertEqual(('forma-alerts', 'wdpa'), api._classify_request(path))
 
+        path = '/forest-change/forma-alerts/admin'
+        self.assertEqual(('forma-alerts', 'countries'),
+                         api._classify_request(path))
+
+        path = '/forest-change/forma-alerts/aois'
+        self.assertEqual(('forma-alerts', 'aois'),
+                         api._classify_request(path))
+
+    def test_meta_aois(self):
+        aois = api.META['quicc-alerts']['apis']['aois']
+        self.assertEqual('POST', aois['method'])
+        self.assertTrue(aois['url'].endswith('/quicc-alerts/aois'))
+        self.assertItemsEqual(api.PARAMS['quicc-alerts']['aois'],
+                              aois['body'])
+
+    def test_batch_path(self):
+        f = api._batch_path
+        self.assertEqual('', f({'geojson': '{}'}))
+        self.assertEqual('/admin/bra', f({'iso': 'bra'}))
+        self.assertEqual('/admin/bra/1', f({'iso': 'bra', 'id1': '1'}))
+        self.assertEqual('/wdpa/2', f({'wdpaid': '2'}))
+        self.assertEqual('/use/mining/3', f({'use': 'mining', 'useid': '3'}))
+
+    def test_key_params(self):
+        f = api._key_params
+        self.assertEqual(
+            f('forma-alerts', 'iso', {'iso': 'bra'}),
+            f('forma-alerts', 'iso', {'iso': 'bra', 'begin': '2014-01-01',
+                                      'end': '2015-01-01'}))
+        self.assertEqual(
+            f('umd-loss-gain', 'iso', {'iso': 'bra'}),
+            f('umd-loss-gain', 'iso', {'iso': 'bra', 'thresh': 10}))
+        a = '{"type":"Polygon","coordinates":[[[0,0],[1,0],[1,1],[0,0]]]}'
+        b = '{"type": "Polygon", ' \
+            '"coordinates": [[[1,1], [0,0], [1,0.0001], [1,1]]]}'
+        self.assertEqual(f('forma-alerts', 'all', {'geojson': a}),
+                         f('forma-alerts', 'all', {'geojson': b}))
+        self.assertEqual(
+            {'geostore': 'abc', 'begin': '2014-01-01', 'end': '2015-01-01'},
+            f('forma-alerts', 'all', {'geostore': 'abc', 'geojson': a}))
+
 if __name__ == '__main__':
     unittest.main(exit=False, failfast=True)
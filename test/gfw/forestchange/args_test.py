@@ -67,14 +67,52 @@ class ArgsTest(common.BaseTest):
     def test_geojson(self):
         f = args.ArgProcessor.geojson
         arg = '{"type": "Polygon"}'
-        self.assertEquals(f(arg)['geojson'], arg)
+        self.assertEquals(f(arg)['geojson'].geom, json.loads(arg))
         arg = '{"type": "MultiPolygon"}'
-        self.assertEquals(f(arg)['geojson'], arg)
+        self.assertEquals(f(arg)['geojson'].geom, json.loads(arg))
         with self.assertRaises(args.GeoJsonArgError):
             f(json.dumps({"type": "Line"}))  # Wrong type
         with self.assertRaises(args.GeoJsonArgError):
             f('{"type": Polygon}')  # Invalid JSON
 
+    def test_geostore(self):
+        f = args.ArgProcessor.geostore
+        arg = 'd41d8cd98f00b204e9800998ecf8427e'
+        self.assertEquals(f(arg)['geostore'], arg)
+        with self.assertRaises(args.GeostoreArgError):
+            f('foo')
+        with self.assertRaises(args.GeostoreArgError):
+            f(arg.upper())
+
+    def test_limit(self):
+        f = args.ArgProcessor.limit
+        self.assertEqual(f('10')['limit'], '10')
+        for x in ['0', '-1', 'foo', '1; DROP TABLE forma_api']:
+            with self.assertRaises(args.LimitArgError):
+                f(x)
+
+    def test_compare(self):
+        f = args.ArgProcessor.compare
+        self.assertEqual(
+            [{'begin': '2013-01-01', 'end': '2013-06-30'},
+             {'begin': '2014-01-01', 'end': '2014-06-30'}],
+            f('2014-01-01,2014-06-30|2013-01-01,2013-06-30')['compare'])
+        for x in ['2014-01-01,2014-06-30', 'foo|bar',
+                  '|'.join(['2014-01-01,2014-06-30'] * (args.MAX_COMPARE + 1))]:
+            with self.assertRaises(args.CompareArgError):
+                f(x)
+
+    def test_aois(self):
+        f = args.ArgProcessor.aois
+        aois = f([{'wdpaid': 1}, {'use': 'logging', 'useid': '2', 'foo': 3}])
+        self.assertEqual(
+            [{'wdpaid': 1}, {'use': 'logging', 'useid': '2'}], aois['aois'])
+        for x in [[], None, [{}], [{'useid': 1}], [{'wdpaid': 'foo'}],
+                  [{'wdpaid': 1, 'use': 'mining', 'useid': 1}],
+                  [{'wdpaid': 1}] * (args.MAX_AOIS + 1)]:
+            with self.assertRaises(args.AoisArgError):
+                f(x)
+
     def test_download(self):
         f = args.ArgProcessor.download
         arg = 'foo.csv'
@@ -29,6 +29,7 @@ from gfw.forestchange import forma
 from gfw.forestchange import imazon
 from gfw.forestchange import quicc
 from gfw.forestchange import terrai
+from gfw.forestchange import common as fcommon
 
 DATASETS = [fires, umd, forma, imazon, quicc, terrai]
 
@@ -75,6 +76,75 @@ class FormaSqlTest(unittest.TestCase):
         self.assertEqual(sql, sqls.forma_begin_end)
 
 
+class HistogramTest(unittest.TestCase):
+
+    """Test histogram queries and buckets."""
+
+    def testHistogramSql(self):
+        sql = forma.FormaSql.process({'iso': 'bra', 'bucket': 'month'})[0]
+        self.assertIn(
+            "AS value, date_trunc('month', f.date)::date AS bucket", sql)
+        self.assertTrue(sql.endswith('GROUP BY bucket ORDER BY bucket'))
+        download = forma.FormaSql.process(
+            {'iso': 'bra', 'bucket': 'month'})[1]
+        self.assertNotIn('bucket', download)
+        sql = fires.FiresSql.process({'iso': 'bra', 'bucket': 'day'})[0]
+        self.assertIn("date_trunc('day', pt.acq_date::date)", sql)
+        sql = imazon.ImazonSql.process({'iso': 'bra', 'bucket': 'day'})[0]
+        self.assertNotIn('date_trunc', sql)
+        sql = forma.FormaSql.process({'latest': True, 'bucket': 'day'})[0]
+        self.assertNotIn('date_trunc', sql)
+
+    def testComparisonSql(self):
+        compare = [{'begin': '2013-01-01', 'end': '2013-06-30'},
+                   {'begin': '2014-01-01', 'end': '2014-06-30'}]
+        sql = forma.FormaSql.process({'iso': 'bra', 'compare': compare})[0]
+        self.assertIn(
+            "COUNT(*) FILTER (WHERE f.date BETWEEN '2013-01-01'::date AND "
+            "'2013-06-30'::date) AS period_0, COUNT(*) FILTER (WHERE f.date "
+            "BETWEEN '2014-01-01'::date AND '2014-06-30'::date) AS period_1",
+            sql)
+        self.assertIn("f.date >= '2013-01-01'::date", sql)
+        self.assertIn("f.date <= '2014-06-30'::date AND (f.date BETWEEN "
+                      "'2013-01-01'::date AND '2013-06-30'::date OR f.date "
+                      "BETWEEN '2014-01-01'::date AND '2014-06-30'::date)", sql)
+        self.assertNotIn('AS value', sql)
+        sql = quicc.QuiccSql.process(
+            {'wdpaid': 1, 'compare': compare, 'bucket': 'day'})[0]
+        self.assertIn('FILTER (WHERE pt.date BETWEEN', sql)
+        self.assertNotIn('date_trunc', sql)
+        sql = imazon.ImazonSql.process({'iso': 'bra', 'compare': compare})[0]
+        self.assertNotIn('FILTER', sql)
+
+    def testBreakdownSql(self):
+        sql = imazon.ImazonSql.breakdown({'iso': 'bra'})
+        self.assertIn('WHERE ST_Intersects(i.the_geom_webmercator, '
+                      'p.the_geom_webmercator) AND', sql)
+        self.assertIn('GROUP BY p.id_1, data_type', sql)
+
+    def testHistogram(self):
+        f = fcommon.get_histogram
+        rows = [{'bucket': '2014-02-01T00:00:00Z', 'value': 5}]
+        args = {'bucket': 'month', 'begin': '2014-01-15', 'end': '2014-03-31'}
+        self.assertEqual([
+            {'bucket': '2014-01-01', 'begin': '2014-01-15',
+             'end': '2014-01-31', 'value': 0, 'partial': True},
+            {'bucket': '2014-02-01', 'begin': '2014-02-01',
+             'end': '2014-02-28', 'value': 5, 'partial': False},
+            {'bucket': '2014-03-01', 'begin': '2014-03-01',
+             'end': '2014-03-31', 'value': 0, 'partial': False}],
+            f(rows, args))
+
+        # Weeks start on Monday like date_trunc
+        args = {'bucket': 'week', 'begin': '2014-01-01', 'end': '2014-01-06'}
+        self.assertEqual(['2013-12-30', '2014-01-06'],
+                         [x['bucket'] for x in f([], args)])
+        self.assertEqual([True, True], [x['partial'] for x in f([], args)])
+
+        args = {'bucket': 'year', 'begin': '2012-01-01', 'end': '2013-12-31'}
+        self.assertEqual(2, len(f([], args)))
+
+
 class DatasetExecuteTest(common.FetchBaseTest):
 
     def _success(self, args, response, service):
@@ -141,6 +211,99 @@ class DatasetExecuteTest(common.FetchBaseTest):
             response = '{"error":["oops"]}'
             action, data = self._failure(args, response, service)
 
+    def testExecuteHistogram(self):
+        args = {'iso': 'bra', 'bucket': 'year', 'begin': '2012-06-01',
+                'end': '2013-06-01'}
+        response = '{"rows":[{"bucket":"2012-01-01T00:00:00Z","value":3},' \
+            '{"bucket":"2013-01-01T00:00:00Z","value":4}]}'
+        action, data = self._success(args, response, forma)
+        self.assertEqual(7, data['value'])
+        self.assertEqual([3, 4], [x['value'] for x in data['histogram']])
+
+    def testExecuteComparison(self):
+        args = {'iso': 'bra', 'compare': [
+            {'begin': '2012-01-01', 'end': '2012-12-31'},
+            {'begin': '2013-01-01', 'end': '2013-12-31'},
+            {'begin': '2014-01-01', 'end': '2014-12-31'}]}
+        response = '{"rows":[{"period_0":0,"period_1":4,"period_2":3}]}'
+        action, data = self._success(args, response, terrai)
+        self.assertEqual(3, data['value'])
+        self.assertEqual([0, 4, 3], [x['value'] for x in data['comparison']])
+        self.assertEqual([None, 4, -1],
+                         [x['delta'] for x in data['comparison']])
+        self.assertEqual([None, None, -25.0],
+                         [x['delta_percent'] for x in data['comparison']])
+
+    def testExecuteBreakdown(self):
+        args = {'iso': 'bra', 'breakdown': 'id1'}
+        response = '{"rows":[{"id1":1,"value":3},{"id1":2,"value":4}]}'
+        action, data = self._success(args, response, forma)
+        self.assertItemsEqual(['1', '2'], data['breakdown'])
+        self.assertEqual(4, data['breakdown']['2']['value'])
+        self.assertEqual('2', data['breakdown']['2']['params']['id1'])
+        self.assertIn('download_urls', data['breakdown']['2'])
+
+        args = {'iso': 'bra', 'breakdown': 'id1'}
+        response = '{"rows":[{"id1":1,"data_type":"defor","value":3}]}'
+        action, data = self._success(args, response, imazon)
+        self.assertEqual([{'data_type': 'defor', 'value': 3}],
+                         data['breakdown']['1']['value'])
+
+    def testExecuteRanking(self):
+        args = {'group_by': 'iso', 'limit': '2'}
+        response = '{"rows":[{"iso":"IDN","value":9},{"iso":"BRA","value":5}]}'
+        action, data = self._success(args, response, quicc)
+        self.assertEqual(
+            [{'rank': 1, 'iso': 'IDN', 'value': 9},
+             {'rank': 2, 'iso': 'BRA', 'value': 5}], data['ranking'])
+        sql = quicc.QuiccSql.process(args)[0]
+        self.assertIn('GROUP BY p.iso', sql)
+        self.assertTrue(sql.endswith('ORDER BY value DESC, iso LIMIT 2'))
+        sql = forma.FormaSql.process({'group_by': 'iso'})[0]
+        self.assertTrue(sql.endswith('ORDER BY value DESC, iso'))
+        self.assertIn('f.iso IS NOT NULL', sql)
+        sql = terrai.TerraiSql.process({'group_by': 'iso'})[0]
+        self.assertIn('f.iso IS NOT NULL', sql)
+        with self.assertRaises(Exception):
+            imazon.ImazonSql.process({'group_by': 'iso'})
+
+    def testExecuteAois(self):
+        args = {'aois': [{'wdpaid': 5}, {'use': 'mining', 'useid': 2},
+                         {'wdpaid': 6}]}
+        response = '{"rows":[{"id":0,"value":3},{"id":2,"value":4}]}'
+        action, data = self._success(args, response, fires)
+        self.assertEqual(
+            [{'wdpaid': 5, 'value': 3}, {'use': 'mining', 'useid': 2,
+                                         'value': None},
+             {'wdpaid': 6, 'value': 4}], data['aois'])
+
+        batches = fcommon.get_aoi_batches(
+            [{'wdpaid': 1}, {'use': 'mining', 'useid': 2}, {'wdpaid': 3}])
+        self.assertEqual([('wdpa', None, [0, 2]), ('use', 'mining', [1])],
+                         [(k, u, [i for i, _ in b]) for k, u, b in batches])
+        batches = fcommon.get_aoi_batches(
+            [{'wdpaid': x} for x in range(fcommon.AOI_BATCH_SIZE + 1)])
+        self.assertEqual([fcommon.AOI_BATCH_SIZE, 1],
+                         [len(b) for _, _, b in batches])
+
+        sql = forma.FormaSql.aoi_counts(
+            'wdpa', None, [(0, {'wdpaid': 5}), (3, {'wdpaid': '6'})], {})
+        self.assertIn('FROM (VALUES (0, 5), (3, 6)) AS v(id, wdpaid)', sql)
+        self.assertIn('GROUP BY aoi.id', sql)
+        sql = fires.FiresSql.aoi_counts(
+            'use', 'mining', [(0, {'use': 'mining', 'useid': 2})], {})
+        self.assertIn('INNER JOIN gfw_mining u', sql)
+        self.assertIn('CAST(pt.confidence AS INT) > 30', sql)
+
+        # GeoJSON AOIs count like geojson requests, without the filter
+        sql = fires.FiresSql.aoi_counts(
+            'geojson', None, [(0, {'geojson': 'foo'})], {})
+        self.assertNotIn('confidence', sql)
+        sql = fires.FiresSql.process({'geojson': 'foo'})[0]
+        self.assertNotIn('confidence', sql)
+        with self.assertRaises(Exception):
+            imazon.ImazonSql.aoi_counts('wdpa', None, [], {})
+
     def testExecute(self):
         """Test datasets with common responses."""
         for service in [forma, fires, quicc, imazon, terrai]:
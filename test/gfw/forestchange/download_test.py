@@ -0,0 +1,76 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.download"""
+
+from test import common
+
+import unittest
+import webtest
+
+from gfw.forestchange import download
+
+
+class DownloadTest(common.BaseTest):
+
+    def setUp(self):
+        super(DownloadTest, self).setUp()
+        self.api = webtest.TestApp(download.handlers)
+
+    def test_register(self):
+        self.assertEqual({}, download.register(None, {}))
+        urls = download.register('SELECT * FROM forma_api', {'version': 'v1'})
+        self.assertItemsEqual(download.FORMATS, urls.keys())
+        did = download._get_id('SELECT * FROM forma_api', 'v1')
+        self.assertTrue(urls['csv'].endswith(
+            '/forest-change/download/%s.csv' % did))
+        self.assertEqual(
+            'SELECT * FROM forma_api', download.Download.get_by_id(did).query)
+        self.assertEqual(urls, download.register(
+            'SELECT * FROM forma_api', {'version': 'v1'}))
+        self.assertNotEqual(urls, download.register(
+            'SELECT * FROM forma_api', {}))
+
+    def test_register_multi(self):
+        queries = ['SELECT 1', None, 'SELECT 2']
+        urls = download.register_multi(queries, {})
+        self.assertEqual({}, urls[1])
+        self.assertEqual(urls[0], download.register('SELECT 1', {}))
+        did = download._get_id('SELECT 2', None)
+        self.assertTrue(urls[2]['csv'].endswith('/%s.csv' % did))
+
+        # Registered queries are remembered without reading the datastore
+        download.Download.get_by_id(did).key.delete()
+        self.assertEqual(urls, download.register_multi(queries, {}))
+        self.assertIsNone(download.Download.get_by_id(did))
+
+    def test_get(self):
+        urls = download.register('SELECT * FROM forma_api', {'version': 'v1'})
+        path = urls['shp'][urls['shp'].index('/forest-change'):]
+        r = self.api.get(path)
+        self.assertEqual(302, r.status_int)
+        self.assertIn('/api/v1/sql', r.location)
+        self.assertIn('format=shp', r.location)
+        self.assertEqual(404, self.api.get(
+            path.replace('.shp', '.doc'), expect_errors=True).status_int)
+        self.assertEqual(404, self.api.get(
+            '/forest-change/download/0123456789abcdef.csv',
+            expect_errors=True).status_int)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,274 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.geometry"""
+
+import json
+import math
+import numpy
+import unittest
+
+from gfw.forestchange import geometry
+
+SQUARE = {"type": "Polygon",
+          "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+
+
+class CanonicalTest(unittest.TestCase):
+
+    def test_resolution(self):
+        f = geometry.resolution_meters
+        self.assertEqual(500, f('500 x 500 meters'))
+        self.assertEqual(5000, f('5 x 5 kilometer'))
+        self.assertIsNone(f('unknown'))
+        self.assertEqual(3, geometry.decimals(500))
+        self.assertEqual(2, geometry.decimals(5000))
+        self.assertEqual(4, geometry.decimals(30))
+
+    def test_equivalent_geometries(self):
+        expected = geometry.canonical(json.dumps(SQUARE), 3)
+        equivalents = [
+            # Whitespace
+            json.dumps(SQUARE, indent=4),
+            # Clockwise ring starting at another vertex
+            '{"type":"Polygon","coordinates":'
+            '[[[1,1],[1,0],[0,0],[0,1],[1,1]]]}',
+            # Precision finer than the resolution
+            '{"type":"Polygon","coordinates":'
+            '[[[0.0001,0],[1,0],[1,1.0002],[0,1],[0.0001,0]]]}',
+            # Single polygon MultiPolygon
+            json.dumps(dict(type='MultiPolygon',
+                            coordinates=[SQUARE['coordinates']]))]
+        for geojson in equivalents:
+            self.assertEqual(expected, geometry.canonical(geojson, 3))
+
+    def test_different_geometries(self):
+        other = '{"type":"Polygon","coordinates":' \
+            '[[[0,0],[2,0],[2,2],[0,2],[0,0]]]}'
+        self.assertNotEqual(geometry.canonical(json.dumps(SQUARE), 3),
+                            geometry.canonical(other, 3))
+
+    def test_holes_and_order(self):
+        shell = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+        hole = [[2, 2], [3, 2], [3, 3], [2, 3], [2, 2]]
+        geom = json.loads(geometry.canonical(
+            dict(type='MultiPolygon',
+                 coordinates=[[shell, hole], SQUARE['coordinates']]), 3))
+        self.assertEqual('MultiPolygon', geom['type'])
+        polygon = [x for x in geom['coordinates'] if len(x) == 2][0]
+        self.assertTrue(geometry._signed_area(polygon[0]) > 0)
+        self.assertTrue(geometry._signed_area(polygon[1]) < 0)
+
+    def test_invalid(self):
+        self.assertEqual('foo', geometry.canonical('foo'))
+
+    def test_smaller_than_precision(self):
+        # A ~330 m square rounds to a single vertex at 2 decimals
+        tiny = {"type": "Polygon", "coordinates": [
+            [[10.001, 1.001], [10.004, 1.001], [10.004, 1.004],
+             [10.001, 1.004], [10.001, 1.001]]]}
+        for geom in [geometry.parse(tiny).rounded(2),
+                     geometry.parse(tiny).rounded(2).simplify(
+                         geometry.tolerance(1000))]:
+            ring = geom.geom['coordinates'][0]
+            self.assertEqual(5, len(ring))
+            self.assertTrue(geometry._signed_area(ring) > 0)
+
+        # Rings of a flat triangle are not rounded either
+        flat = {"type": "Polygon", "coordinates": [
+            [[0, 0], [1, 0.001], [2, 0], [0, 0]]]}
+        ring = geometry.parse(flat).rounded(2).geom['coordinates'][0]
+        self.assertEqual(4, len(ring))
+        self.assertTrue(geometry._signed_area(ring) > 0)
+
+
+class SimplifyTest(unittest.TestCase):
+
+    def setUp(self):
+        ring = [[math.cos(x * math.pi / 500), math.sin(x * math.pi / 500)]
+                for x in range(1000)]
+        self.circle = dict(type='Polygon', coordinates=[ring + ring[:1]])
+
+    def test_tolerance(self):
+        self.assertEqual(0.0, geometry.tolerance(None))
+        self.assertAlmostEqual(
+            250 / geometry.METERS_PER_DEGREE, geometry.tolerance(500))
+
+    def test_simplify(self):
+        self.assertEqual(1001, geometry.vertices(self.circle))
+        simplified = geometry.simplify(self.circle, 0.01)
+        ring = simplified['coordinates'][0]
+        self.assertTrue(geometry.vertices(simplified) < 50)
+        self.assertEqual(ring[0], ring[-1])
+        self.assertAlmostEqual(
+            1.0, geometry.area_ha(simplified) / geometry.area_ha(self.circle),
+            places=1)
+
+        # Vertices off the outline by more than the tolerance are kept
+        notch = dict(type='Polygon', coordinates=[
+            [[0, 0], [1, 0], [1, 1], [0.5, 0.5], [0, 1], [0, 0]]])
+        self.assertEqual(6, geometry.vertices(geometry.simplify(notch, 0.1)))
+        self.assertEqual(5, geometry.vertices(geometry.simplify(notch, 0.6)))
+
+    def test_collapse(self):
+        multi = dict(type='MultiPolygon', coordinates=[
+            self.circle['coordinates'], SQUARE['coordinates']])
+        simplified = geometry.simplify(multi, 10)
+        self.assertEqual('MultiPolygon', simplified['type'])
+        self.assertEqual(multi['coordinates'], simplified['coordinates'])
+
+
+DONUT = {"type": "Polygon", "coordinates": [
+    [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+    [[1, 1], [1, 3], [3, 3], [3, 1], [1, 1]]]}
+
+# Concave, clockwise and with a vertex at the latitude of test points
+ARROW = {"type": "Polygon", "coordinates": [
+    [[0, 0], [0, 2], [2, 2], [1, 1], [2, 0], [0, 0]]]}
+
+ISLANDS = {"type": "MultiPolygon", "coordinates": [
+    DONUT['coordinates'],
+    [[[2, 2], [2.5, 2], [2.5, 2.5], [2, 2.5], [2, 2]]],
+    [[[10, -5], [12, -5], [11, -3], [10, -5]]]]}
+
+# (geometry, point, ST_Intersects of geometry and point in PostGIS)
+FIXTURES = [
+    (SQUARE, (0.5, 0.5), True),
+    (SQUARE, (0.999999, 0.000001), True),
+    (SQUARE, (1.000001, 0.5), False),
+    (SQUARE, (-0.5, 0.5), False),
+    (SQUARE, (0.5, 2), False),
+    (DONUT, (0.5, 2), True),
+    (DONUT, (2, 2), False),
+    (DONUT, (3.5, 3.5), True),
+    (DONUT, (5, 2), False),
+    (ARROW, (0.5, 1), True),
+    (ARROW, (1.5, 1), False),
+    (ARROW, (1.5, 1.9), True),
+    (ARROW, (1.5, 0.1), True),
+    (ARROW, (-1, 1), False),
+    (ARROW, (-1, 2), False),
+    (ISLANDS, (2, 1.5), False),
+    (ISLANDS, (2.2, 2.2), True),
+    (ISLANDS, (2.7, 2.7), False),
+    (ISLANDS, (0.5, 0.5), True),
+    (ISLANDS, (11, -4), True),
+    (ISLANDS, (10.2, -3.5), False),
+    (ISLANDS, (7, -4), False),
+]
+
+
+def _winding(geom, x, y):
+    """Return True if point is inside geometry by winding numbers, a
+    reference independent of the kernel under test."""
+    def winding(ring):
+        total = 0.0
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+            total += math.atan2((x0 - x) * (y1 - y) - (y0 - y) * (x1 - x),
+                                (x0 - x) * (x1 - x) + (y0 - y) * (y1 - y))
+        return abs(round(total / (2 * math.pi))) % 2 == 1
+    for polygon in geometry._polygons(geom):
+        if winding(polygon[0]) and not any(winding(x) for x in polygon[1:]):
+            return True
+    return False
+
+
+class ContainsTest(unittest.TestCase):
+
+    def test_fixtures(self):
+        for geom, (x, y), expected in FIXTURES:
+            self.assertEqual(
+                [expected], geometry.contains(geom, [x], [y]).tolist(),
+                (geom, x, y))
+            self.assertEqual(expected, _winding(geom, x, y), (geom, x, y))
+
+    def test_random_points(self):
+        random = numpy.random.RandomState(0)
+        xs = random.uniform(-1, 13, 2000)
+        ys = random.uniform(-6, 5, 2000)
+        for geom in [SQUARE, DONUT, ARROW, ISLANDS]:
+            expected = [_winding(geom, x, y) for x, y in zip(xs, ys)]
+            self.assertEqual(
+                expected, geometry.contains(geom, xs, ys).tolist())
+
+    def test_cover(self):
+        self.assertEqual([0, 1439, 1440 * 720 - 1], geometry.cell(
+            [-180, 179.9, 180], [-90, -89.9, 90], 0.25).tolist())
+
+        # Cells along the edges are boundary cells, even when inside
+        inside, boundary = geometry.cover(SQUARE, 0.25)
+        self.assertEqual(9, len(inside))
+        self.assertEqual(16, len(boundary))
+
+        random = numpy.random.RandomState(1)
+        xs = random.uniform(-1, 13, 5000)
+        ys = random.uniform(-6, 5, 5000)
+        cells = geometry.cell(xs, ys, 0.5)
+        for geom in [SQUARE, DONUT, ARROW, ISLANDS]:
+            inside, boundary = geometry.cover(geom, 0.5)
+            self.assertEqual([], numpy.intersect1d(inside, boundary).tolist())
+            contained = geometry.contains(geom, xs, ys)
+            self.assertTrue(contained[numpy.in1d(cells, inside)].all())
+            self.assertFalse(contained[
+                ~numpy.in1d(cells, inside) & ~numpy.in1d(cells, boundary)
+            ].any())
+
+    def test_geometry(self):
+        geom = geometry.parse(json.dumps(DONUT))
+        self.assertIs(geom.cover(0.5), geom.cover(0.5))
+        self.assertEqual([True, False, False], geom.contains(
+            numpy.array([0.5, 2, 9], dtype='float32'),
+            numpy.array([0.5, 2, 9], dtype='float32')).tolist())
+        self.assertEqual([], geom.contains([], []).tolist())
+
+        # Unclosed rings are closed
+        triangle = {"type": "Polygon",
+                    "coordinates": [[[0, 0], [2, 0], [0, 2]]]}
+        self.assertEqual([True, False], geometry.contains(
+            triangle, [0.5, 1.5], [0.5, 1.5]).tolist())
+
+
+class GeometryTest(unittest.TestCase):
+
+    def test_parse(self):
+        geom = geometry.parse(json.dumps(SQUARE))
+        self.assertIs(geom, geometry.parse(geom))
+        self.assertEqual(geom, geometry.parse(SQUARE))
+        self.assertEqual(SQUARE, geometry.as_dict(geom))
+        self.assertEqual(SQUARE, geometry.as_dict(json.dumps(SQUARE)))
+        self.assertEqual('Polygon', geom.type)
+        self.assertEqual([0, 0, 1, 1], geom.bbox)
+        self.assertEqual(5, geom.vertices)
+        self.assertAlmostEqual(geometry.area_ha(SQUARE), geom.area_ha)
+
+    def test_formats_as_geojson(self):
+        geom = geometry.parse(json.dumps(SQUARE))
+        sql = "ST_GeomFromGeoJSON('{geojson}')".format(geojson=geom)
+        self.assertEqual(SQUARE, json.loads(sql[20:-2]))
+
+    def test_canonical(self):
+        geom = geometry.parse(json.dumps(SQUARE))
+        self.assertEqual(geometry.canonical(json.dumps(SQUARE), 3),
+                         geom.canonical(3))
+        self.assertEqual(geom.canonical(3), geometry.canonical(geom, 3))
+        self.assertIs(geom.rounded(3), geom.rounded(3))
+        invalid = geometry.parse('{"type": "Polygon"}')
+        self.assertEqual({'type': 'Polygon'}, invalid.canonical(3))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
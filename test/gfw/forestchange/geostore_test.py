@@ -0,0 +1,97 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.geostore"""
+
+from test import common
+
+import json
+import math
+import unittest
+import webtest
+
+from gfw.forestchange import api
+from gfw.forestchange import args
+from gfw.forestchange import geometry
+from gfw.forestchange import geostore
+
+POLYGON = {'type': 'Polygon', 'coordinates': [
+    [[10.123456, 1.0], [10.123456, 0.0], [11.0, 0.0], [10.123456, 1.0]]]}
+
+
+class GeostoreTest(common.BaseTest):
+
+    def setUp(self):
+        super(GeostoreTest, self).setUp()
+        self.api = webtest.TestApp(geostore.handlers)
+
+    def test_create(self):
+        a = geostore.create(json.dumps(POLYGON))
+        self.assertEqual(32, len(a.key.id()))
+        self.assertEqual([10.123456, 0.0, 11.0, 1.0], a.bbox)
+        self.assertTrue(a.area_ha > 0)
+        self.assertIn('10.12', geostore.get_geojson(a.key.id(), 5000))
+        self.assertIn('10.123456', geostore.get_geojson(a.key.id()))
+        self.assertIsNone(geostore.get_geojson('0' * 32))
+
+        # Equivalent geometry is stored once
+        reverse = dict(POLYGON, coordinates=[POLYGON['coordinates'][0][::-1]])
+        b = geostore.create(json.dumps(reverse))
+        self.assertEqual(a.key.id(), b.key.id())
+
+        for x in ['{"type": "Line"}', '{"type": "Polygon"}', None]:
+            with self.assertRaises(args.GeoJsonArgError):
+                geostore.create(x)
+
+    def test_simplified(self):
+        # A circle with a vertex every ~30 m of its ~3 km radius
+        ring = [[round(math.cos(x * math.pi / 300) * 0.03, 6),
+                 round(math.sin(x * math.pi / 300) * 0.03, 6)]
+                for x in range(600)]
+        polygon = dict(type='Polygon', coordinates=[ring + ring[:1]])
+        gid = geostore.create(json.dumps(polygon)).key.id()
+        vertices = [geometry.parse(geostore.get_geojson(gid, x)).vertices
+                    for x in [None, 30, 500, 5000]]
+        self.assertEqual(601, vertices[0])
+        self.assertEqual(sorted(set(vertices), reverse=True), vertices)
+
+        # Every dataset resolution has a variant
+        for meters in api.RESOLUTIONS.itervalues():
+            self.assertIn(int(meters), geostore.RESOLUTIONS)
+
+    def test_handlers(self):
+        r = self.api.post('/forest-change/geostore',
+                          json.dumps(dict(geojson=POLYGON)))
+        gid = r.json['id']
+        self.assertEqual('Polygon', r.json['geojson']['type'])
+
+        r = self.api.post('/forest-change/geostore', json.dumps(POLYGON))
+        self.assertEqual(gid, r.json['id'])
+
+        r = self.api.get('/forest-change/geostore/%s' % gid)
+        self.assertEqual(gid, r.json['id'])
+
+        r = self.api.post('/forest-change/geostore', '{"type": "Line"}',
+                          expect_errors=True)
+        self.assertEqual(400, r.status_int)
+        r = self.api.get('/forest-change/geostore/%s' % ('0' * 32),
+                         expect_errors=True)
+        self.assertEqual(404, r.status_int)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
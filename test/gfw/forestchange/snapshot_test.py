@@ -0,0 +1,267 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.snapshot"""
+
+from test import common
+
+import json
+import mock
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from gfw.forestchange import api
+from gfw.forestchange import forma
+from gfw.forestchange import geometry
+from gfw.forestchange import snapshot
+from gfw.forestchange import versions
+from gfw.forestchange.forma import FormaSql
+
+EXPORT = '{"rows":[' \
+    '{"cartodb_id":1,"day":16075,"lat":-3.5,"lon":-60.2,"iso":"BRA",' \
+    '"gadm2":10,"id1":4,"alert":true},' \
+    '{"cartodb_id":2,"day":16110,"lat":-3.6,"lon":-60.1,"iso":"BRA",' \
+    '"gadm2":11,"id1":5,"alert":true},' \
+    '{"cartodb_id":3,"day":15700,"lat":1.2,"lon":110.4,"iso":"IDN",' \
+    '"gadm2":20,"id1":1,"alert":true},' \
+    '{"cartodb_id":4,"day":16080,"lat":-3.4,"lon":-60.3,"iso":"BRA",' \
+    '"gadm2":10,"id1":4,"alert":false}]}'
+
+AMAZON = json.dumps({"type": "Polygon", "coordinates": [
+    [[-61, -4], [-60, -4], [-60, -3], [-61, -3], [-61, -4]]]})
+
+
+class SnapshotTest(common.FetchBaseTest):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.setResponse(content=EXPORT, status_code=200)
+        snapshot.export('forma-alerts', FormaSql, 'v1', root=self.root)
+        self.snapshot = snapshot.Snapshot.load(
+            'forma-alerts', 'v1', self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        snapshot._snapshots.clear()
+        snapshot._missing.clear()
+        super(SnapshotTest, self).tearDown()
+
+    def test_load(self):
+        self.assertEqual('v1', self.snapshot.version)
+        self.assertEqual(['BRA', 'IDN'], self.snapshot.isos)
+        self.assertEqual(numpy.int32, self.snapshot.columns['day'].dtype)
+        self.assertEqual(numpy.int16, self.snapshot.columns['iso'].dtype)
+        self.assertIsInstance(self.snapshot.columns['day'], numpy.memmap)
+        self.assertFalse(self.snapshot.columns['day'].flags.writeable)
+        self.assertIsNone(
+            snapshot.Snapshot.load('forma-alerts', 'v2', self.root))
+        self.assertIsNone(
+            snapshot.Snapshot.load('quicc-alerts', 'v1', self.root))
+
+    def test_load_invalid(self):
+        path = snapshot.Snapshot.path('forma-alerts', 'v1', self.root)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(dict(version='v1'), f)
+        self.assertIsNone(
+            snapshot.Snapshot.load('forma-alerts', 'v1', self.root))
+
+    def test_rows(self):
+        f = lambda args: self.snapshot.rows(args, FormaSql)
+        self.assertEqual([{'value': 2}], f({'iso': 'bra'}))
+        self.assertEqual([{'value': 1}], f({'iso': 'BRA', 'id1': '5'}))
+        self.assertEqual([{'value': 0}], f({'iso': 'COL'}))
+
+        # GeoJSON counts include points that are not alerts
+        self.assertEqual([{'value': 3}], f({'geojson': AMAZON}))
+        self.assertEqual([{'value': 2}], f(
+            {'geojson': AMAZON, 'begin': '2014-01-01', 'end': '2014-01-31'}))
+        self.assertEqual([{'value': 1}], f(
+            {'iso': 'bra', 'begin': '2014-01-01', 'end': '2014-01-31'}))
+        self.assertEqual([{'value': 1}], f({'iso': 'idn', 'end': '2013-12-31',
+                                            'begin': '2012-01-01'}))
+        self.assertEqual(
+            [{'bucket': '2014-01-01T00:00:00Z', 'value': 1},
+             {'bucket': '2014-02-01T00:00:00Z', 'value': 1}],
+            f({'iso': 'bra', 'bucket': 'month'}))
+        self.assertEqual([{'period_0': 1, 'period_1': 1}], f(
+            {'iso': 'bra', 'compare': [
+                {'begin': '2014-01-01', 'end': '2014-01-31'},
+                {'begin': '2014-02-01', 'end': '2014-02-28'}]}))
+
+    def test_index(self):
+        random = numpy.random.RandomState(0)
+        columns = dict(
+            day=random.randint(16000, 16400, 1000),
+            lat=random.uniform(-10, 10, 1000),
+            lon=random.uniform(-10, 10, 1000),
+            iso=random.randint(0, 3, 1000),
+            gadm2=random.randint(0, 10, 1000),
+            id1=random.randint(0, 5, 1000),
+            alert=random.uniform(0, 1, 1000) < 0.8)
+        unsorted = snapshot.Snapshot(
+            'forma-alerts', 'v3', ['BRA', 'IDN', 'COD'], dict(columns))
+        unsorted.save(self.root)
+        snap = snapshot.Snapshot.load('forma-alerts', 'v3', self.root)
+        days = snap.columns['day']
+        self.assertTrue((days[1:] >= days[:-1]).all())
+        self.assertEqual(columns['alert'].sum(), snap.prefix[:, -1].sum())
+
+        begin, end = '2013-10-20', '2014-02-01'
+        period = snap.period(begin, end)
+        inside = (columns['day'] >= snapshot._day(begin)) & \
+            (columns['day'] <= snapshot._day(end))
+        self.assertEqual(inside.sum(), period.stop - period.start)
+        grid = snap.grid
+        self.assertTrue((grid[1:] >= grid[:-1]).all())
+        self.assertEqual(
+            days[snap.order].tolist(), (grid % snapshot.DAY_SPAN).tolist())
+        shapes = [
+            {'type': 'Polygon', 'coordinates': [
+                [[-10, -10], [0, -10], [0, 10], [-10, 10], [-10, -10]]]},
+            {'type': 'Polygon', 'coordinates': [
+                [[-8.1, -7.3], [6.6, -9.2], [3.05, 8.7], [-8.1, -7.3]],
+                [[-1.3, -2.2], [0.4, 1.1], [2.2, -3.3], [-1.3, -2.2]]]},
+            {'type': 'MultiPolygon', 'coordinates': [
+                [[[-3.3, 2.1], [-1.9, 2.1], [-1.9, 3.7], [-3.3, 2.1]]],
+                [[[4.9, 4.9], [5.05, 4.9], [5.05, 5.05], [4.9, 4.9]]]]}]
+        for shape in shapes:
+            expected = inside & geometry.contains(
+                shape, columns['lon'], columns['lat'])
+            geojson = json.dumps(shape)
+            self.assertEqual(
+                expected.sum(), snap.count_within(geojson, begin, end))
+            self.assertEqual(
+                sorted(columns['day'][expected]),
+                snap.select({'geojson': geojson}, begin, end).tolist())
+        inside &= columns['alert']
+        for code, iso in enumerate(snap.isos):
+            expected = (inside & (columns['iso'] == code)).sum()
+            self.assertEqual(expected, snap.count(iso, begin, end))
+            self.assertEqual(
+                expected, len(snap.select({'iso': iso}, begin, end)))
+            expected = (inside & (columns['iso'] == code) &
+                        (columns['id1'] == 2)).sum()
+            self.assertEqual(expected, len(snap.select(
+                {'iso': iso, 'id1': '2'}, begin, end)))
+        self.assertEqual(0, snap.count('BRA', '2000-01-01', '2001-01-01'))
+        self.assertEqual(((columns['iso'] == 0) & columns['alert']).sum(),
+                         snap.count('BRA', '2000-01-01', '2020-01-01'))
+
+    def test_get(self):
+        snapshot.SNAPSHOT_DIR, root = self.root, snapshot.SNAPSHOT_DIR
+        try:
+            self.assertIsNone(snapshot.get('forma-alerts', None))
+            self.assertIsNone(snapshot.get('forma-alerts', 'v2'))
+            first = snapshot.get('forma-alerts', 'v1')
+            self.assertEqual('v1', first.version)
+            self.assertIs(first, snapshot.get('forma-alerts', 'v1'))
+
+            # A new version replaces the mapped snapshot
+            self.setResponse(content=EXPORT, status_code=200)
+            snapshot.export('forma-alerts', FormaSql, 'v2', root=self.root)
+            self.assertIsNone(snapshot.get('forma-alerts', 'v2'))
+            snapshot._missing.clear()
+            second = snapshot.get('forma-alerts', 'v2')
+            self.assertEqual('v2', second.version)
+            self.assertEqual(['forma-alerts'], snapshot._snapshots.keys())
+
+            # Snapshots are loaded without holding the lock
+            load = snapshot.Snapshot.load
+            locked = []
+            def f(*args):
+                locked.append(snapshot._lock.locked())
+                return load(*args)
+            snapshot.Snapshot.load = staticmethod(f)
+            try:
+                self.assertEqual(
+                    'v1', snapshot.get('forma-alerts', 'v1').version)
+            finally:
+                snapshot.Snapshot.load = load
+            self.assertEqual([False], locked)
+        finally:
+            snapshot.SNAPSHOT_DIR = root
+
+    def test_evict(self):
+        snapshot.SNAPSHOT_DIR, root = self.root, snapshot.SNAPSHOT_DIR
+        budget = snapshot.MEMORY_BUDGET
+        try:
+            self.setResponse(content=EXPORT, status_code=200)
+            snapshot.export('quicc-alerts', FormaSql, 'v1', root=self.root)
+            snapshot.export('terrai-alerts', FormaSql, 'v1', root=self.root)
+            snapshot.MEMORY_BUDGET = 2 * self.snapshot.nbytes
+            snapshot.get('forma-alerts', 'v1')
+            snapshot.get('quicc-alerts', 'v1')
+            snapshot.get('forma-alerts', 'v1')
+            snapshot.get('terrai-alerts', 'v1')
+            self.assertEqual(['forma-alerts', 'terrai-alerts'],
+                             snapshot._snapshots.keys())
+
+            # Snapshots over budget are not used
+            snapshot.MEMORY_BUDGET = self.snapshot.nbytes - 1
+            snapshot._snapshots.clear()
+            self.assertIsNone(snapshot.get('quicc-alerts', 'v1'))
+        finally:
+            snapshot.SNAPSHOT_DIR = root
+            snapshot.MEMORY_BUDGET = budget
+
+    def test_execute(self):
+        self.setResponse(content='{"rows":[{"value":9}]}', status_code=200)
+        action, data = forma.execute({'iso': 'bra'}, self.snapshot)
+        self.assertEqual(2, data['value'])
+        self.assertIn('download_urls', data)
+
+        action, data = forma.execute({'geojson': AMAZON}, self.snapshot)
+        self.assertEqual(3, data['value'])
+
+        # Dev responses are shaped like those of CartoDB
+        action, data = forma.execute(
+            {'geojson': AMAZON, 'dev': True, 'simplified': dict(
+                vertices=9, simplified_vertices=5)}, self.snapshot)
+        self.assertEqual(5, data['dev']['simplified_vertices'])
+        self.assertEqual('v1', data['dev']['snapshot'])
+        self.assertIn('sql', data['dev'])
+        self.assertNotIn('simplified', data['params'])
+        self.assertEqual(json.loads(AMAZON), data['params']['geojson'])
+
+        # Unsupported requests run on CartoDB
+        action, data = forma.execute({'wdpaid': 1}, self.snapshot)
+        self.assertEqual(9, data['value'])
+
+    def test_target_fallback(self):
+        snapshot.SNAPSHOT_DIR, root = self.root, snapshot.SNAPSHOT_DIR
+        try:
+            self.setResponse(content='{"rows":[{"value":9}]}',
+                             status_code=200)
+            target = api._SnapshotTarget('forma-alerts', forma)
+            with mock.patch.object(versions, 'get', return_value='v1'):
+                self.assertEqual(
+                    2, target.execute({'iso': 'bra'})[1]['value'])
+
+                # Requests that fail on the snapshot run on CartoDB
+                with mock.patch.object(
+                        snapshot.Snapshot, 'rows', side_effect=IndexError):
+                    self.assertEqual(
+                        9, target.execute({'iso': 'bra'})[1]['value'])
+        finally:
+            snapshot.SNAPSHOT_DIR = root
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
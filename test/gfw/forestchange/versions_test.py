@@ -0,0 +1,61 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.versions"""
+
+from test import common
+
+import unittest
+
+from gfw.forestchange import versions
+
+
+class VersionsTest(common.FetchBaseTest):
+
+    def setUp(self):
+        super(VersionsTest, self).setUp()
+        versions._local.clear()
+
+    def test_refresh(self):
+        self.assertIsNone(versions.get('forma-alerts'))
+        versions._local.clear()
+
+        self.setResponse(content='{"rows":[{"date":"2015-01-01"}]}',
+                         status_code=200)
+        changed = versions.refresh()
+        self.assertItemsEqual(versions.SQLS.keys(), changed)
+        self.assertEqual('2015-01-01', versions.get('forma-alerts'))
+
+        # Unchanged versions are not reported again
+        self.assertEqual([], versions.refresh())
+
+        self.setResponse(content='{"rows":[{"date":"2015-01-17"}]}',
+                         status_code=200)
+        self.assertItemsEqual(versions.SQLS.keys(), versions.refresh())
+        versions._local.clear()
+        self.assertEqual('2015-01-17', versions.get('forma-alerts'))
+
+    def test_refresh_error(self):
+        self.setResponse(content='{"error":["oops"]}', status_code=400)
+        self.assertEqual([], versions.refresh())
+        self.assertIsNone(versions.get('forma-alerts'))
+
+    def test_unversioned(self):
+        self.assertIsNone(versions.get('umd-loss-gain'))
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
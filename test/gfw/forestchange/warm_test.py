@@ -0,0 +1,72 @@
+# Global Forest Watch API
+# Copyright (C) 2014 World Resource Institute
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unit test coverage for gfw.forestchange.warm"""
+
+from test import common
+
+import os
+import unittest
+
+from gfw.forestchange import warm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.dirname(__file__))))
+
+ROWS = [{'iso': 'BRA', 'id_1': 1}, {'iso': 'BRA', 'id_1': 2},
+        {'iso': 'IDN', 'id_1': 1}]
+
+
+class WarmTest(common.FetchBaseTest):
+
+    def setUp(self):
+        super(WarmTest, self).setUp()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.taskqueue_stub = self.testbed.get_stub('taskqueue')
+
+    def test_paths(self):
+        self.assertEqual(
+            ['/forest-change/forma-alerts/admin/bra',
+             '/forest-change/forma-alerts/admin/idn',
+             '/forest-change/forma-alerts/admin/bra/1',
+             '/forest-change/forma-alerts/admin/bra/2',
+             '/forest-change/forma-alerts/admin/idn/1'],
+            warm._paths('forma-alerts', ROWS))
+        self.assertEqual(
+            ['/forest-change/imazon-alerts/admin/bra',
+             '/forest-change/imazon-alerts/admin/bra/1',
+             '/forest-change/imazon-alerts/admin/bra/2'],
+            warm._paths('imazon-alerts', ROWS))
+
+    def test_warm(self):
+        self.setResponse(
+            content='{"rows":[%s]}' % ','.join(
+                '{"iso":"BRA","id_1":%s}' % i for i in range(150)),
+            status_code=200)
+        self.assertEqual(151, warm.warm('forma-alerts'))
+        tasks = self.taskqueue_stub.get_filtered_tasks(queue_names=warm.QUEUE)
+        self.assertEqual(151, len(tasks))
+        self.assertEqual('GET', tasks[0].method)
+
+    def test_enqueue(self):
+        warm.enqueue(['forma-alerts', 'quicc-alerts'])
+        tasks = self.taskqueue_stub.get_filtered_tasks(queue_names=warm.QUEUE)
+        self.assertEqual(2, len(tasks))
+        self.assertEqual('/forest-change/warm', tasks[0].url)
+
+if __name__ == '__main__':
+    unittest.main(exit=False)